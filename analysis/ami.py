@@ -1,7 +1,10 @@
+import hashlib
+import os
 from collections import defaultdict
-from itertools import combinations_with_replacement, starmap
+from itertools import combinations_with_replacement
+from multiprocessing import Pool
 from operator import attrgetter
-from typing import Sequence, List
+from typing import Sequence, List, Optional, Dict
 
 import numpy as np
 import pandas as pd
@@ -11,26 +14,130 @@ from hypergraph.network import Level, TreeNode, Tree
 
 Labels = List[int]
 
+AMI_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "hypergraph", "ami")
+
 
 def module_level(nodes: Sequence[TreeNode], level: Level = Level.LEAF_MODULE) -> Labels:
     return [node.level(level)
             for node in sorted(nodes, key=attrgetter("state_id"))]
 
 
-def ami(networks: Sequence[Tree], **kwargs) -> pd.DataFrame:
+def module_labels(tree: Tree, level: Level = Level.LEAF_MODULE) -> np.ndarray:
+    """Integer module labels ordered by state id, the same partition as module_level."""
+    columns = tree.columns
+    order = np.argsort(columns.state_id if columns.state_id is not None else columns.node_id, kind="stable")
+    return columns.module_ids(level)[order]
+
+
+def tree_hash(tree: Tree, labels: np.ndarray) -> str:
+    """
+    Hash of the module labels and the sorted state ids they belong to, see module_labels.
+
+    The labels are hashed instead of the tree file, since the tree may have been changed
+    after it was read, e.g. by match_ids.
+    """
+    columns = tree.columns
+    ids = np.sort(columns.state_id if columns.state_id is not None else columns.node_id)
+
+    sha = hashlib.sha256()
+    sha.update(np.ascontiguousarray(labels, dtype=np.int64).tobytes())
+    sha.update(np.ascontiguousarray(ids, dtype=np.int64).tobytes())
+
+    return sha.hexdigest()
+
+
+def _cache_filename(cache_dir: str, hash1: str, hash2: str, level: Level) -> str:
+    key = "-".join(sorted((hash1, hash2))) + f"-{level.name}"
+    return os.path.join(cache_dir, hashlib.sha256(key.encode()).hexdigest())
+
+
+def _read_cache(filename: str) -> Optional[float]:
+    try:
+        with open(filename) as fp:
+            return float(fp.read())
+    except (OSError, ValueError):
+        return None
+
+
+def _write_cache(filename: str, score: float):
+    tmpname = f"{filename}.{os.getpid()}.tmp"
+
+    with open(tmpname, "w") as fp:
+        fp.write(repr(score))
+
+    os.replace(tmpname, filename)
+
+
+_ami_labels: Optional[Dict[int, np.ndarray]] = None
+
+
+def _init_ami_worker(labels: Dict[int, np.ndarray]):
+    global _ami_labels
+    _ami_labels = labels
+
+
+def _ami_score(a: int, b: int) -> float:
+    return adjusted_mutual_info_score(_ami_labels[a], _ami_labels[b])
+
+
+def ami(networks: Sequence[Tree],
+        level: Level = Level.LEAF_MODULE,
+        num_workers: Optional[int] = None,
+        cache_dir: Optional[str] = AMI_CACHE_DIR) -> pd.DataFrame:
+    """
+    Pairwise adjusted mutual information between the partitions.
+
+    Pairs missing from the cache are computed in a pool of num_workers
+    processes (all cores if None). The scores are cached in cache_dir by the
+    hash of the module labels of the trees, see tree_hash, set cache_dir to None
+    to disable the cache.
+    """
     ami_ = np.zeros(shape=(len(networks),) * 2)
 
     index = defaultdict(lambda: len(index))
 
-    for network1, network2 in combinations_with_replacement(networks, 2):
+    labels = {k: module_labels(network, level) for k, network in enumerate(networks)}
+
+    pairs = []
+
+    for (a, network1), (b, network2) in combinations_with_replacement(enumerate(networks), 2):
         j = index[network1.pretty_filename]
         i = index[network2.pretty_filename]
 
-        labels1, labels2 = starmap(module_level, ((network1.nodes, kwargs), (network2.nodes, kwargs)))
-
-        if len(labels1) != len(labels2):
+        if len(labels[a]) != len(labels[b]):
             raise RuntimeWarning("Different sets of labels")
 
-        ami_[i, j] = adjusted_mutual_info_score(labels1, labels2)
+        pairs.append((i, j, a, b))
+
+    cache_filenames = {}
+
+    if cache_dir is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+
+        hashes = {k: tree_hash(network, labels[k]) for k, network in enumerate(networks)}
+
+        cache_filenames = {(a, b): _cache_filename(cache_dir, hashes[a], hashes[b], level)
+                           for _, _, a, b in pairs}
+
+    scores = {(a, b): _read_cache(cache_filenames[a, b]) if cache_filenames else None
+              for _, _, a, b in pairs}
+
+    missing = [pair for pair, score in scores.items() if score is None]
+
+    if len(missing) > 1 and num_workers != 1:
+        with Pool(num_workers, initializer=_init_ami_worker, initargs=(labels,)) as pool:
+            computed = pool.starmap(_ami_score, missing)
+    else:
+        _init_ami_worker(labels)
+        computed = [_ami_score(a, b) for a, b in missing]
+
+    for pair, score in zip(missing, computed):
+        scores[pair] = score
+
+        if cache_filenames:
+            _write_cache(cache_filenames[pair], score)
+
+    for i, j, a, b in pairs:
+        ami_[i, j] = scores[a, b]
 
     return pd.DataFrame(data=ami_, columns=list(index.keys()))
@@ -1,33 +1,33 @@
-import os
-import pickle
 from collections import defaultdict
 from statistics import mode, median, mean
 
 from hypergraph import representation
+from hypergraph.cache import Cache, cache_key
 from hypergraph.components import largest_connected_component
 from hypergraph.main import run_infomap
 from hypergraph.network import HyperGraph, remove_simple_hyperedges, Tree
 
+# Infomap parameters, set explicitly since the cached trees depend on them
+SEED = 123
+NUM_TRIALS = 20
+TELEPORTATION_PROBABILITY = 0.15
 
-def get_effective_assignments(hypergraph, self_links, similarity):
-    pickle_filename = f"multilayer{'_self_links' if self_links else ''}{'_similarity' if similarity else ''}.pickle"
-
-    if not os.path.isfile(pickle_filename):
 
+def get_effective_assignments(hypergraph, self_links, similarity, cache: Cache):
+    def cluster() -> Tree:
         multilayer = representation.multilayer(hypergraph, similarity_walk=similarity, self_links=self_links)
 
-        im = run_infomap(multilayer, directed=True, self_links=self_links)
+        im = run_infomap(multilayer, directed=True, self_links=self_links, seed=SEED, num_trials=NUM_TRIALS,
+                         teleportation_probability=TELEPORTATION_PROBABILITY)
 
-        tree = Tree.from_infomap(im)
+        return Tree.from_infomap(im)
 
-        effective_assignments = tree.effective_assignments
+    hypergraph_hash = hypergraph.content_hash
+    key = cache_key("tree", hypergraph_hash, representation="multilayer", similarity_walk=similarity,
+                    self_links=self_links, directed=True, seed=SEED, num_trials=NUM_TRIALS,
+                    teleportation_probability=TELEPORTATION_PROBABILITY)
 
-        with open(pickle_filename, "wb") as fp:
-            pickle.dump(effective_assignments, fp)
-    else:
-        with open(pickle_filename, "rb") as fp:
-            effective_assignments = pickle.load(fp)
-    return effective_assignments
+    return cache.get_or_compute(hypergraph_hash, key, cluster).effective_assignments
 
 
 def main(file):
@@ -53,9 +53,11 @@ def main(file):
 
     effective_assignments = defaultdict(list)
 
+    cache = Cache()
+
     for self_links in (True, False):
         for similarity in (False, True):
-            for name, assignments in get_effective_assignments(hypergraph, self_links, similarity).items():
+            for name, assignments in get_effective_assignments(hypergraph, self_links, similarity, cache).items():
                 effective_assignments[name].append(assignments)
 
     effective_assignments = {name: assignments for name, assignments in effective_assignments.items()
@@ -1,39 +1,50 @@
 import os
 from collections import defaultdict
-from itertools import takewhile, dropwhile
-from statistics import mean, variance
-from typing import Sequence
+from statistics import variance
+from typing import Sequence, Union
 
 import pandas as pd
 
-from hypergraph.network import Tree
+from hypergraph.network import Tree, strip_compression, find_file, RunMetadata, count_states_and_links, \
+    pretty_filename
 
 
-def summarize(networks: Sequence[Tree]) -> pd.DataFrame:
+def scan_metadata(network: Tree) -> RunMetadata:
+    """Summarize a run from the tree and the state network, for runs without a sidecar."""
+    states_filename = find_file(os.path.splitext(strip_compression(network.filename))[0] + "_states.net")
+
+    num_states, num_links = count_states_and_links(states_filename)
+
+    return RunMetadata.from_tree(network, num_states, num_links)
+
+
+def summarize(networks: Sequence[Union[Tree, str]]) -> pd.DataFrame:
+    """
+    Summarize runs given as trees or tree filenames.
+
+    Reads the sidecar written next to each tree by the pipeline, and only
+    parses the tree and scans the state network if the sidecar is missing.
+    """
     summary = defaultdict(list)
 
     for network in networks:
-        states_filename = os.path.splitext(network.filename)[0] + "_states.net"
-
-        with open(states_filename) as states_fp:
-            states_lines = states_fp.readlines()
-
-        num_states = len(list(takewhile(lambda line: not line.startswith("*Links"),
-                                        dropwhile(lambda line: not line.startswith("# stateId physicalId"),
-                                                  states_lines)))) - 1
-
-        num_links = len(list(dropwhile(lambda line: not line.startswith("*Links"), states_lines))) - 1
-
-        summary["network"].append(network.pretty_filename)
-        summary["num states"].append(num_states)
-        summary["num links"].append(num_links)
-        summary["levels"].append(network.levels)
-        summary["top modules"].append(network.num_top_modules)
-        summary["leaf modules"].append(network.num_leaf_modules)
-        summary["codelength"].append(network.codelength)
-        summary["variance"].append(variance(network.codelengths))
-        summary["completed in"].append(network.completed_in)
-        summary["mean assignments"].append(mean(network.assignments.values()))
-        summary["mean eff. assignments"].append(mean(network.effective_assignments.values()))
+        filename = network if isinstance(network, str) else network.filename
+
+        metadata = RunMetadata.read(filename)
+
+        if metadata is None:
+            metadata = scan_metadata(Tree.from_file(filename) if isinstance(network, str) else network)
+
+        summary["network"].append(pretty_filename(filename))
+        summary["num states"].append(metadata.num_states)
+        summary["num links"].append(metadata.num_links)
+        summary["levels"].append(metadata.levels)
+        summary["top modules"].append(metadata.num_top_modules)
+        summary["leaf modules"].append(metadata.num_leaf_modules)
+        summary["codelength"].append(metadata.codelength)
+        summary["variance"].append(variance(metadata.codelengths))
+        summary["completed in"].append(metadata.completed_in)
+        summary["mean assignments"].append(metadata.mean_assignments)
+        summary["mean eff. assignments"].append(metadata.mean_effective_assignments)
 
     return pd.DataFrame(data=summary)
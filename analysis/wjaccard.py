@@ -1,94 +1,131 @@
-import subprocess
-from collections import defaultdict, namedtuple
-from itertools import combinations_with_replacement, product
-from typing import Sequence, Dict, Tuple, Any, Iterable
+from collections import namedtuple
+from itertools import combinations_with_replacement
+from multiprocessing import Pool
+from typing import Sequence, Tuple, Union, Optional, List
 
 import numpy as np
 import pandas as pd
+from scipy.sparse import csr_matrix
 
-from hypergraph.network import TreeNode, Tree
+from hypergraph.network import TreeNode, Tree, TreeColumns
 
 
-def assignment_id(path: Tuple[int]) -> Iterable[int]:
-    assignment_id_ = defaultdict(lambda: len(assignment_id_))
+def assignment_ids(columns: TreeColumns) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Modules of every level each node is assigned to.
 
-    for i in range(1, len(path)):
-        yield assignment_id_[path[0:i]]
+    Returns the node indices and module ids of each assignment, where a
+    module is a path prefix path[0:i], for 1 <= i < len(path).
+    Module ids are unique across levels.
+    """
+    paths = columns.padded_paths()
+    depth = columns.depth
 
+    nodes, modules = [], []
+    prefix_ids = np.zeros(len(columns), dtype=np.int64)
+    num_modules = 0
 
-Partition = namedtuple("Partition", "assignments, cluster_sizes")
+    for level in range(paths.shape[1] - 1):
+        assigned = np.flatnonzero(depth > level + 1)
 
+        # the module on this level is the parent module id together with the path element
+        keys = prefix_ids[assigned] * (paths[assigned, level].max(initial=0) + 1) + paths[assigned, level]
+        _, prefix_ids[assigned] = np.unique(keys, return_inverse=True)
 
-def make_partition(nodes: Sequence[TreeNode]) -> Partition:
-    assignments = {node.state_id: tuple(assignment_id(node.path))
-                   for node in nodes}
+        nodes.append(assigned)
+        modules.append(prefix_ids[assigned] + num_modules)
+        num_modules += prefix_ids[assigned].max(initial=-1) + 1
 
-    cluster_sizes = defaultdict(int)
+    if len(nodes) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
 
-    for node in assignments:
-        for assignment in assignments[node]:
-            cluster_sizes[assignment] += 1
+    return np.concatenate(nodes), np.concatenate(modules)
 
-    return Partition(assignments, dict(cluster_sizes))
 
+Partition = namedtuple("Partition", "ids, assignments, cluster_sizes")
 
-def dict_iter_values(dict1: Dict[Any, Any], dict2: Dict[Any, Any]):
-    for key in dict1:
-        yield dict1[key], dict2[key]
 
+def make_partition(network: Union[Tree, Sequence[TreeNode]]) -> Partition:
+    """
+    Sparse node x module assignment matrix, with the nodes ordered by state id.
+    """
+    columns = network.columns if isinstance(network, Tree) else TreeColumns.from_nodes(network)
 
-def weighted_jaccard_distance(p1: Partition, p2: Partition) -> float:
-    intersections = defaultdict(int)
+    ids = columns.state_id if columns.state_id is not None else columns.node_id
+    order = np.argsort(ids, kind="stable")
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+
+    nodes, modules = assignment_ids(columns)
+
+    assignments = csr_matrix((np.ones(len(nodes), dtype=np.int64), (rank[nodes], modules)),
+                             shape=(len(columns), modules.max(initial=-1) + 1))
 
-    for assignments1, assignments2 in dict_iter_values(p1.assignments, p2.assignments):
-        for assignment1, assignment2 in product(assignments1, assignments2):
-            intersections[assignment1, assignment2] += 1
+    cluster_sizes = np.asarray(assignments.sum(axis=0)).ravel()
 
-    intersections = dict(intersections)
+    return Partition(ids[order], assignments, cluster_sizes)
+
+
+def weighted_jaccard_distance(p1: Partition, p2: Partition) -> float:
+    if not np.array_equal(p1.ids, p2.ids):
+        raise RuntimeWarning("Different sets of nodes")
 
-    max_similarities_1 = defaultdict(float)
-    max_similarities_2 = defaultdict(float)
+    # number of nodes in each pair of modules
+    intersections = (p1.assignments.T @ p2.assignments).tocoo()
 
-    for (assignment1, assignment2), intersection in intersections.items():
-        union = p1.cluster_sizes[assignment1] + p2.cluster_sizes[assignment2] - intersection
-        if union == 0:
-            continue
+    unions = p1.cluster_sizes[intersections.row] + p2.cluster_sizes[intersections.col] - intersections.data
 
-        similarity = intersection / union
+    similarity = csr_matrix((intersections.data / unions, (intersections.row, intersections.col)),
+                            shape=intersections.shape)
 
-        max_similarities_1[assignment1] = max(similarity, max_similarities_1[assignment1])
-        max_similarities_2[assignment2] = max(similarity, max_similarities_2[assignment2])
+    max_similarities_1 = similarity.max(axis=1).toarray().ravel()
+    max_similarities_2 = similarity.max(axis=0).toarray().ravel()
 
-    s1 = np.inner(*zip(*dict_iter_values(p1.cluster_sizes, max_similarities_1))) / sum(p1.cluster_sizes.values())
-    s2 = np.inner(*zip(*dict_iter_values(p2.cluster_sizes, max_similarities_2))) / sum(p2.cluster_sizes.values())
+    s1 = np.inner(p1.cluster_sizes, max_similarities_1) / p1.cluster_sizes.sum()
+    s2 = np.inner(p2.cluster_sizes, max_similarities_2) / p2.cluster_sizes.sum()
 
     return 1 - 0.5 * s1 - 0.5 * s2
 
 
-def wjaccard(filename1: str, filename2: str, cmd: str = "wjaccarddist") -> float:
-    result = subprocess.run([cmd, filename1, filename2], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+def wjaccard(filename1: str, filename2: str) -> float:
+    return weighted_jaccard_distance(make_partition(Tree.from_file(filename1)),
+                                     make_partition(Tree.from_file(filename2)))
 
-    try:
-        result.check_returncode()
-    except subprocess.CalledProcessError:
-        raise Exception(result.stderr.decode("utf-8"))
 
-    return float(result.stdout)
+_wjaccard_partitions: Optional[List[Partition]] = None
 
 
-def weighted_jaccard_dist(networks: Sequence[Tree]) -> pd.DataFrame:
+def _init_wjaccard_worker(partitions: List[Partition]):
+    global _wjaccard_partitions
+    _wjaccard_partitions = partitions
+
+
+def _wjaccard_similarity(a: int, b: int) -> float:
+    return 1 - weighted_jaccard_distance(_wjaccard_partitions[a], _wjaccard_partitions[b])
+
+
+def weighted_jaccard_dist(networks: Sequence[Tree], num_workers: Optional[int] = None) -> pd.DataFrame:
+    """
+    Pairwise weighted Jaccard similarity, computed in a pool of num_workers processes (all cores if None).
+    """
     dist = np.zeros(shape=(len(networks),) * 2)
 
     index = {network.pretty_filename: i
              for i, network in enumerate(networks)}
 
-    partitions = {index[network.pretty_filename]: make_partition(network.nodes)
-                  for network in networks}
+    partitions = [make_partition(network) for network in networks]
+
+    pairs = [(index[network2.pretty_filename], index[network1.pretty_filename])
+             for network1, network2 in combinations_with_replacement(networks, 2)]
 
-    for network1, network2 in combinations_with_replacement(networks, 2):
-        j = index[network1.pretty_filename]
-        i = index[network2.pretty_filename]
+    if len(pairs) > 1 and num_workers != 1:
+        with Pool(num_workers, initializer=_init_wjaccard_worker, initargs=(partitions,)) as pool:
+            similarities = pool.starmap(_wjaccard_similarity, pairs)
+    else:
+        _init_wjaccard_worker(partitions)
+        similarities = [_wjaccard_similarity(i, j) for i, j in pairs]
 
-        dist[i, j] = 1 - weighted_jaccard_distance(partitions[i], partitions[j])
+    for (i, j), similarity in zip(pairs, similarities):
+        dist[i, j] = similarity
 
     return pd.DataFrame(data=dist, columns=list(index.keys()))
@@ -0,0 +1,42 @@
+import sys
+from argparse import ArgumentParser
+
+from benchmarks.suite import SIZES, run_suite, write_report, read_report, compare
+from hypergraph.main import REPRESENTATIONS, representation_list
+
+if __name__ == "__main__":
+    parser = ArgumentParser(prog="benchmarks",
+                            description="Time and memory-profile reading, preprocessing, every representation, "
+                                        "tree parsing and the analysis functions on random hypergraphs.")
+
+    parser.add_argument("outfile", nargs="?", default="benchmarks.json", help="the JSON report")
+    parser.add_argument("--sizes", nargs="+", choices=list(SIZES), default=["small"],
+                        help="hypergraph sizes to benchmark")
+    parser.add_argument("--representations", type=representation_list, default=list(REPRESENTATIONS),
+                        help=f"comma separated list of representations, any of {', '.join(REPRESENTATIONS)}")
+    parser.add_argument("--repeat", type=int, default=3, help="number of timed runs of each benchmark")
+    parser.add_argument("--no-memory", action="store_true", help="do not measure memory with tracemalloc")
+    parser.add_argument("--outdir", help="directory to keep the Infomap trees in, a temporary directory if not set")
+    parser.add_argument("--compare", metavar="BASELINE",
+                        help="report of a previous version, exit with an error if a benchmark got slower")
+    parser.add_argument("--threshold", type=float, default=1.2,
+                        help="how many times slower than the baseline is a regression")
+    parser.add_argument("--min-time", type=float, default=0.05,
+                        help="do not compare benchmarks faster than this many seconds in the baseline")
+
+    args = parser.parse_args()
+
+    report = run_suite(args.sizes, args.representations, args.outdir, args.repeat, not args.no_memory)
+
+    write_report(report, args.outfile)
+
+    if args.compare:
+        regressions = compare(read_report(args.compare), report, args.threshold, args.min_time)
+
+        for size, name, ratio in regressions:
+            print(f"[benchmark] {size} {name} is {ratio:.2f} times slower than in {args.compare}")
+
+        if regressions:
+            sys.exit(1)
+
+        print(f"[benchmark] no regressions compared to {args.compare}")
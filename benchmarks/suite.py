@@ -0,0 +1,292 @@
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+from dataclasses import dataclass, asdict, field
+from io import StringIO
+from statistics import mean
+from typing import Callable, Dict, List, Optional, Sequence, Any, Tuple
+
+import numpy as np
+
+from analysis.ami import ami
+from analysis.stats import summarize
+from analysis.wjaccard import weighted_jaccard_dist
+from hypergraph.components import largest_connected_component
+from hypergraph.generate import Distribution, random_hypergraph
+from hypergraph.incremental import build_network
+from hypergraph.main import REPRESENTATIONS, run_infomap, network_counts, hypergraph_counts, output_filename
+from hypergraph.network import HyperGraph, Tree
+from hypergraph.profiling import Profiler
+from hypergraph.transition import TransitionModel
+
+# bump when the benchmarks change, results of different versions are not comparable
+BENCHMARK_VERSION = 1
+
+# representations clustered with Infomap to benchmark tree parsing and the analysis,
+# AMI and the weighted Jaccard similarity compare the unipartite trees, which have the same states
+TREE_REPRESENTATIONS = ("unipartite_directed", "unipartite_undirected", "multilayer")
+
+
+@dataclass(frozen=True)
+class Size:
+    num_nodes: int
+    num_edges: int
+    edge_size: Distribution
+    omega: Distribution = Distribution("uniform", (1.0, 3.0))
+    gamma: Distribution = Distribution("lognormal", (0.0, 0.5))
+
+    def hypergraph(self, seed: int = 0) -> HyperGraph:
+        return random_hypergraph(self.num_nodes, self.num_edges, self.edge_size, self.omega, self.gamma, seed)
+
+    def to_dict(self) -> Dict:
+        return dict(num_nodes=self.num_nodes,
+                    num_edges=self.num_edges,
+                    edge_size=str(self.edge_size),
+                    omega=str(self.omega),
+                    gamma=str(self.gamma))
+
+
+SIZES = {
+    "small": Size(1_000, 500, Distribution("poisson", (4.0,))),
+    "medium": Size(10_000, 5_000, Distribution("powerlaw", (2.5, 2.0, 200.0))),
+    # heavy tailed like the paleo data, with hyperedges of up to 1000 vertices
+    "large": Size(50_000, 25_000, Distribution("powerlaw", (2.5, 2.0, 1000.0))),
+}
+
+
+@dataclass
+class BenchmarkResult:
+    """
+    Best and mean wall time over the repeats, with the CPU time of the best repeat.
+
+    peak_traced is the peak Python allocations of one more run with tracemalloc,
+    rss_growth how much that run raised the peak resident set size of the process.
+    """
+    name: str
+    size: str
+    repeat: int
+    wall_time: float
+    mean_wall_time: float
+    cpu_time: float
+    peak_traced: Optional[int] = None
+    rss_growth: Optional[int] = None
+    counts: Dict[str, int] = field(default_factory=dict)
+
+
+def measure(name: str,
+            size: str,
+            func: Callable[[], Any],
+            count: Callable[[Any], Dict[str, int]] = lambda _: {},
+            repeat: int = 3) -> Tuple[BenchmarkResult, Any]:
+    """Time func over repeat runs, returns the result and the value of the last run."""
+    profiler = Profiler()
+
+    for _ in range(repeat):
+        with profiler.stage(name, size):
+            value = func()
+
+    best = min(profiler.stages, key=lambda stats: stats.wall_time)
+
+    result = BenchmarkResult(name, size, repeat,
+                             wall_time=best.wall_time,
+                             mean_wall_time=mean(stats.wall_time for stats in profiler.stages),
+                             cpu_time=best.cpu_time,
+                             counts=count(value))
+
+    print(f"[benchmark] {size} {name} {result.wall_time:.3f}s")
+
+    return result, value
+
+
+def measure_memory(result: BenchmarkResult, func: Callable[[], Any]):
+    """Measure the memory of one more run of func with tracemalloc, which is stopped again after the run."""
+    profiler = Profiler(trace_memory=True)
+
+    with profiler.stage(result.name, result.size) as stats:
+        func()
+
+    result.peak_traced = stats.peak_traced
+    result.rss_growth = stats.rss_growth
+
+
+def run_size(size_name: str,
+             size: Size,
+             representations: Sequence[str],
+             outdir: str,
+             repeat: int = 3,
+             trace_memory: bool = True) -> List[BenchmarkResult]:
+    """
+    Benchmark reading, preprocessing, every representation, Infomap, tree parsing and the analysis
+    functions on a random hypergraph of the size.
+
+    The trees of Infomap runs on the unipartite and multilayer representations are written to outdir.
+    Every benchmark is timed before the memory of any benchmark is measured, so that the timings
+    are not slowed down by tracemalloc.
+    """
+    results = []
+    benchmarks = []
+
+    def run(name: str, func: Callable[[], Any], count=lambda _: {}, repeat_: int = repeat) -> Any:
+        result, value = measure(name, size_name, func, count, repeat_)
+        results.append(result)
+        benchmarks.append((result, func))
+        return value
+
+    hypergraph = run("generate", lambda: size.hypergraph(), hypergraph_counts, repeat_=1)
+
+    fp = StringIO()
+    hypergraph.write(fp)
+    lines = fp.getvalue().splitlines(keepends=True)
+
+    run("from_iter", lambda: HyperGraph.from_iter(lines), hypergraph_counts)
+
+    run("largest_connected_component", lambda: largest_connected_component(hypergraph), hypergraph_counts)
+
+    model = run("transition_model", lambda: TransitionModel.from_hypergraph(hypergraph),
+                lambda model_: dict(nodes=len(model_.node_ids), edges=len(model_.edge_ids)))
+
+    # only the networks clustered below are kept
+    networks = {}
+
+    for name in representations:
+        network = run(f"representation:{name}",
+                      lambda options=REPRESENTATIONS[name]: build_network(hypergraph, model, **options),
+                      network_counts)
+
+        if name in TREE_REPRESENTATIONS:
+            networks[name] = network
+
+    tree_filenames = []
+
+    for name, network in networks.items():
+        # two trials, since summarize reports the variance of the codelengths
+        def infomap(name=name, network=network, options=REPRESENTATIONS[name]):
+            return run_infomap(network, f"{size_name}_{name}", outdir, num_trials=2,
+                               directed=not options.get("unipartite_undirected", False),
+                               self_links=options.get("self_links", False))
+
+        run(f"infomap:{name}", infomap,
+            lambda im: dict(states=im.num_nodes, links=im.num_links, top_modules=im.num_top_modules),
+            repeat_=1)
+
+        tree_filenames.append(os.path.join(outdir, output_filename(f"{size_name}_{name}") + ".ftree"))
+
+    tree_names = list(networks)
+    networks.clear()
+
+    if tree_filenames:
+        run_analysis(run, tree_names, tree_filenames)
+
+    if trace_memory:
+        for result, func in benchmarks:
+            measure_memory(result, func)
+
+    return results
+
+
+def run_analysis(run: Callable, tree_names: Sequence[str], tree_filenames: Sequence[str]):
+    """Benchmark tree parsing and the analysis functions on the trees of the Infomap runs, see run_size."""
+    trees = run("tree_parsing", lambda: [Tree.from_file(filename) for filename in tree_filenames],
+                lambda trees_: dict(trees=len(trees_), nodes=sum(len(tree.nodes) for tree in trees_)))
+
+    run("summarize", lambda: summarize(tree_filenames), lambda summary: dict(rows=len(summary)))
+
+    unipartite_trees = [tree for name, tree in zip(tree_names, trees) if name.startswith("unipartite")]
+
+    if len(unipartite_trees) > 1:
+        run("ami", lambda: ami(unipartite_trees, num_workers=1, cache_dir=None))
+        run("weighted_jaccard", lambda: weighted_jaccard_dist(unipartite_trees, num_workers=1))
+
+
+def environment() -> Dict[str, str]:
+    """The versions the benchmarks ran with."""
+    import infomap
+    import scipy
+
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ""
+
+    return dict(commit=commit,
+                python=platform.python_version(),
+                numpy=np.__version__,
+                scipy=scipy.__version__,
+                infomap=infomap.__version__,
+                machine=platform.machine(),
+                processor=platform.processor())
+
+
+def run_suite(sizes: Sequence[str] = ("small",),
+              representations: Sequence[str] = tuple(REPRESENTATIONS),
+              outdir: Optional[str] = None,
+              repeat: int = 3,
+              trace_memory: bool = True) -> Dict:
+    """Run the benchmarks of every size, returns the report written by write_report."""
+    results = []
+
+    if outdir is not None:
+        os.makedirs(outdir, exist_ok=True)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for size_name in sizes:
+            results.extend(run_size(size_name, SIZES[size_name], representations, outdir or tmpdir,
+                                    repeat, trace_memory))
+
+    return dict(version=BENCHMARK_VERSION,
+                date=time.strftime("%Y-%m-%dT%H:%M:%S"),
+                environment=environment(),
+                sizes={size_name: SIZES[size_name].to_dict() for size_name in sizes},
+                repeat=repeat,
+                results=[asdict(result) for result in results])
+
+
+def write_report(report: Dict, filename: str):
+    with open(filename, "w") as fp:
+        json.dump(report, fp, indent=2)
+
+    print(f"[benchmark] wrote {filename}")
+
+
+def read_report(filename: str) -> Dict:
+    with open(filename) as fp:
+        return json.load(fp)
+
+
+def compare(baseline: Dict,
+            report: Dict,
+            threshold: float = 1.2,
+            min_time: float = 0.05) -> List[Tuple[str, str, float]]:
+    """
+    Benchmarks at least threshold times slower than in the baseline, as (size, name, ratio).
+
+    Only benchmarks of the same size parameters are compared, and not those that took
+    less than min_time seconds in the baseline, since their timings are mostly noise.
+    """
+    if baseline.get("version") != report.get("version"):
+        raise ValueError(f"Benchmark version {baseline.get('version')} of the baseline "
+                         f"is not comparable to version {report.get('version')}")
+
+    same_sizes = {size_name for size_name, size in report["sizes"].items()
+                  if baseline["sizes"].get(size_name) == size}
+
+    baseline_times = {(result["size"], result["name"]): result["wall_time"] for result in baseline["results"]}
+
+    regressions = []
+
+    for result in report["results"]:
+        key = result["size"], result["name"]
+
+        if result["size"] not in same_sizes or baseline_times.get(key, 0) < max(min_time, 1e-9):
+            continue
+
+        ratio = result["wall_time"] / baseline_times[key]
+
+        if ratio >= threshold:
+            regressions.append((*key, ratio))
+
+    return regressions
@@ -0,0 +1,259 @@
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import tempfile
+from typing import Any, Callable, Iterable, List, Optional, Tuple
+
+import infomap
+
+DEFAULT_CACHE_DIR = os.environ.get("HYPERGRAPH_CACHE_DIR",
+                                   os.path.join(os.path.expanduser("~"), ".cache", "hypergraph", "results"))
+DEFAULT_CACHE_SIZE = 10 << 30
+
+# bump when the representations or the outputs change, to not reuse stale results
+CACHE_VERSION = 1
+
+_VALUE_FILENAME = "value.pickle"
+
+
+def cache_key(kind: str, hypergraph_hash: str, /, **params) -> str:
+    """
+    Key of a result computed from the hypergraph with the given parameters.
+
+    The parameters must be JSON serializable, or have a stable str.
+    The Infomap version is part of the key, since other versions may find other partitions.
+    """
+    params = json.dumps(params, sort_keys=True, default=str)
+    return hashlib.sha256(f"{CACHE_VERSION}\n{infomap.__version__}\n{kind}\n{hypergraph_hash}\n{params}"
+                          .encode()).hexdigest()
+
+
+class Cache:
+    """
+    Content-addressed cache of networks, trees and Infomap outputs.
+
+    Entries are directories grouped by the hash of the hypergraph they were
+    computed from, so that every result of a hypergraph can be invalidated at once:
+
+        directory/<hypergraph hash>/<key>/value.pickle
+        directory/<hypergraph hash>/<key>/<output files>
+
+    The modification time of an entry is updated when it is read, and the least
+    recently used entries are evicted when the cache grows beyond max_size bytes.
+    """
+
+    def __init__(self, directory: Optional[str] = None, max_size: int = DEFAULT_CACHE_SIZE):
+        self.directory = directory if directory is not None else DEFAULT_CACHE_DIR
+        self.max_size = max_size
+
+    def _entry(self, hypergraph_hash: str, key: str) -> str:
+        return os.path.join(self.directory, hypergraph_hash, key)
+
+    def _touch(self, entry: str) -> bool:
+        try:
+            os.utime(entry)
+            return True
+        except OSError:
+            return False
+
+    def _commit(self, hypergraph_hash: str, key: str, tmpdir: str):
+        entry = self._entry(hypergraph_hash, key)
+
+        try:
+            os.rename(tmpdir, entry)
+        except OSError:
+            # another process stored the same entry first
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+        self.evict()
+
+    def _mkdtemp(self, hypergraph_hash: str) -> str:
+        parent = os.path.join(self.directory, hypergraph_hash)
+        os.makedirs(parent, exist_ok=True)
+        return tempfile.mkdtemp(prefix=".tmp", dir=parent)
+
+    def get(self, hypergraph_hash: str, key: str) -> Optional[Any]:
+        entry = self._entry(hypergraph_hash, key)
+
+        try:
+            with open(os.path.join(entry, _VALUE_FILENAME), "rb") as fp:
+                value = pickle.load(fp)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+
+        self._touch(entry)
+        return value
+
+    def put(self, hypergraph_hash: str, key: str, value: Any):
+        tmpdir = self._mkdtemp(hypergraph_hash)
+
+        with open(os.path.join(tmpdir, _VALUE_FILENAME), "wb") as fp:
+            pickle.dump(value, fp, protocol=pickle.HIGHEST_PROTOCOL)
+
+        self._commit(hypergraph_hash, key, tmpdir)
+
+    def get_or_compute(self, hypergraph_hash: str, key: str, compute: Callable[[], Any]) -> Any:
+        value = self.get(hypergraph_hash, key)
+
+        if value is None:
+            value = compute()
+            self.put(hypergraph_hash, key, value)
+
+        return value
+
+    def get_files(self, hypergraph_hash: str, key: str, outdir: str) -> Optional[List[str]]:
+        """
+        Copy the files of the entry to outdir, or return None if there is no such entry.
+
+        The modification times are kept, so that the run metadata stays current.
+        """
+        entry = self._entry(hypergraph_hash, key)
+
+        try:
+            names = [name for name in os.listdir(entry) if name != _VALUE_FILENAME]
+        except OSError:
+            return None
+
+        self._touch(entry)
+
+        os.makedirs(outdir, exist_ok=True)
+
+        return [shutil.copy2(os.path.join(entry, name), os.path.join(outdir, name))
+                for name in names]
+
+    def put_files(self, hypergraph_hash: str, key: str, filenames: Iterable[str]):
+        tmpdir = self._mkdtemp(hypergraph_hash)
+
+        for filename in filenames:
+            shutil.copy2(filename, os.path.join(tmpdir, os.path.basename(filename)))
+
+        self._commit(hypergraph_hash, key, tmpdir)
+
+    def entries(self) -> List[Tuple[str, float, int]]:
+        """The path, last use and size in bytes of every entry."""
+        entries = []
+
+        if not os.path.isdir(self.directory):
+            return entries
+
+        for hypergraph_hash in os.listdir(self.directory):
+            parent = os.path.join(self.directory, hypergraph_hash)
+
+            if not os.path.isdir(parent):
+                continue
+
+            for key in os.listdir(parent):
+                if key.startswith(".tmp"):
+                    continue
+
+                entry = os.path.join(parent, key)
+
+                try:
+                    size = sum(os.path.getsize(os.path.join(entry, name)) for name in os.listdir(entry))
+                    entries.append((entry, os.path.getmtime(entry), size))
+                except OSError:
+                    continue
+
+        return entries
+
+    def size(self) -> int:
+        return sum(size for _, _, size in self.entries())
+
+    def evict(self) -> int:
+        """Remove the least recently used entries until the cache fits in max_size, returns the number removed."""
+        entries = sorted(self.entries(), key=lambda entry: entry[1])
+        total_size = sum(size for _, _, size in entries)
+        num_removed = 0
+
+        for entry, _, size in entries:
+            if total_size <= self.max_size:
+                break
+
+            shutil.rmtree(entry, ignore_errors=True)
+            total_size -= size
+            num_removed += 1
+
+        return num_removed
+
+    def invalidate(self, hypergraph_hash: Optional[str] = None, key: Optional[str] = None):
+        """
+        Remove the entry with key, every entry of the hypergraph if key is None,
+        or the whole cache if hypergraph_hash is None as well.
+        """
+        if hypergraph_hash is None:
+            target = self.directory
+        elif key is None:
+            target = os.path.join(self.directory, hypergraph_hash)
+        else:
+            target = self._entry(hypergraph_hash, key)
+
+        shutil.rmtree(target, ignore_errors=True)
+
+    def clear(self):
+        self.invalidate()
+
+
+def parse_size(value: str) -> int:
+    """Size in bytes from e.g. 500M or 10G."""
+    units = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30, "T": 1 << 40}
+    value = value.strip().upper().rstrip("B")
+
+    if value and value[-1] in units:
+        return int(float(value[:-1]) * units[value[-1]])
+
+    return int(value)
+
+
+def format_size(size: int) -> str:
+    for unit in ("B", "K", "M", "G"):
+        if size < 1 << 10:
+            return f"{size:.0f}{unit}" if unit == "B" else f"{size:.1f}{unit}"
+        size /= 1 << 10
+
+    return f"{size:.1f}T"
+
+
+def cache_main(argv):
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(prog="hypergraph cache",
+                            description="Inspect or invalidate the cache of networks and Infomap results.")
+
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help="the cache directory")
+
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser("info", help="show the number of entries and the size of the cache")
+    commands.add_parser("clear", help="remove every entry")
+
+    invalidate = commands.add_parser("invalidate", help="remove every entry computed from a hypergraph")
+    invalidate.add_argument("file", help="the hypergraph file, optionally compressed")
+    invalidate.add_argument("--largest-cc", action="store_true",
+                            help="the entries of the largest connected component")
+
+    evict = commands.add_parser("evict", help="remove the least recently used entries")
+    evict.add_argument("--max-size", type=parse_size, default=DEFAULT_CACHE_SIZE,
+                       help="size to shrink the cache to, e.g. 500M or 10G")
+
+    args = parser.parse_args(argv)
+
+    cache = Cache(args.cache_dir)
+
+    if args.command == "info":
+        entries = cache.entries()
+        print(f"[cache] {cache.directory}")
+        print(f"[cache] {len(entries)} entries, {format_size(sum(size for _, _, size in entries))}")
+    elif args.command == "clear":
+        cache.clear()
+        print(f"[cache] cleared {cache.directory}")
+    elif args.command == "invalidate":
+        from hypergraph.main import preprocess
+
+        hypergraph_hash = preprocess(args.file, args.largest_cc).content_hash
+        cache.invalidate(hypergraph_hash)
+        print(f"[cache] invalidated {hypergraph_hash}")
+    elif args.command == "evict":
+        cache.max_size = args.max_size
+        print(f"[cache] evicted {cache.evict()} entries")
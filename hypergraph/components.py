@@ -1,57 +1,75 @@
-from collections import defaultdict
-from itertools import combinations
+from collections import namedtuple
+from typing import List, Iterator, Tuple, Dict
 
 import numpy as np
+from scipy.sparse import csr_matrix, bmat
 from scipy.sparse.csgraph import connected_components
 
 from hypergraph.network import HyperGraph
 
+Component = namedtuple("Component", "size, node_ids")
 
-def unipartite_projection(hypergraph: HyperGraph):
-    adj = np.zeros(shape=(len(hypergraph.nodes),) * 2, dtype=int)
 
-    id_to_index_map = defaultdict(lambda: len(id_to_index_map))
+def incidence_matrix(hypergraph: HyperGraph) -> Tuple[csr_matrix, Dict[int, int]]:
+    """
+    Sparse node x edge incidence matrix.
 
-    for edge in hypergraph.edges:
-        for source, target in combinations(edge.nodes, 2):
-            source_id = id_to_index_map[source.id]
-            target_id = id_to_index_map[target.id]
-            adj[source_id, target_id] = 1
-            adj[target_id, source_id] = 1
+    Returns the matrix and the map from row index to node id.
+    """
+    node_ids = {node.id for node in hypergraph.nodes}
+    node_ids.update(node.id for edge in hypergraph.edges for node in edge.nodes)
 
-    index_to_id_map = {index: id_ for id_, index in id_to_index_map.items()}
+    index_to_id_map = dict(enumerate(sorted(node_ids)))
+    id_to_index_map = {id_: index for index, id_ in index_to_id_map.items()}
 
-    return adj, index_to_id_map
+    rows = [id_to_index_map[node.id] for edge in hypergraph.edges for node in edge.nodes]
+    cols = [i for i, edge in enumerate(hypergraph.edges) for _ in edge.nodes]
 
+    incidence = csr_matrix((np.ones(len(rows), dtype=int), (rows, cols)),
+                           shape=(len(index_to_id_map), len(hypergraph.edges)))
 
-def largest_connected_component(hypergraph: HyperGraph) -> HyperGraph:
-    adj, index_to_id_map = unipartite_projection(hypergraph)
-    n_components, labels = connected_components(adj, directed=False)
+    return incidence, index_to_id_map
 
-    if n_components == 1:
-        return hypergraph
 
-    label_counts = defaultdict(int)
+def find_components(hypergraph: HyperGraph) -> List[Component]:
+    """
+    Connected components of the vertices, largest first.
+
+    Components are found in the bipartite node-edge graph, so the cost is
+    linear in the number of vertex-edge incidences rather than quadratic
+    in the hyperedge sizes.
+    """
+    incidence, index_to_id_map = incidence_matrix(hypergraph)
+    num_nodes = incidence.shape[0]
+
+    adj = bmat([[None, incidence], [incidence.T, None]], format="csr")
+
+    _, labels = connected_components(adj, directed=False)
 
-    for label in labels:
-        label_counts[label] += 1
+    node_labels = labels[:num_nodes]
 
-    largest_label = max(label_counts, key=label_counts.get)
+    # node indices are ordered by id, so a stable sort keeps ids ascending within a component
+    order = np.argsort(node_labels, kind="stable")
+    _, starts, sizes = np.unique(node_labels[order], return_index=True, return_counts=True)
 
-    nodes_by_id = {node.id: node for node in hypergraph.nodes}
+    node_ids = np.array([index_to_id_map[index] for index in range(num_nodes)], dtype=int)
 
-    nodes = sorted(nodes_by_id[index_to_id_map[index]]
-                   for index, label in enumerate(labels)
-                   if label == largest_label)
+    components_ = [Component(int(size), node_ids[order[start:start + size]].tolist())
+                   for start, size in zip(starts, sizes)]
 
-    node_ids = {node.id for node in nodes}
+    return sorted(components_, key=lambda component: (-component.size, component.node_ids[0]))
 
-    edges = sorted(edge for edge in hypergraph.edges
-                   if any(node.id in node_ids for node in edge.nodes))
 
-    edge_ids = {edge.id for edge in edges}
+def components(hypergraph: HyperGraph) -> Iterator[HyperGraph]:
+    """Sub-hypergraphs of each connected component, largest first."""
+    for component in find_components(hypergraph):
+        yield hypergraph.node_subgraph(component.node_ids)
 
-    weights = sorted(weight for weight in hypergraph.weights
-                     if weight.edge in edge_ids and weight.node.id in node_ids)
 
-    return HyperGraph(nodes, edges, weights)
+def largest_connected_component(hypergraph: HyperGraph) -> HyperGraph:
+    components_ = find_components(hypergraph)
+
+    if len(components_) <= 1:
+        return hypergraph
+
+    return hypergraph.node_subgraph(components_[0].node_ids)
@@ -0,0 +1,135 @@
+from dataclasses import dataclass
+from typing import Tuple, Optional
+
+import numpy as np
+
+from hypergraph.network import HyperGraph, HyperEdge, Gamma, Node, open_file, write_binary
+
+DISTRIBUTIONS = {
+    # name -> parameter names
+    "constant": ("value",),
+    "uniform": ("low", "high"),
+    "poisson": ("mean",),
+    "lognormal": ("mu", "sigma"),
+    "powerlaw": ("exponent", "low", "high"),
+}
+
+
+@dataclass(frozen=True)
+class Distribution:
+    """
+    A distribution of edge sizes, omega or gamma, with the parameters of DISTRIBUTIONS.
+
+    powerlaw is a Pareto distribution with density ~ x^-exponent truncated to [low, high],
+    e.g. powerlaw:2.5:2:1000 for the heavy tailed edge sizes of the paleo data.
+    """
+    name: str = "constant"
+    params: Tuple[float, ...] = (1.0,)
+
+    def __post_init__(self):
+        if self.name not in DISTRIBUTIONS:
+            raise ValueError(f"Unknown distribution {self.name}, must be one of {', '.join(DISTRIBUTIONS)}")
+
+        if len(self.params) != len(DISTRIBUTIONS[self.name]):
+            raise ValueError(f"{self.name} takes the parameters {', '.join(DISTRIBUTIONS[self.name])}")
+
+    @classmethod
+    def parse(cls, value: str):  # -> Distribution
+        """From name:param:param..., e.g. poisson:3 or uniform:1:5."""
+        name, *params = value.split(":")
+        return cls(name, tuple(map(float, params)))
+
+    def __str__(self):
+        return ":".join((self.name, *(f"{param:g}" for param in self.params)))
+
+    def sample(self, rng: np.random.Generator, size: int) -> np.ndarray:
+        if self.name == "constant":
+            value, = self.params
+            return np.full(size, value, dtype=float)
+        elif self.name == "uniform":
+            low, high = self.params
+            return rng.uniform(low, high, size)
+        elif self.name == "poisson":
+            mean, = self.params
+            return rng.poisson(mean, size).astype(float)
+        elif self.name == "lognormal":
+            mu, sigma = self.params
+            return rng.lognormal(mu, sigma, size)
+
+        exponent, low, high = self.params
+
+        if exponent == 1:
+            return low * (high / low) ** rng.uniform(size=size)
+
+        # inverse of the truncated CDF
+        a = 1 - exponent
+        return (low ** a + rng.uniform(size=size) * (high ** a - low ** a)) ** (1 / a)
+
+
+def random_hypergraph(num_nodes: int,
+                      num_edges: int,
+                      edge_size: Distribution = Distribution("poisson", (3.0,)),
+                      omega: Distribution = Distribution(),
+                      gamma: Distribution = Distribution(),
+                      seed: Optional[int] = 0) -> HyperGraph:
+    """
+    Random hypergraph with num_edges hyperedges of vertices drawn uniformly from num_nodes vertices.
+
+    Edge sizes are rounded and clipped to [2, num_nodes]. Vertices in no hyperedge are left out,
+    as when reading a hypergraph, so the hypergraph may have less than num_nodes vertices.
+    """
+    rng = np.random.default_rng(seed)
+
+    sizes = np.clip(np.rint(edge_size.sample(rng, num_edges)), 2, num_nodes).astype(int)
+    omegas = omega.sample(rng, num_edges)
+    gammas = gamma.sample(rng, int(sizes.sum()))
+
+    members = [rng.choice(num_nodes, size, replace=False) + 1 for size in sizes]
+
+    used = np.unique(np.concatenate(members)) if num_edges > 0 else np.array([], dtype=int)
+    nodes = {node_id: Node(node_id, str(node_id)) for node_id in used.tolist()}
+
+    edges = [HyperEdge(edge_id, frozenset(nodes[node_id] for node_id in node_ids.tolist()), omega_)
+             for edge_id, (node_ids, omega_) in enumerate(zip(members, omegas.tolist()), start=1)]
+
+    weights = [Gamma(edge_id, nodes[node_id], gamma_)
+               for edge_id, node_ids, gammas_ in zip(range(1, num_edges + 1),
+                                                     members,
+                                                     np.split(gammas, np.cumsum(sizes)[:-1]))
+               for node_id, gamma_ in zip(node_ids.tolist(), gammas_.tolist())]
+
+    return HyperGraph(list(nodes.values()), edges, weights)
+
+
+def generate_main(argv):
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(prog="hypergraph generate",
+                            description="Generate a random hypergraph. Distributions are given as "
+                                        "name:param:..., any of " +
+                                        ", ".join(f"{name}:{':'.join(params)}"
+                                                  for name, params in DISTRIBUTIONS.items()))
+
+    parser.add_argument("outfile", help="the hypergraph file, binary if it ends with .hgb, "
+                                        "otherwise text, optionally compressed")
+    parser.add_argument("-n", "--num-nodes", type=int, default=1000)
+    parser.add_argument("-e", "--num-edges", type=int, default=1000)
+    parser.add_argument("--edge-size", type=Distribution.parse, default=Distribution("poisson", (3.0,)),
+                        help="distribution of the number of vertices in a hyperedge, e.g. powerlaw:2.5:2:1000")
+    parser.add_argument("--omega", type=Distribution.parse, default=Distribution(),
+                        help="distribution of the hyperedge weights")
+    parser.add_argument("--gamma", type=Distribution.parse, default=Distribution(),
+                        help="distribution of the edge-dependent vertex weights")
+    parser.add_argument("-s", "--seed", type=int, default=0, help="random seed")
+
+    args = parser.parse_args(argv)
+
+    hypergraph = random_hypergraph(args.num_nodes, args.num_edges, args.edge_size, args.omega, args.gamma, args.seed)
+
+    if args.outfile.endswith(".hgb"):
+        write_binary(hypergraph, args.outfile)
+    else:
+        with open_file(args.outfile, "w") as fp:
+            hypergraph.write(fp)
+
+    print(f"[generate] wrote {len(hypergraph.nodes)} nodes and {len(hypergraph.edges)} edges to {args.outfile}")
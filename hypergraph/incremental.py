@@ -0,0 +1,200 @@
+from dataclasses import dataclass, replace
+from typing import Dict, Optional, Tuple, Union
+
+import numpy as np
+from infomap import Infomap
+
+from hypergraph import representation
+from hypergraph.main import run_infomap, InfomapTrials
+from hypergraph.network import HyperGraph, HyperGraphDelta, Network, MultilayerNetwork, StateNetwork, \
+    BipartiteNetwork, Tree, Level, LinkArray
+from hypergraph.representation.multilayer import update_network as update_multilayer
+from hypergraph.representation.unipartite import update_network as update_unipartite
+from hypergraph.transition import TransitionModel
+
+
+def affected_nodes(model: TransitionModel, delta: HyperGraphDelta) -> np.ndarray:
+    """
+    Vertex ids whose outgoing links change with the delta.
+
+    Only d(v) and pi(v) of the vertices in changed hyperedges change, and the links from
+    a vertex u only depend on d(u), pi(u) and the hyperedges in E(u), or the similarities
+    between them. The affected vertices are the vertices of the changed hyperedges,
+    before and after the change.
+    """
+    changed = [model.edge_index[edge_id] for edge_id in delta.changed_edges if edge_id in model.edge_index]
+
+    node_ids = [model.node_ids[model.nodes_of(e)] for e in changed]
+    node_ids.append(np.array([node.id for edge in delta.edges for node in edge.nodes], dtype=int))
+
+    return np.unique(np.concatenate(node_ids)).astype(int)
+
+
+@dataclass
+class Representation:
+    """
+    A network representation of a hypergraph that is updated when the hypergraph changes.
+
+    The options are the representation flags of run_representation, e.g. multilayer=True, self_links=True.
+    Unipartite and multilayer networks are updated by recomputing only the links from the affected
+    vertices, in every layer for multilayer networks. Bipartite networks are rebuilt, since the
+    feature node ids follow the order of the hyperedges.
+
+    Apart from copying the arrays, an update of a unipartite or multilayer network costs
+    in proportion to the changed hyperedges and the links from the affected vertices.
+    """
+    hypergraph: HyperGraph
+    model: TransitionModel
+    network: Network
+    options: Dict[str, bool]
+    # the links of a unipartite or multilayer network as a LinkArray, kept for networks
+    # with lists of links as well, so that an update does not convert the lists back
+    links: Optional[LinkArray] = None
+
+    @classmethod
+    def create(cls, hypergraph: HyperGraph, columnar: bool = False, **options):  # -> Representation
+        model = TransitionModel.from_hypergraph(hypergraph)
+        options = dict(options, columnar=columnar)
+
+        # the indices HyperGraphDelta.apply finds the changed hyperedges with,
+        # every update carries them over to the changed hypergraph
+        _ = hypergraph.edges_by_id, hypergraph.weights_by_edge, hypergraph.edges_by_node
+
+        network, links = with_link_lists(build_network(hypergraph, model, **dict(options, columnar=True)), columnar)
+
+        return cls(hypergraph, model, network, options, links)
+
+    @property
+    def is_multilayer(self) -> bool:
+        return self.options.get("multilayer", False) or self.options.get("multilayer_similarity", False)
+
+    @property
+    def is_unipartite(self) -> bool:
+        return self.options.get("unipartite_directed", False) or self.options.get("unipartite_undirected", False)
+
+    def update(self, delta: HyperGraphDelta):  # -> Representation
+        hypergraph = delta.apply(self.hypergraph)
+
+        model = self.model.updated(delta.edges, delta.weights, delta.removed)
+
+        source_ids = affected_nodes(self.model, delta)
+
+        self_links = self.options.get("self_links", False)
+
+        network = replace(self.network, links=self.links) if self.links is not None else self.network
+
+        if self.is_multilayer:
+            network = update_multilayer(network, hypergraph, model, source_ids,
+                                        similarity_walk=self.options.get("multilayer_similarity", False),
+                                        self_links=self_links)
+        elif self.is_unipartite:
+            network = update_unipartite(network, hypergraph, model, source_ids,
+                                        directed=self.options.get("unipartite_directed", False),
+                                        self_links=self_links)
+        else:
+            network = build_network(hypergraph, model, **self.options)
+
+        network, links = with_link_lists(network, self.options.get("columnar", False))
+
+        return Representation(hypergraph, model, network, self.options, links)
+
+
+def with_link_lists(network: Network, columnar: bool) -> Tuple[Network, Optional[LinkArray]]:
+    """The network with lists of links unless columnar, and its links if they are a LinkArray."""
+    if not isinstance(network.links, LinkArray):
+        return network, None
+
+    if columnar:
+        return network, network.links
+
+    return replace(network, links=[link for chunk in network.links.chunks() for link in chunk]), network.links
+
+
+def build_network(hypergraph: HyperGraph,
+                  model: TransitionModel,
+                  multilayer=False,
+                  multilayer_similarity=False,
+                  bipartite=False,
+                  bipartite_non_backtracking=False,
+                  unipartite_undirected=False,
+                  unipartite_directed=False,
+                  self_links=False,
+                  columnar=False) -> Network:
+    if multilayer or multilayer_similarity:
+        return representation.multilayer(hypergraph, multilayer_similarity, self_links=self_links,
+                                         columnar=columnar, model=model)
+    elif bipartite or bipartite_non_backtracking:
+        return representation.bipartite(hypergraph, bipartite_non_backtracking, model)
+    elif unipartite_undirected or unipartite_directed:
+        return representation.unipartite(hypergraph, unipartite_directed, self_links, columnar, model)
+
+    raise ValueError("No representation given")
+
+
+def initial_partition(tree: Tree, network: Network, model: TransitionModel) -> Optional[Dict]:
+    """
+    Leaf modules of the previous tree as the initial partition of the updated network.
+
+    Multilayer networks are keyed by (layer id, node id), for the physical nodes still in the layer.
+    Returns None for state networks, since their state ids are not kept between the networks.
+    """
+    if isinstance(network, StateNetwork):
+        return None
+
+    columns = tree.columns
+    modules = columns.module_ids(Level.LEAF_MODULE)
+    node_ids = columns.node_id
+
+    if isinstance(network, MultilayerNetwork):
+        if columns.layer_id is None:
+            return None
+
+        layer_ids = columns.layer_id
+
+        known = np.isin(layer_ids, model.edge_ids) & np.isin(node_ids, model.node_ids)
+        layer_ids, node_ids, modules = layer_ids[known], node_ids[known], modules[known]
+
+        member = model.is_member(np.searchsorted(model.edge_ids, layer_ids),
+                                 np.searchsorted(model.node_ids, node_ids))
+
+        return dict(zip(zip(layer_ids[member].tolist(), node_ids[member].tolist()), modules[member].tolist()))
+
+    known = np.isin(node_ids, model.node_ids)
+
+    return dict(zip(node_ids[known].tolist(), modules[known].tolist()))
+
+
+def run_update(previous: Representation,
+               delta: HyperGraphDelta,
+               tree: Optional[Tree] = None,
+               basename: Optional[str] = None,
+               outdir: Optional[str] = None,
+               **kwargs) -> Tuple[Representation, Union[Infomap, InfomapTrials]]:
+    """
+    Update the representation with the delta and run Infomap on the updated network,
+    starting from the leaf modules of the tree of the previous run if given.
+
+    The keyword arguments are passed to run_infomap.
+    """
+    updated = previous.update(delta)
+
+    partition = initial_partition(tree, updated.network, updated.model) if tree is not None else None
+
+    if partition is not None:
+        print(f"[infomap] starting from {len(set(partition.values()))} modules")
+
+    args = kwargs.pop("args", None)
+
+    if isinstance(updated.network, BipartiteNetwork):
+        args = "--bipartite-teleportation"
+
+    im = run_infomap(updated.network,
+                     basename,
+                     outdir,
+                     args=args,
+                     directed=not updated.options.get("unipartite_undirected", False),
+                     self_links=updated.options.get("self_links", False),
+                     initial_partition=partition,
+                     **kwargs)
+
+    return updated, im
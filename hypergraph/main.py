@@ -1,16 +1,147 @@
+import os
+import shutil
+import tempfile
+from dataclasses import dataclass
+from multiprocessing import Pool
+from operator import attrgetter
 from os import path
-from typing import Optional
+from typing import Optional, Tuple, Callable, Union, Sequence, List, Dict
 
+import numpy as np
 from infomap import Infomap
 
 from hypergraph import representation
+from hypergraph.cache import Cache, cache_key, cache_main, parse_size, DEFAULT_CACHE_DIR, DEFAULT_CACHE_SIZE
 from hypergraph.components import largest_connected_component
-from hypergraph.network import HyperGraph, Network, remove_simple_hyperedges, Tree, StateNetwork
+from hypergraph.generate import generate_main
+from hypergraph.network import HyperGraph, Network, remove_simple_hyperedges, Tree, StateNetwork, read_hypergraph, \
+    convert, COMPRESSIONS, compressed_filename, compress_file, open_file, prepend_header, write_metadata, \
+    metadata_filename
+from hypergraph.profiling import Profiler, StageStats, DUMPS, stage, profiling, active_profiler
+from hypergraph.transition import TransitionModel
 
 _DEFAULT_SEED = 123
 _DEFAULT_TELEPORTATION_PROB = 0.15
 
 
+@dataclass
+class InfomapTrials:
+    """
+    Best result of Infomap trials run in parallel.
+
+    Has the same attributes as an Infomap instance that the callers of run_infomap use,
+    and the tree of the best trial if it was written, see Tree.from_infomap.
+    """
+    codelength: float
+    codelengths: Tuple[float, ...]
+    num_top_modules: int
+    num_leaf_modules: int
+    num_nodes: int
+    num_links: int
+    outdir: Optional[str] = None
+    tree: Optional[Tree] = None
+
+
+_trials_network: Optional[Network] = None
+_trials_initial_partition: Optional[Dict] = None
+
+
+def _init_trials_worker(network: Network, initial_partition: Optional[Dict] = None):
+    global _trials_network, _trials_initial_partition
+    _trials_network, _trials_initial_partition = network, initial_partition
+
+
+def _run_trials(args: str, outdir: Optional[str], filename: Optional[str]) -> InfomapTrials:
+    im = Infomap(args)
+    _trials_network.apply(im)
+    im.run(initial_partition=_trials_initial_partition)
+
+    tree = None
+
+    if filename is not None:
+        im.write_flow_tree(path.join(outdir, filename) + ".ftree", states=True)
+        tree = Tree.from_infomap(im, completed_in=im.elapsed_time)
+
+    return InfomapTrials(im.codelength, tuple(im.codelengths), im.num_top_modules, im.num_leaf_modules,
+                         im.num_nodes, im.num_links, outdir, tree)
+
+
+def run_parallel_trials(network: Network,
+                        args: Callable[[int, int, Optional[str]], str],
+                        num_trials: int,
+                        seed: int,
+                        num_workers: int,
+                        outdir: Optional[str] = None,
+                        filename: Optional[str] = None,
+                        initial_partition: Optional[Dict] = None) -> InfomapTrials:
+    """
+    Split the trials between a pool of workers, each with a seed derived from seed.
+
+    Every worker writes its output to a temporary directory in outdir,
+    the output of the worker with the lowest codelength is moved to outdir.
+    The temporary directories are removed even if a worker fails.
+    """
+    num_workers = min(num_workers, num_trials)
+    seeds = np.random.SeedSequence(seed).generate_state(num_workers).tolist()
+    trials = [num_trials // num_workers + (1 if i < num_trials % num_workers else 0)
+              for i in range(num_workers)]
+
+    tmpdirs: List[Optional[str]] = [None] * num_workers
+
+    try:
+        if outdir is not None:
+            os.makedirs(outdir, exist_ok=True)
+
+            for i in range(num_workers):
+                tmpdirs[i] = tempfile.mkdtemp(dir=outdir)
+
+        tasks = [(args(worker_trials, worker_seed, tmpdir), tmpdir, filename)
+                 for worker_trials, worker_seed, tmpdir in zip(trials, seeds, tmpdirs)]
+
+        with Pool(num_workers, initializer=_init_trials_worker, initargs=(network, initial_partition)) as pool:
+            results = pool.starmap(_run_trials, tasks)
+
+        best = min(results, key=attrgetter("codelength"))
+
+        if outdir is not None:
+            for name in os.listdir(best.outdir):
+                os.replace(path.join(best.outdir, name), path.join(outdir, name))
+    finally:
+        # also if a worker failed, the outputs of the other workers are not kept
+        for tmpdir in tmpdirs:
+            if tmpdir is not None:
+                shutil.rmtree(tmpdir, ignore_errors=True)
+
+    codelengths = tuple(codelength for result in results for codelength in result.codelengths)
+
+    if best.tree is not None:
+        best.tree.codelengths = codelengths
+
+    return InfomapTrials(best.codelength,
+                         codelengths,
+                         best.num_top_modules,
+                         best.num_leaf_modules,
+                         best.num_nodes,
+                         best.num_links,
+                         outdir,
+                         best.tree)
+
+
+def output_filename(basename: str, seed: int = _DEFAULT_SEED) -> str:
+    return basename + (f"_seed_{seed}" if seed != _DEFAULT_SEED else "")
+
+
+def output_files(outdir: str, filename: str, compression: Optional[str] = None) -> List[str]:
+    """The tree, state network and metadata files written by run_infomap that exist."""
+    tree_filename = compressed_filename(path.join(outdir, filename) + ".ftree", compression)
+
+    filenames = (tree_filename,
+                 compressed_filename(path.join(outdir, filename) + "_states.net", compression),
+                 metadata_filename(tree_filename))
+
+    return [filename for filename in filenames if path.exists(filename)]
+
+
 def run_infomap(network: Network,
                 basename: Optional[str] = None,
                 outdir: Optional[str] = None,
@@ -22,45 +153,85 @@ def run_infomap(network: Network,
                 output_states: bool = True,
                 seed: int = _DEFAULT_SEED,
                 num_trials: int = 20,
+                num_workers: int = 1,
                 silent: bool = True,
                 teleportation_probability: float = _DEFAULT_TELEPORTATION_PROB,
-                **_) -> Infomap:
-    default_args = f" --num-trials {num_trials if not no_infomap else 1}"
-    default_args += " --silent" if silent else ""
-    default_args += " --directed" if directed else ""
-    default_args += " --include-self-links" if self_links else ""
-    default_args += " --two-level" if two_level else ""
-    default_args += " --no-infomap" if no_infomap else ""
-    default_args += f" --seed {seed}"
-    default_args += f" --teleportation-probability {teleportation_probability}"
-
+                compression: Optional[str] = None,
+                initial_partition: Optional[Dict] = None,
+                **_) -> Union[Infomap, InfomapTrials]:
+    """
+    With num_workers > 1, the trials run in parallel and the best result is returned as InfomapTrials.
+
+    With an initial_partition, Infomap starts optimizing from it instead of from
+    every node in its own module, see incremental.initial_partition.
+
+    With compression, the .ftree and _states.net outputs are compressed after Infomap has written them.
+    A .json sidecar with a summary of the run is written next to the .ftree, see RunMetadata.
+    """
     filename = None
 
     if basename is not None:
-        filename = basename + (f"_seed_{seed}" if seed != _DEFAULT_SEED else "")
-        default_args += f" --out-name {filename} "
+        filename = output_filename(basename, seed)
+
+    def infomap_args(num_trials_: int, seed_: int, outdir_: Optional[str]) -> str:
+        default_args = f" --num-trials {num_trials_ if not no_infomap else 1}"
+        default_args += " --silent" if silent else ""
+        default_args += " --directed" if directed else ""
+        default_args += " --include-self-links" if self_links else ""
+        default_args += " --two-level" if two_level else ""
+        default_args += " --no-infomap" if no_infomap else ""
+        default_args += f" --seed {seed_}"
+        default_args += f" --teleportation-probability {teleportation_probability}"
+
+        if filename is not None:
+            default_args += f" --out-name {filename} "
 
-    if outdir is not None:
-        if output_states:
-            default_args += " -o states "
+        if outdir_ is not None:
+            if output_states:
+                default_args += " -o states "
 
-        default_args += outdir
+            default_args += outdir_
+
+        return (args if args else '') + default_args
 
     print("[infomap] running infomap...")
-    im = Infomap((args if args else '') + default_args)
-    network.apply(im)
-    im.run()
+
+    with stage("infomap", filename) as stats:
+        if num_workers > 1 and num_trials > 1 and not no_infomap:
+            im = run_parallel_trials(network, infomap_args, num_trials, seed, num_workers, outdir, filename,
+                                     initial_partition)
+        else:
+            im = Infomap(infomap_args(num_trials, seed, outdir))
+            network.apply(im)
+            im.run(initial_partition=initial_partition)
+
+            if filename is not None:
+                im.write_flow_tree(path.join(outdir, filename) + ".ftree", states=True)
+
+        stats.count(states=im.num_nodes,
+                    links=im.num_links,
+                    top_modules=im.num_top_modules,
+                    leaf_modules=im.num_leaf_modules)
 
     if filename is not None:
-        outname = path.join(outdir, filename) + ".ftree"
-        im.write_flow_tree(outname, states=True)
+        with stage("write", filename):
+            header = f"# codelengths {','.join(map(str, im.codelengths))}\n"
+            header += f"# num leaf modules {im.num_leaf_modules}\n"
 
-        with open(outname, "r") as fp:
-            original = fp.read()
-        with open(outname, "w") as fp:
-            fp.write(f"# codelengths {','.join(map(str, im.codelengths))}\n")
-            fp.write(f"# num leaf modules {im.num_leaf_modules}\n")
-            fp.write(original)
+            tree_filename = prepend_header(path.join(outdir, filename) + ".ftree", header, compression)
+
+            states_filename = path.join(outdir, filename) + "_states.net"
+
+            if output_states and path.exists(states_filename):
+                compress_file(states_filename, compression)
+
+            # the tree of the run, the file is not parsed again
+            if isinstance(im, InfomapTrials):
+                tree = im.tree
+            else:
+                tree = Tree.from_infomap(im, completed_in=im.elapsed_time)
+
+            write_metadata(tree_filename, im.num_nodes, im.num_links, tree)
 
     print(f"[infomap] codelength {im.codelength}")
     print(f"[infomap] num top modules {im.num_top_modules}")
@@ -81,29 +252,141 @@ def run(file,
         write_network=False,
         largest_cc=False,
         pre_cluster_multilayer=False,
+        columnar_links=False,
         **kwargs) -> Optional[Network]:
-    hypergraph = HyperGraph.from_iter(file.readlines())
+    hypergraph = preprocess(file, largest_cc)
+
+    with stage("transition"):
+        model = TransitionModel.from_hypergraph(hypergraph)
+
+    return run_representation(hypergraph,
+                              model=model,
+                              outdir=outdir,
+                              outfile=outfile,
+                              multilayer=multilayer,
+                              multilayer_similarity=multilayer_similarity,
+                              bipartite=bipartite,
+                              bipartite_non_backtracking=bipartite_non_backtracking,
+                              unipartite_undirected=unipartite_undirected,
+                              unipartite_directed=unipartite_directed,
+                              self_links=self_links,
+                              write_network=write_network,
+                              pre_cluster_multilayer=pre_cluster_multilayer,
+                              columnar_links=columnar_links,
+                              **kwargs)
+
+
+def preprocess(file, largest_cc=False) -> HyperGraph:
+    with stage("read") as stats:
+        hypergraph = read_hypergraph(file)
+        stats.count(**hypergraph_counts(hypergraph))
 
     if largest_cc:
-        hypergraph = largest_connected_component(hypergraph)
+        with stage("largest_cc") as stats:
+            hypergraph = largest_connected_component(hypergraph)
+            stats.count(**hypergraph_counts(hypergraph))
+
+    with stage("remove_simple_hyperedges") as stats:
+        hypergraph = remove_simple_hyperedges(hypergraph)
+        stats.count(**hypergraph_counts(hypergraph))
+
+    return hypergraph
+
 
-    hypergraph = remove_simple_hyperedges(hypergraph)
+def hypergraph_counts(hypergraph: HyperGraph) -> Dict[str, int]:
+    return dict(nodes=len(hypergraph.nodes), edges=len(hypergraph.edges))
 
+
+def network_counts(network: Network) -> Dict[str, int]:
+    """Number of nodes, features, states and links of the network, networks in files have none."""
+    return {name: len(getattr(network, name)) for name in ("nodes", "features", "states", "links")
+            if hasattr(network, name)}
+
+
+def cached_network(hypergraph: HyperGraph,
+                   build: Callable[[], Network],
+                   cache: Optional[Cache] = None,
+                   label: Optional[str] = None,
+                   **params) -> Network:
+    """
+    Build the network, or load it from the cache if it has been built before
+    from the same hypergraph with the same params.
+    """
+    with stage("network", label) as stats:
+        if cache is None:
+            network = build()
+        else:
+            hypergraph_hash = hypergraph.content_hash
+            network = cache.get_or_compute(hypergraph_hash, cache_key("network", hypergraph_hash, **params), build)
+
+        stats.count(**network_counts(network))
+
+    return network
+
+
+def run_representation(hypergraph: HyperGraph,
+                       outdir="output",
+                       outfile=None,
+                       multilayer=False,
+                       multilayer_similarity=False,
+                       bipartite=False,
+                       bipartite_non_backtracking=False,
+                       unipartite_undirected=False,
+                       unipartite_directed=False,
+                       self_links=False,
+                       write_network=False,
+                       pre_cluster_multilayer=False,
+                       columnar_links=False,
+                       stream_links=False,
+                       model: Optional[TransitionModel] = None,
+                       compression: Optional[str] = None,
+                       cache: Optional[Cache] = None,
+                       **kwargs) -> Optional[Network]:
+    """
+    With a cache, the network and the Infomap outputs are stored by the content hash of the hypergraph
+    and the parameters. When the same run has been done before, the outputs are copied from the cache
+    to outdir and Infomap is not run, and the network is only loaded from the cache if write_network is set,
+    otherwise None is returned. Runs with pre_cluster_multilayer are not cached.
+
+    With stream_links, multilayer links are streamed to outdir/basename.net and Infomap reads the file,
+    instead of keeping every link in memory. The file is kept if write_network is set.
+    """
     args = None
+    network = None
+    network_filename = None
+    network_cache = cache
 
     if multilayer or multilayer_similarity:
-        network = representation.multilayer(hypergraph, multilayer_similarity, self_links=self_links)
+        network_params = dict(representation="multilayer", similarity_walk=multilayer_similarity,
+                              self_links=self_links, columnar=columnar_links)
 
         basename = outfile if outfile else "multilayer"
         basename += "_similarity" if multilayer_similarity else ""
         basename += "_self_links" if self_links else ""
 
+        if stream_links:
+            # uncompressed, since Infomap reads the file
+            network_filename = path.join(outdir, basename + ".net")
+            os.makedirs(outdir, exist_ok=True)
+
+            # the links are not kept in memory, so there is nothing to cache
+            network_cache = None
+
+        def build_network():
+            return representation.multilayer(hypergraph, multilayer_similarity, self_links=self_links,
+                                             columnar=columnar_links, model=model, filename=network_filename)
+
         if pre_cluster_multilayer:
-            unipartite = representation.unipartite(hypergraph, directed=True, self_links=self_links)
+            network = cached_network(hypergraph, build_network, network_cache, basename, **network_params)
+
+            with stage("network", "multilayer_flattened") as stats:
+                unipartite = representation.unipartite(hypergraph, directed=True, self_links=self_links,
+                                                       columnar=columnar_links, model=model)
+                stats.count(**network_counts(unipartite))
 
             unipartite_basename = "multilayer_flattened"
 
-            # Optimize the unipartite projection
+            # Optimize the unipartite projection, uncompressed since Infomap reads it as cluster data
             run_infomap(unipartite, unipartite_basename, path.join(outdir, "multilayer"), self_links=self_links,
                         output_states=False, **kwargs)
 
@@ -111,26 +394,37 @@ def run(file,
 
             # Run infomap without optimizing to get the tree and state network
             run_infomap(network, basename, outdir, self_links=self_links, output_states=True,
-                        args="--no-infomap", num_trials=1, **kwargs)
+                        args="--no-infomap", num_trials=1, compression=compression, **kwargs)
 
-            multilayer_tree = Tree.from_file(path.join(outdir, basename + ".ftree"))
+            multilayer_tree = Tree.from_file(compressed_filename(path.join(outdir, basename + ".ftree"),
+                                                                 compression))
             multilayer_tree.match_ids((unipartite_tree,))
 
             unipartite_tree.write()
             args = f"--cluster-data {unipartite_tree.filename} -F"
 
-            network = StateNetwork.from_file(path.join(outdir, basename + "_states.net"))
+            with stage("read_states", basename) as stats:
+                network = StateNetwork.from_file(compressed_filename(path.join(outdir, basename + "_states.net"),
+                                                                     compression))
+                stats.count(**network_counts(network))
 
     elif bipartite or bipartite_non_backtracking:
         args = "--bipartite-teleportation"
 
-        network = representation.bipartite(hypergraph, bipartite_non_backtracking)
+        network_params = dict(representation="bipartite", non_backtracking=bipartite_non_backtracking)
+
+        def build_network():
+            return representation.bipartite(hypergraph, bipartite_non_backtracking, model)
 
         basename = outfile if outfile else "bipartite"
         basename += "_non_backtracking" if bipartite_non_backtracking else ""
 
     elif unipartite_undirected or unipartite_directed:
-        network = representation.unipartite(hypergraph, unipartite_directed, self_links)
+        network_params = dict(representation="unipartite", directed=unipartite_directed,
+                              self_links=self_links, columnar=columnar_links)
+
+        def build_network():
+            return representation.unipartite(hypergraph, unipartite_directed, self_links, columnar_links, model)
 
         basename = outfile if outfile else "unipartite"
         basename += "_directed" if unipartite_directed else "_undirected"
@@ -139,10 +433,38 @@ def run(file,
     else:
         return
 
-    if write_network:
-        network_filename = path.join(outdir, basename) + ".net"
-        with open(network_filename, "w") as fp:
-            network.write(fp)
+    run_key = None
+
+    if cache is not None and not pre_cluster_multilayer:
+        hypergraph_hash = hypergraph.content_hash
+
+        run_key = cache_key("infomap", hypergraph_hash,
+                            network=network_params,
+                            basename=basename,
+                            infomap=dict(kwargs, args=args, directed=not unipartite_undirected,
+                                         self_links=self_links, compression=compression))
+
+        if cache.get_files(hypergraph_hash, run_key, outdir) is not None:
+            print(f"[cache] using cached result for {basename}")
+
+            # the outputs are all there is to do, unless the network is written
+            if not write_network:
+                return None
+
+            network = cached_network(hypergraph, build_network, network_cache, basename, **network_params)
+
+            if network_filename is not None:
+                compress_file(network_filename, compression)
+            else:
+                write_network_file(network, outdir, basename, compression)
+
+            return network
+
+    if network is None:
+        network = cached_network(hypergraph, build_network, network_cache, basename, **network_params)
+
+    if write_network and network_filename is None:
+        write_network_file(network, outdir, basename, compression)
 
     run_infomap(network,
                 basename,
@@ -150,16 +472,149 @@ def run(file,
                 args=args,
                 directed=not unipartite_undirected,
                 self_links=self_links,
+                compression=compression,
                 **kwargs)
 
+    if run_key is not None:
+        filename = output_filename(basename, kwargs.get("seed", _DEFAULT_SEED))
+        cache.put_files(hypergraph_hash, run_key, output_files(outdir, filename, compression))
+
+    if network_filename is not None:
+        if write_network:
+            compress_file(network_filename, compression)
+        else:
+            os.remove(network_filename)
+
     return network
 
 
+def write_network_file(network: Network, outdir: str, basename: str, compression: Optional[str] = None):
+    network_filename = compressed_filename(path.join(outdir, basename) + ".net", compression)
+
+    with stage("write_network", basename), open_file(network_filename, "w") as fp:
+        network.write(fp)
+
+
+REPRESENTATIONS = {
+    "bipartite": dict(bipartite=True),
+    "bipartite_non_backtracking": dict(bipartite_non_backtracking=True),
+    "unipartite_undirected": dict(unipartite_undirected=True, self_links=False),
+    "unipartite_undirected_self_links": dict(unipartite_undirected=True, self_links=True),
+    "unipartite_directed": dict(unipartite_directed=True, self_links=False),
+    "unipartite_directed_self_links": dict(unipartite_directed=True, self_links=True),
+    "multilayer": dict(multilayer=True, self_links=False),
+    "multilayer_self_links": dict(multilayer=True, self_links=True),
+    "multilayer_similarity": dict(multilayer_similarity=True, self_links=False),
+    "multilayer_similarity_self_links": dict(multilayer_similarity=True, self_links=True),
+}
+
+_REPRESENTATION_FLAGS = ("multilayer", "multilayer_similarity", "bipartite", "bipartite_non_backtracking",
+                         "unipartite_undirected", "unipartite_directed", "self_links")
+
+_batch_hypergraph: Optional[HyperGraph] = None
+_batch_model: Optional[TransitionModel] = None
+_batch_profiler_options: Optional[Dict] = None
+
+
+def _init_batch_worker(hypergraph: HyperGraph, model: TransitionModel, profiler_options: Optional[Dict] = None):
+    global _batch_hypergraph, _batch_model, _batch_profiler_options
+    _batch_hypergraph, _batch_model, _batch_profiler_options = hypergraph, model, profiler_options
+
+
+def _run_batch_task(kwargs) -> Optional[List[StageStats]]:
+    """Returns the stages of the run to the profiler of the parent process, if it has one."""
+    profiler = Profiler(**_batch_profiler_options) if _batch_profiler_options is not None else None
+
+    with profiling(profiler):
+        run_representation(_batch_hypergraph, model=_batch_model, **kwargs)
+
+    return profiler.stages if profiler is not None else None
+
+
+def run_batch(file,
+              representations: Sequence[str],
+              largest_cc=False,
+              num_jobs: int = 1,
+              **kwargs) -> None:
+    """
+    Run several representations of the same hypergraph in one process.
+
+    The hypergraph is read and preprocessed once and the transition model is shared between the representations.
+    With num_jobs > 1, the representations are built and clustered concurrently in a process pool.
+    Output file names are the same as when running each representation separately.
+    """
+    hypergraph = preprocess(file, largest_cc)
+
+    with stage("transition"):
+        model = TransitionModel.from_hypergraph(hypergraph)
+
+    for flag in _REPRESENTATION_FLAGS:
+        kwargs.pop(flag, None)
+
+    tasks = [dict(kwargs, **REPRESENTATIONS[name]) for name in representations]
+
+    if num_jobs > 1:
+        # pool workers can not start their own pools
+        for task in tasks:
+            task["num_workers"] = 1
+
+        profiler = active_profiler()
+        profiler_options = profiler.options if profiler is not None else None
+
+        with Pool(num_jobs, initializer=_init_batch_worker, initargs=(hypergraph, model, profiler_options)) as pool:
+            for stages in pool.map(_run_batch_task, tasks, chunksize=1):
+                if profiler is not None:
+                    profiler.stages.extend(stages)
+    else:
+        for task in tasks:
+            run_representation(hypergraph, model=model, **task)
+
+
+def convert_main(argv):
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(prog="hypergraph convert",
+                            description="Convert a hypergraph from the text format to the binary format, "
+                                        "or from binary to text. The input format is detected from the file.")
+
+    parser.add_argument("infile", help="the hypergraph file")
+    parser.add_argument("outfile", help="the converted hypergraph file")
+
+    args = parser.parse_args(argv)
+
+    convert(args.infile, args.outfile)
+
+
+def representation_list(value: str) -> List[str]:
+    from argparse import ArgumentTypeError
+
+    names = [name.strip() for name in value.split(",") if name.strip()]
+
+    unknown = [name for name in names if name not in REPRESENTATIONS]
+
+    if unknown:
+        raise ArgumentTypeError(f"unknown representations: {', '.join(unknown)}")
+
+    return names
+
+
 def main():
-    from argparse import ArgumentParser, FileType, RawDescriptionHelpFormatter
+    from argparse import ArgumentParser, RawDescriptionHelpFormatter
     from textwrap import dedent
     import sys
 
+    if len(sys.argv) > 1 and sys.argv[1] == "convert":
+        convert_main(sys.argv[2:])
+        return
+
+    if len(sys.argv) > 1 and sys.argv[1] == "cache":
+        cache_main(sys.argv[2:])
+        return
+
+    if len(sys.argv) > 1 and sys.argv[1] == "generate":
+        generate_main(sys.argv[2:])
+        return
+
     description = dedent("""
     Create maps from hypergraps with edge-dependent vertex weights.
 
@@ -170,6 +625,18 @@ def main():
     representation and outputs the result in "outdir".
 
     For hypergraph input format, see: data/example.txt
+    Hypergraphs in the binary format are detected automatically,
+    text files may be compressed (.gz, .zst).
+
+    To convert between the text and binary formats, run:
+        python -m hypergraph convert infile outfile
+
+    Networks and results are cached by the content of the hypergraph
+    and the parameters, to inspect or invalidate the cache, run:
+        python -m hypergraph cache {info,clear,invalidate,evict}
+
+    To generate a random hypergraph, run:
+        python -m hypergraph generate outfile
     """)
 
     # noinspection PyTypeChecker
@@ -177,7 +644,7 @@ def main():
                             description=description,
                             formatter_class=RawDescriptionHelpFormatter)
 
-    parser.add_argument("file", type=FileType("r"), default=sys.stdin, help="the hypergraph file")
+    parser.add_argument("file", help="the hypergraph file, optionally compressed")
     parser.add_argument("outdir", nargs="?", default="output", help="directory to write output to")
 
     parser.add_argument("--largest-cc", action="store_true",
@@ -189,10 +656,32 @@ def main():
                         help="only search for two-level partitions")
     parser.add_argument("--no-infomap", action="store_true", help="do not run Infomap")
     parser.add_argument("--num-trials", default=20, type=int, help="number of times to run Infomap")
+    parser.add_argument("-j", "--num-workers", default=1, type=int,
+                        help="number of processes to split the Infomap trials between")
     parser.add_argument("-s", "--seed", default=_DEFAULT_SEED, type=int, help="random seed")
     parser.add_argument("-p", "--teleportation-probability", default=_DEFAULT_TELEPORTATION_PROB,
                         type=float, help="probability to teleport in each step")
     parser.add_argument("-o", "--outfile")
+    parser.add_argument("--columnar-links", action="store_true",
+                        help="store links in NumPy arrays to save memory (unipartite and multilayer)")
+    parser.add_argument("--stream-links", action="store_true",
+                        help="stream multilayer links to the network file instead of keeping them in memory")
+    parser.add_argument("-z", "--compression", choices=list(COMPRESSIONS),
+                        help="compress the network, .ftree and _states.net outputs")
+
+    profile = parser.add_argument_group("profile")
+    profile.add_argument("--profile", action="store_true",
+                         help="write the time, memory and item counts of every stage to profile.json in outdir")
+    profile.add_argument("--profile-memory", action="store_true",
+                         help="with --profile, record the peak Python allocations of every stage with tracemalloc (slower)")
+    profile.add_argument("--profile-dump", choices=DUMPS,
+                         help="with --profile, profile every stage with cProfile or pyinstrument, written to outdir/profile")
+
+    caching = parser.add_argument_group("cache")
+    caching.add_argument("--no-cache", action="store_true", help="do not read or write the result cache")
+    caching.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help="directory of the result cache")
+    caching.add_argument("--cache-size", default=DEFAULT_CACHE_SIZE, type=parse_size,
+                         help="evict the least recently used results above this size, e.g. 500M or 10G")
 
     output = parser.add_argument_group("representation")
     options = output.add_mutually_exclusive_group(required=True)
@@ -202,10 +691,41 @@ def main():
     options.add_argument("-B", "--bipartite-non-backtracking", action="store_true")
     options.add_argument("-u", "--unipartite-undirected", action="store_true")
     options.add_argument("-U", "--unipartite-directed", action="store_true")
+    options.add_argument("--representations", type=representation_list,
+                         help=f"comma separated list of representations to run in one process, "
+                              f"any of {', '.join(REPRESENTATIONS)}")
+    options.add_argument("--all", action="store_true", help="run all representations in one process")
+
+    batch = parser.add_argument_group("batch")
+    batch.add_argument("--num-jobs", default=1, type=int,
+                       help="number of representations to run concurrently with --representations or --all")
+
+    args = vars(parser.parse_args())
+
+    cache_dir, cache_size = args.pop("cache_dir"), args.pop("cache_size")
+    args["cache"] = Cache(cache_dir, cache_size) if not args.pop("no_cache") else None
+
+    profiler = None
+    profile_memory, profile_dump = args.pop("profile_memory"), args.pop("profile_dump")
+
+    if args.pop("profile") or profile_memory or profile_dump:
+        profiler = Profiler(profile_memory, profile_dump, dump_dir=path.join(args["outdir"], "profile"))
+
+    representations = args.pop("representations")
+
+    if args.pop("all"):
+        representations = list(REPRESENTATIONS)
 
-    args = parser.parse_args()
+    with profiling(profiler):
+        if representations:
+            run_batch(representations=representations, **args)
+        else:
+            args.pop("num_jobs")
+            run(**args)
 
-    run(**vars(args))
+    if profiler is not None:
+        os.makedirs(args["outdir"], exist_ok=True)
+        profiler.write(path.join(args["outdir"], (args["outfile"] + "_" if args["outfile"] else "") + "profile.json"))
 
 
 if __name__ == "__main__":
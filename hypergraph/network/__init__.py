@@ -1,3 +1,6 @@
+from .binary import *
+from .compression import *
 from .hypergraph import *
 from .network import *
 from .tree import *
+from .metadata import *
@@ -0,0 +1,148 @@
+import os
+import struct
+from typing import BinaryIO, TextIO, Union
+
+import numpy as np
+
+from .compression import open_file
+from .hypergraph import HyperGraph, HyperEdge, Gamma
+from .network import Node
+
+BINARY_MAGIC = b"HYPERGB\x01"
+
+# num nodes, num edges, num edge members, num weights, num name bytes
+_HEADER = struct.Struct("<8s5q")
+
+
+def is_binary(filename: str) -> bool:
+    if not os.path.isfile(filename):
+        return False
+
+    with open(filename, "rb") as fp:
+        return fp.read(len(BINARY_MAGIC)) == BINARY_MAGIC
+
+
+def _write_array(fp: BinaryIO, array: np.ndarray):
+    fp.write(np.ascontiguousarray(array).tobytes())
+
+
+def _padding(num_bytes: int) -> int:
+    return -num_bytes % 8
+
+
+def write_binary(hypergraph: HyperGraph, filename: str):
+    """
+    Format (little endian, every section 8 byte aligned):
+
+        header      magic, num nodes, num edges, num edge members, num weights, num name bytes
+        int64       node ids
+        int64       name offsets (num nodes + 1)
+        bytes       utf-8 names
+        int64       edge ids
+        int64       edge offsets (num edges + 1)
+        int64       edge member node ids
+        float64     omega
+        int64       weight edge ids
+        int64       weight node ids
+        float64     gamma
+    """
+    nodes, edges, weights = hypergraph
+
+    names = [node.name.encode("utf-8") for node in nodes]
+    name_offsets = np.cumsum([0] + [len(name) for name in names], dtype=np.int64)
+    names = b"".join(names)
+
+    members = [sorted(node.id for node in edge.nodes) for edge in edges]
+    edge_offsets = np.cumsum([0] + [len(edge_members) for edge_members in members], dtype=np.int64)
+    members = np.array([node_id for edge_members in members for node_id in edge_members], dtype=np.int64)
+
+    with open(filename, "wb") as fp:
+        fp.write(_HEADER.pack(BINARY_MAGIC, len(nodes), len(edges), len(members), len(weights), len(names)))
+
+        _write_array(fp, np.array([node.id for node in nodes], dtype=np.int64))
+        _write_array(fp, name_offsets)
+        fp.write(names + b"\0" * _padding(len(names)))
+
+        _write_array(fp, np.array([edge.id for edge in edges], dtype=np.int64))
+        _write_array(fp, edge_offsets)
+        _write_array(fp, members)
+        _write_array(fp, np.array([edge.omega for edge in edges], dtype=np.float64))
+
+        _write_array(fp, np.array([weight.edge for weight in weights], dtype=np.int64))
+        _write_array(fp, np.array([weight.node.id for weight in weights], dtype=np.int64))
+        _write_array(fp, np.array([weight.gamma for weight in weights], dtype=np.float64))
+
+
+def read_binary(filename: str) -> HyperGraph:
+    data = np.memmap(filename, dtype=np.uint8, mode="r")
+
+    magic, num_nodes, num_edges, num_members, num_weights, num_name_bytes = \
+        _HEADER.unpack(data[:_HEADER.size].tobytes())
+
+    if magic != BINARY_MAGIC:
+        raise RuntimeError(f"{filename} is not a binary hypergraph")
+
+    offset = _HEADER.size
+
+    def take(dtype, count: int) -> np.ndarray:
+        nonlocal offset
+        array = data[offset:offset + count * 8].view(dtype)
+        offset += count * 8
+        return array
+
+    node_ids = take(np.int64, num_nodes).tolist()
+    name_offsets = take(np.int64, num_nodes + 1).tolist()
+
+    names = data[offset:offset + num_name_bytes].tobytes()
+    offset += num_name_bytes + _padding(num_name_bytes)
+
+    edge_ids = take(np.int64, num_edges).tolist()
+    edge_offsets = take(np.int64, num_edges + 1).tolist()
+    members = take(np.int64, num_members).tolist()
+    omegas = take(np.float64, num_edges).tolist()
+
+    weight_edges = take(np.int64, num_weights).tolist()
+    weight_nodes = take(np.int64, num_weights).tolist()
+    gammas = take(np.float64, num_weights).tolist()
+
+    nodes = [Node(node_id, names[start:end].decode("utf-8"))
+             for node_id, start, end in zip(node_ids, name_offsets, name_offsets[1:])]
+
+    nodes_by_id = {node.id: node for node in nodes}
+
+    edges = [HyperEdge(edge_id, frozenset(nodes_by_id[node_id] for node_id in members[start:end]), omega)
+             for edge_id, start, end, omega in zip(edge_ids, edge_offsets, edge_offsets[1:], omegas)]
+
+    weights = [Gamma(edge, nodes_by_id[node_id], gamma)
+               for edge, node_id, gamma in zip(weight_edges, weight_nodes, gammas)]
+
+    return HyperGraph(nodes, edges, weights)
+
+
+def read_hypergraph(file: Union[str, TextIO]) -> HyperGraph:
+    """
+    Read a hypergraph in either the text or the binary format from a filename or an open file.
+
+    Text files may be compressed, see open_file.
+    """
+    filename = file if isinstance(file, str) else getattr(file, "name", None)
+
+    if isinstance(filename, str) and is_binary(filename):
+        return read_binary(filename)
+
+    if isinstance(file, str):
+        with open_file(file) as fp:
+            return HyperGraph.from_iter(fp.readlines())
+
+    return HyperGraph.from_iter(file.readlines())
+
+
+def convert(infile: str, outfile: str):
+    """Convert a hypergraph from text to binary, or from binary to (optionally compressed) text."""
+    hypergraph = read_hypergraph(infile)
+
+    if is_binary(infile):
+        with open_file(outfile, "w") as fp:
+            hypergraph.write(fp)
+    else:
+        write_binary(hypergraph, outfile)
@@ -0,0 +1,118 @@
+import gzip
+import io
+import os
+import shutil
+from itertools import islice
+from typing import IO, Iterable, Optional
+
+BUFFER_SIZE = 1 << 20
+LINE_CHUNK_SIZE = 1 << 14
+
+GZIP_LEVEL = 6
+
+# compression name -> filename suffix
+COMPRESSIONS = {
+    "gz": ".gz",
+    "zst": ".zst",
+}
+
+
+def compression_suffix(filename: str) -> Optional[str]:
+    return next((suffix for suffix in COMPRESSIONS.values() if filename.endswith(suffix)), None)
+
+
+def strip_compression(filename: str) -> str:
+    suffix = compression_suffix(filename)
+    return filename[:-len(suffix)] if suffix else filename
+
+
+def compressed_filename(filename: str, compression: Optional[str] = None) -> str:
+    if compression is None:
+        return filename
+
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"Unknown compression {compression}, must be one of {', '.join(COMPRESSIONS)}")
+
+    return strip_compression(filename) + COMPRESSIONS[compression]
+
+
+def find_file(filename: str) -> str:
+    """The filename itself if it exists, otherwise the first compressed version of it that does."""
+    if os.path.exists(filename):
+        return filename
+
+    return next((filename + suffix for suffix in COMPRESSIONS.values() if os.path.exists(filename + suffix)),
+                filename)
+
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError("Reading and writing .zst files needs the zstandard package") from None
+
+    return zstandard
+
+
+def open_file(filename: str, mode: str = "r") -> IO:
+    """
+    Open a file for buffered reading or writing, compressed or not depending on the suffix.
+
+    Text mode (the default) is utf-8, add "b" to the mode for bytes.
+    """
+    binary = "b" in mode
+    raw_mode = mode.replace("b", "").replace("t", "") + "b"
+    suffix = compression_suffix(filename)
+
+    if suffix == COMPRESSIONS["gz"]:
+        fp = gzip.open(filename, raw_mode, compresslevel=GZIP_LEVEL)
+    elif suffix == COMPRESSIONS["zst"]:
+        fp = _zstandard().open(filename, raw_mode)
+    else:
+        fp = open(filename, raw_mode, buffering=BUFFER_SIZE)
+
+    if suffix and "r" not in raw_mode:
+        fp = io.BufferedWriter(fp, buffer_size=BUFFER_SIZE)
+
+    if binary:
+        return fp
+
+    return io.TextIOWrapper(fp, encoding="utf-8")
+
+
+def write_lines(fp: IO, lines: Iterable[str], chunk_size: int = LINE_CHUNK_SIZE):
+    """Write lines joined in chunks, instead of one write per line."""
+    lines = iter(lines)
+
+    while chunk := "".join(islice(lines, chunk_size)):
+        fp.write(chunk)
+
+
+def prepend_header(filename: str, header: str, compression: Optional[str] = None) -> str:
+    """
+    Stream the file into a copy that starts with header, compressed if compression is given.
+
+    The file is copied in chunks, so it is never read into memory.
+    Returns the filename of the new file, which replaces the original.
+    """
+    outname = compressed_filename(filename, compression)
+    tmpname = strip_compression(outname) + ".tmp" + (compression_suffix(outname) or "")
+
+    with open(filename, "rb") as src, open_file(tmpname, "wb") as dst:
+        dst.write(header.encode("utf-8"))
+        shutil.copyfileobj(src, dst, BUFFER_SIZE)
+
+    os.replace(tmpname, outname)
+
+    if outname != filename:
+        os.remove(filename)
+
+    return outname
+
+
+def compress_file(filename: str, compression: Optional[str] = None) -> str:
+    """Replace the file with a compressed copy, returns the new filename."""
+    if compression is None:
+        return filename
+
+    return prepend_header(filename, "", compression)
@@ -1,9 +1,13 @@
+import hashlib
 import re
 from collections import namedtuple, defaultdict
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from functools import cached_property
+from itertools import filterfalse
 from operator import methodcaller
 from typing import Iterable, List, Tuple, Sequence, Mapping, Dict, Set, TextIO
 
+from .compression import write_lines
 from .network import Node
 
 HyperEdge = namedtuple("HyperEdge", "id, nodes, omega")
@@ -48,25 +52,118 @@ class HyperGraph:
     edges: List[HyperEdge]
     weights: List[Gamma]
 
+    _indices = ("edges_by_id", "weights_by_edge", "edges_by_node", "gamma_by_edge_node", "content_hash")
+
     def __iter__(self):
         return iter((self.nodes, self.edges, self.weights))
 
+    def __setattr__(self, name, value):
+        super().__setattr__(name, value)
+
+        if name in ("nodes", "edges", "weights"):
+            self.invalidate()
+
+    def invalidate(self):
+        """
+        Drop the cached indices.
+
+        Reassigning nodes, edges or weights does this automatically,
+        call it after mutating the lists in place.
+        """
+        for index in self._indices:
+            self.__dict__.pop(index, None)
+
+    @cached_property
+    def edges_by_id(self) -> Dict[int, HyperEdge]:
+        return {edge.id: edge for edge in self.edges}
+
+    @cached_property
+    def weights_by_edge(self) -> Dict[int, List[Gamma]]:
+        weights_by_edge = defaultdict(list)
+
+        for weight in self.weights:
+            weights_by_edge[weight.edge].append(weight)
+
+        return dict(weights_by_edge)
+
+    @cached_property
+    def edges_by_node(self) -> Dict[int, List[HyperEdge]]:
+        edges_by_node = defaultdict(list)
+
+        for edge in self.edges:
+            for node in edge.nodes:
+                edges_by_node[node.id].append(edge)
+
+        return dict(edges_by_node)
+
+    @cached_property
+    def gamma_by_edge_node(self) -> Dict[Tuple[int, int], float]:
+        return {(edge, node.id): gamma for edge, node, gamma in self.weights}
+
+    @cached_property
+    def content_hash(self) -> str:
+        """
+        Hash of the hypergraph in the text format, with the nodes, hyperedges and weights sorted.
+
+        Equal hypergraphs have equal hashes, regardless of the order they were read in.
+        """
+        writer = _HashWriter()
+        self.write(writer)
+        return writer.hexdigest()
+
+    def edge_subgraph(self, edge_ids: Iterable[int]):  # -> HyperGraph
+        """
+        Keep the hyperedges in edge_ids, the vertices they span and their weights.
+        """
+        edge_ids = set(edge_ids)
+
+        edges = [edge for edge in self.edges if edge.id in edge_ids]
+
+        node_ids = {node.id for edge in edges for node in edge.nodes}
+        nodes = [node for node in self.nodes if node.id in node_ids]
+
+        weights_by_edge = {edge.id: self.weights_by_edge.get(edge.id, []) for edge in edges}
+        weights = [weight for edge_weights in weights_by_edge.values() for weight in edge_weights]
+
+        subgraph = HyperGraph(nodes, edges, weights)
+        subgraph.weights_by_edge = {edge: edge_weights for edge, edge_weights in weights_by_edge.items()
+                                    if len(edge_weights)}
+
+        return subgraph
+
+    def node_subgraph(self, node_ids: Iterable[int]):  # -> HyperGraph
+        """
+        Keep the vertices in node_ids, the hyperedges incident to any of them
+        and the weights between the remaining hyperedges and vertices.
+        """
+        node_ids = set(node_ids)
+
+        nodes = [node for node in self.nodes if node.id in node_ids]
+
+        edge_ids = {edge.id for node_id in node_ids for edge in self.edges_by_node.get(node_id, ())}
+        edges = [edge for edge in self.edges if edge.id in edge_ids]
+
+        weights = [weight for edge in edges for weight in self.weights_by_edge.get(edge.id, ())
+                   if weight.node.id in node_ids]
+
+        return HyperGraph(nodes, edges, weights)
+
     def write(self, fp: TextIO):
         fp.write("*Vertices\n")
         fp.write("# id name\n")
-        fp.writelines(f"{node.id} \"{node.name}\"\n"
-                      for node in sorted(self.nodes))
+        write_lines(fp, (f"{node.id} \"{node.name}\"\n"
+                         for node in sorted(self.nodes)))
 
         fp.write("*Hyperedges\n")
         fp.write("# id nodes... omega\n")
-        fp.writelines(f"{edge.id} {' '.join(map(str, (node.id for node in edge.nodes)))} {edge.omega}\n"
-                      for edge in sorted(self.edges))
+        write_lines(fp, (f"{edge.id} {' '.join(map(str, sorted(node.id for node in edge.nodes)))} {edge.omega}\n"
+                         for edge in sorted(self.edges)))
 
         fp.write("*Weights\n")
         fp.write("# edge node gamma\n")
-        fp.writelines(f"{weight.edge} {weight.node.id} {weight.gamma}\n"
-                      for weight in sorted(self.weights)
-                      if weight.gamma != 1)
+        write_lines(fp, (f"{weight.edge} {weight.node.id} {weight.gamma}\n"
+                         for weight in sorted(self.weights)
+                         if weight.gamma != 1))
 
     @classmethod
     def from_iter(cls, lines: Iterable[str]):
@@ -91,6 +188,154 @@ class HyperGraph:
         return cls(list(nodes.values()), edges, weights)
 
 
+@dataclass
+class HyperGraphDelta:
+    """
+    Change to a hypergraph.
+
+    Hyperedges in edges are added, or replace the hyperedges with the same ids
+    to change their vertices or omega. Weights set gamma_e(v) of vertices in
+    added or existing hyperedges. Hyperedges in removed are removed with their weights.
+
+    Weights of replaced hyperedges are kept for the vertices still in them,
+    vertices of added or replaced hyperedges without a weight get gamma = 1.
+    """
+    edges: List[HyperEdge] = field(default_factory=list)
+    weights: List[Gamma] = field(default_factory=list)
+    removed: Set[int] = field(default_factory=set)
+
+    def __len__(self):
+        return len(self.changed_edges)
+
+    @property
+    def changed_edges(self) -> Set[int]:
+        return {edge.id for edge in self.edges} | {weight.edge for weight in self.weights} | set(self.removed)
+
+    def apply(self, hypergraph: HyperGraph) -> HyperGraph:
+        """
+        The changed hypergraph.
+
+        Only the hyperedges, weights and vertices of the changed hyperedges are visited,
+        found with the indices of the hypergraph, which are updated for the changed hypergraph.
+        """
+        replaced = {edge.id for edge in self.edges}
+        dropped = replaced | set(self.removed)
+
+        edges_by_id = dict(hypergraph.edges_by_id)
+        weights_by_edge = dict(hypergraph.weights_by_edge)
+        edges_by_node = dict(hypergraph.edges_by_node)
+
+        nodes = hypergraph.nodes
+
+        if len(nodes) != len(edges_by_node):
+            # dangling vertices are dropped
+            nodes = [node for node in nodes if node.id in edges_by_node]
+
+        old_edges = [edges_by_id.pop(edge_id) for edge_id in dropped if edge_id in edges_by_id]
+        edges_by_id.update((edge.id, edge) for edge in self.edges)
+
+        edges = list(filterfalse(set(old_edges).__contains__, hypergraph.edges))
+        edges.extend(self.edges)
+
+        def is_member(edge_id: int, node_id: int) -> bool:
+            return edge_id in edges_by_id and any(node.id == node_id for node in edges_by_id[edge_id].nodes)
+
+        set_weights = {(weight.edge, weight.node.id) for weight in self.weights}
+
+        # weights of the changed hyperedges
+        changed_weights = defaultdict(list)
+        removed_weights = set()
+
+        for edge_id in dropped | {weight.edge for weight in self.weights}:
+            for weight in weights_by_edge.pop(edge_id, ()):
+                if (weight.edge, weight.node.id) in set_weights or \
+                        (edge_id in dropped and not is_member(edge_id, weight.node.id)):
+                    removed_weights.add(weight)
+                else:
+                    changed_weights[edge_id].append(weight)
+
+        added_weights = [weight for weight in self.weights if is_member(weight.edge, weight.node.id)]
+
+        for weight in added_weights:
+            changed_weights[weight.edge].append(weight)
+
+        for edge in self.edges:
+            found = {weight.node.id for weight in changed_weights[edge.id]}
+            defaults = [Gamma(edge.id, node, 1.0) for node in edge.nodes if node.id not in found]
+            changed_weights[edge.id].extend(defaults)
+            added_weights.extend(defaults)
+
+        weights_by_edge.update((edge_id, edge_weights) for edge_id, edge_weights in changed_weights.items()
+                               if edge_weights)
+
+        weights = list(filterfalse(removed_weights.__contains__, hypergraph.weights))
+        weights.extend(added_weights)
+
+        # vertices of the changed hyperedges, dangling vertices are dropped
+        for edge in old_edges:
+            for node in edge.nodes:
+                edges_by_node[node.id] = [other for other in edges_by_node[node.id] if other.id not in dropped]
+
+        new_nodes = {}
+
+        for edge in self.edges:
+            for node in edge.nodes:
+                if node.id not in edges_by_node:
+                    new_nodes.setdefault(node.id, node)
+
+                edges_by_node[node.id] = edges_by_node.get(node.id, []) + [edge]
+
+        dangling = {node.id for edge in old_edges for node in edge.nodes if not edges_by_node[node.id]}
+
+        for node_id in dangling:
+            del edges_by_node[node_id]
+
+        nodes = [node for node in nodes if node.id not in dangling] if dangling else list(nodes)
+        nodes.extend(new_nodes.values())
+
+        changed = HyperGraph(nodes, edges, weights)
+        changed.edges_by_id = edges_by_id
+        changed.weights_by_edge = weights_by_edge
+        changed.edges_by_node = edges_by_node
+
+        return changed
+
+    @classmethod
+    def between(cls, old: HyperGraph, new: HyperGraph):  # -> HyperGraphDelta
+        """The change from the old to the new hypergraph."""
+        old_edges = {edge.id: edge for edge in old.edges}
+        new_edges = {edge.id: edge for edge in new.edges}
+
+        edges = [edge for edge_id, edge in new_edges.items() if old_edges.get(edge_id) != edge]
+
+        # there may be several weights for the same hyperedge and vertex
+        old_gammas, new_gammas = defaultdict(list), defaultdict(list)
+
+        for gammas, weights in ((old_gammas, old.weights), (new_gammas, new.weights)):
+            for weight in weights:
+                gammas[weight.edge, weight.node.id].append(weight.gamma)
+
+        weights = [weight for weight in new.weights
+                   if sorted(old_gammas.get((weight.edge, weight.node.id), ())) !=
+                   sorted(new_gammas[weight.edge, weight.node.id])]
+
+        return cls(edges, weights, set(old_edges.keys() - new_edges.keys()))
+
+
+class _HashWriter:
+    """Write-only file object that hashes what is written to it."""
+
+    def __init__(self):
+        self._sha = hashlib.sha256()
+
+    def write(self, text: str) -> int:
+        self._sha.update(text.encode())
+        return len(text)
+
+    def hexdigest(self) -> str:
+        return self._sha.hexdigest()
+
+
 def read(lines) -> Tuple[List[str], List[str], List[str]]:
     lines = (line.strip() for line in lines)
     lines = (line for line in lines if not line.startswith("#"))
@@ -169,15 +414,5 @@ def missing_weights(edges: Sequence[HyperEdge], weights: Sequence[Gamma]) -> Set
 
 
 def remove_simple_hyperedges(hypergraph: HyperGraph) -> HyperGraph:
-    nodes, edges, weights = hypergraph
-
-    edges_ = [edge for edge in edges if len(edge.nodes) > 1]
-    nodes_ = set()
-    weights_ = []
-
-    for edge in edges_:
-        nodes_.update(edge.nodes)
-        weights_.extend(weight for weight in weights
-                        if weight.edge == edge.id)
-
-    return HyperGraph(list(nodes_), edges_, weights_)
+    return hypergraph.edge_subgraph(edge.id for edge in hypergraph.edges
+                                    if len(edge.nodes) > 1)
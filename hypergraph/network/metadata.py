@@ -0,0 +1,117 @@
+import json
+import os
+from dataclasses import dataclass, asdict
+from statistics import mean
+from typing import Optional, Tuple, List
+
+from .compression import open_file, strip_compression
+from .tree import Tree
+
+
+def metadata_filename(tree_filename: str) -> str:
+    """The sidecar of output/multilayer.ftree(.gz) is output/multilayer.json"""
+    return os.path.splitext(strip_compression(tree_filename))[0] + ".json"
+
+
+def count_states_and_links(states_filename: str) -> Tuple[int, int]:
+    """Number of state lines and link lines in a state network written by Infomap."""
+    num_states, num_links = -1, -1
+    context = None
+
+    with open_file(states_filename) as fp:
+        for line in fp:
+            if line.startswith("# stateId physicalId"):
+                context = "states"
+            elif line.startswith("*Links"):
+                context = "links"
+
+            if context == "states":
+                num_states += 1
+            elif context == "links":
+                num_links += 1
+
+    return num_states, num_links
+
+
+@dataclass
+class RunMetadata:
+    """
+    Summary of an Infomap run, stored next to the tree file.
+
+    The size and modification time of the tree file are stored to
+    detect if the tree has been rewritten since.
+    """
+    tree_size: int
+    tree_mtime_ns: int
+    num_states: Optional[int]
+    num_links: Optional[int]
+    levels: Optional[int]
+    num_top_modules: Optional[int]
+    num_leaf_modules: Optional[int]
+    codelength: Optional[float]
+    codelengths: Optional[List[float]]
+    completed_in: Optional[float]
+    mean_assignments: float
+    mean_effective_assignments: float
+
+    def is_current(self, tree_filename: str) -> bool:
+        stat = os.stat(tree_filename)
+        return stat.st_size == self.tree_size and stat.st_mtime_ns == self.tree_mtime_ns
+
+    def write(self, filename: str):
+        tmpname = filename + ".tmp"
+
+        with open(tmpname, "w") as fp:
+            json.dump(asdict(self), fp, indent=2)
+
+        os.replace(tmpname, filename)
+
+    @classmethod
+    def read(cls, tree_filename: str):  # -> Optional[RunMetadata]
+        """The sidecar of the tree file, or None if it is missing or out of date."""
+        try:
+            with open(metadata_filename(tree_filename)) as fp:
+                metadata = cls(**json.load(fp))
+        except (OSError, TypeError, ValueError):
+            return None
+
+        return metadata if metadata.is_current(tree_filename) else None
+
+    @classmethod
+    def from_tree(cls,
+                  tree: Tree,
+                  num_states: Optional[int] = None,
+                  num_links: Optional[int] = None,
+                  tree_filename: Optional[str] = None):
+        """tree_filename is the file the tree was written to, if the tree was not read from it."""
+        stat = os.stat(tree_filename or tree.filename)
+
+        return cls(stat.st_size,
+                   stat.st_mtime_ns,
+                   num_states,
+                   num_links,
+                   tree.levels,
+                   tree.num_top_modules,
+                   tree.num_leaf_modules,
+                   tree.codelength,
+                   list(tree.codelengths) if tree.codelengths is not None else None,
+                   tree.completed_in,
+                   mean(tree.assignments.values()),
+                   mean(tree.effective_assignments.values()))
+
+
+def write_metadata(tree_filename: str,
+                   num_states: Optional[int] = None,
+                   num_links: Optional[int] = None,
+                   tree: Optional[Tree] = None) -> RunMetadata:
+    """
+    Write the sidecar of the tree file. Pass the tree of the run that wrote the file,
+    e.g. Tree.from_infomap, to not parse the file again.
+    """
+    if tree is None:
+        tree = Tree.from_file(tree_filename)
+
+    metadata = RunMetadata.from_tree(tree, num_states, num_links, tree_filename)
+    metadata.write(metadata_filename(tree_filename))
+
+    return metadata
@@ -1,7 +1,13 @@
+import re
+import shutil
 from collections import namedtuple
 from dataclasses import dataclass
-from operator import attrgetter
-from typing import Tuple, List, TextIO, Iterable
+from operator import attrgetter, methodcaller
+from typing import Tuple, List, TextIO, Iterable, Optional, Iterator, Union, Sequence, Dict
+
+import numpy as np
+
+from .compression import open_file, write_lines, BUFFER_SIZE
 
 Node = namedtuple("Node", "id, name")
 StateNode = namedtuple("StateNode", "state_id, node_id")
@@ -9,15 +15,201 @@ StateNode = namedtuple("StateNode", "state_id, node_id")
 Link = Tuple[int, int, float]
 MultiLayerLink = Tuple[Tuple[int, int], Tuple[int, int], float]
 
+LINK_CHUNK_SIZE = 1 << 16
+
+
+@dataclass(eq=False)
+class LinkArray:
+    """
+    Columnar link storage.
+
+    Iterating yields the same tuples as the list representation,
+    (source, target, weight), or ((source_layer, source), (target_layer, target), weight)
+    if the layer columns are set.
+    """
+    source: np.ndarray
+    target: np.ndarray
+    weight: np.ndarray
+    source_layer: Optional[np.ndarray] = None
+    target_layer: Optional[np.ndarray] = None
+
+    @property
+    def is_multilayer(self) -> bool:
+        return self.source_layer is not None
+
+    @property
+    def columns(self) -> Tuple[np.ndarray, ...]:
+        if self.is_multilayer:
+            return self.source_layer, self.source, self.target_layer, self.target, self.weight
+
+        return self.source, self.target, self.weight
+
+    def __len__(self) -> int:
+        return len(self.weight)
+
+    def __iter__(self):
+        for chunk in self.chunks():
+            yield from chunk
+
+    def chunks(self, chunk_size: int = LINK_CHUNK_SIZE) -> Iterator[List[Union[Link, MultiLayerLink]]]:
+        for start in range(0, len(self), chunk_size):
+            columns = [column[start:start + chunk_size].tolist() for column in self.columns]
+
+            if self.is_multilayer:
+                yield [((e1, u), (e2, v), w) for e1, u, e2, v, w in zip(*columns)]
+            else:
+                yield list(zip(*columns))
+
+    def take(self, index: np.ndarray):  # -> LinkArray
+        return LinkArray(*(column[index] if column is not None else None
+                           for column in (self.source, self.target, self.weight,
+                                          self.source_layer, self.target_layer)))
+
+    def sorted(self):  # -> LinkArray
+        return self.take(np.lexsort(self.columns[::-1]))
+
+    def sort_keys(self) -> np.ndarray:
+        """The columns as one structured array, which compares like the order of sorted."""
+        keys = np.empty(len(self), dtype=[(f"column{i}", column.dtype) for i, column in enumerate(self.columns)])
+
+        for i, column in enumerate(self.columns):
+            keys[f"column{i}"] = column
+
+        return keys
+
+    def replace_sources(self, source_ids: np.ndarray, links):  # -> LinkArray
+        """
+        Sorted links with the links from the vertices in source_ids replaced by links.
+
+        Both link arrays must be sorted, the links are merged into the kept links
+        at their sorted positions instead of sorting all links again.
+        """
+        kept = self.take(np.flatnonzero(~np.isin(self.source, source_ids)))
+
+        # after kept links that compare equal, as a stable sort of the concatenated links
+        keys = kept.sort_keys()
+        positions = np.searchsorted(keys, links.sort_keys().astype(keys.dtype), side="right")
+
+        return LinkArray(*(np.insert(column, positions, other) if column is not None else None
+                           for column, other in zip((kept.source, kept.target, kept.weight,
+                                                     kept.source_layer, kept.target_layer),
+                                                    (links.source, links.target, links.weight,
+                                                     links.source_layer, links.target_layer))))
+
+    def unique(self):  # -> LinkArray
+        """Sorted links with the weights of duplicate links summed."""
+        links = self.sorted()
+
+        if len(links) == 0:
+            return links
+
+        keys = links.columns[:-1]
+        first = np.ones(len(links), dtype=bool)
+        first[1:] = np.any([key[1:] != key[:-1] for key in keys], axis=0)
+
+        starts = np.flatnonzero(first)
+
+        unique_links = links.take(starts)
+        unique_links.weight = np.add.reduceat(links.weight, starts)
+
+        return unique_links
+
+    def write(self, fp: TextIO, chunk_size: int = LINK_CHUNK_SIZE):
+        for start in range(0, len(self), chunk_size):
+            columns = [column[start:start + chunk_size].astype(str) for column in self.columns]
+            fp.write("\n".join(map(" ".join, zip(*columns))))
+            fp.write("\n")
+
+    @classmethod
+    def from_links(cls, links: Sequence[Union[Link, MultiLayerLink]]):  # -> LinkArray
+        if len(links) and isinstance(links[0][0], tuple):
+            (source_layer, source), (target_layer, target), weight = \
+                zip(*(link[0] for link in links)), zip(*(link[1] for link in links)), (link[2] for link in links)
+
+            return cls(np.array(source, dtype=int),
+                       np.array(target, dtype=int),
+                       np.fromiter(weight, dtype=float),
+                       np.array(source_layer, dtype=int),
+                       np.array(target_layer, dtype=int))
+
+        source, target, weight = zip(*links) if len(links) else ((), (), ())
+
+        return cls(np.array(source, dtype=int), np.array(target, dtype=int), np.array(weight, dtype=float))
+
+    @classmethod
+    def from_lines(cls, lines: Sequence[str], is_multilayer: bool = False):  # -> LinkArray
+        """
+        Parse link lines in bulk, "source target [weight]" or
+        "source_layer source target_layer target weight" if is_multilayer.
+        """
+        id_columns = 4 if is_multilayer else 2
+
+        first_line = next((line for line in lines if line.strip() and not line.lstrip().startswith("#")), "")
+        weighted = len(first_line.split()) != id_columns
+
+        dtype = [(f"id{i}", np.int64) for i in range(id_columns)] + ([("weight", float)] if weighted else [])
+
+        if first_line:
+            data = np.loadtxt(lines, dtype=dtype, usecols=range(len(dtype)), ndmin=1)
+        else:
+            data = np.zeros(0, dtype=dtype)
+
+        weight = data["weight"] if weighted else np.ones(len(data))
+
+        if is_multilayer:
+            return cls(data["id1"], data["id3"], weight, data["id0"], data["id2"])
+
+        return cls(data["id0"], data["id1"], weight)
+
+
+Links = Union[List[Link], List[MultiLayerLink], LinkArray]
+
+
+def link_chunks(links: Links) -> Iterable[Sequence[Union[Link, MultiLayerLink]]]:
+    if isinstance(links, LinkArray):
+        return links.chunks()
+
+    return links,
+
+
+def write_links(fp: TextIO, links: Links):
+    if isinstance(links, LinkArray):
+        links.write(fp)
+    elif len(links) and isinstance(links[0][0], tuple):
+        write_lines(fp, (f"{e1} {u} {e2} {v} {w}\n"
+                         for (e1, u), (e2, v), w in links))
+    else:
+        write_lines(fp, (f"{source} {target} {w}\n"
+                         for source, target, w in links))
+
+
+# sections with links of the format "source target [weight]"
+LINK_SECTIONS = ("*links", "*edges", "*arcs")
+
+
+def read_sections(text: str) -> Dict[str, Tuple[str, List[str]]]:
+    """
+    Split the text of a network file into sections.
+
+    Maps the lower case section name, like "*vertices", to the section heading
+    and the lines in the section. Comment lines are left for the parsers to skip.
+    """
+    headings = list(re.finditer(r"^\*[^\n]*", text, re.MULTILINE))
+    ends = [heading.start() for heading in headings[1:]] + [len(text)]
+
+    return {heading.group().split()[0].lower(): (heading.group().strip(), text[heading.end():end].splitlines())
+            for heading, end in zip(headings, ends)}
+
 
 @dataclass
 class Network:
     nodes: List[Node]
-    links: List[Link]
+    links: Links
 
     def apply(self, infomap):
         infomap.add_nodes(self.nodes)
-        infomap.add_links(self.links)
+        for links in link_chunks(self.links):
+            infomap.add_links(links)
 
     def write(self, fp: TextIO):
         self._write_nodes(fp)
@@ -25,49 +217,70 @@ class Network:
 
     def _write_nodes(self, fp: TextIO):
         fp.write("*Vertices\n")
-        fp.writelines(f"{node.id} \"{node.name}\"\n" for node in sorted(self.nodes))
+        write_lines(fp, (f"{node.id} \"{node.name}\"\n" for node in sorted(self.nodes)))
 
     def _write_links(self, fp: TextIO):
         fp.write("*Edges\n")
-        fp.writelines(f"{source} {target} {w}\n"
-                      for source, target, w in self.links)
+        write_links(fp, self.links)
 
     @classmethod
-    def from_iter(cls, lines: Iterable[str]):  # -> Union[Network, StateNetwork]
-        nodes, states, links = [], [], []
-
-        context = None
-
-        for line in lines:
-            line = line.strip()
-
-            if line.startswith("*"):
-                context = line
-                continue
-            if line.startswith("#"):
-                continue
-
-            if context == "*Vertices":
-                split_index = line.index(" ")
-                id_, name = line[:split_index], line[split_index + 1:]
-                name = name.strip("\"")
-                nodes.append(Node(int(id_), name))
-            elif context == "*States":
-                state_id, node_id = map(int, line.split())
-                states.append(StateNode(state_id, node_id))
-            elif context == "*Links":
-                source, target, weight = line.split()
-                links.append((int(source), int(target), float(weight)))
-
-        if len(states):
+    def from_iter(cls, lines: Union[str, Iterable[str]]):  # -> Network
+        """
+        Parse any network written by the write methods, or by Infomap.
+
+        The numeric sections are read in bulk, links into a LinkArray.
+        Returns the Network subclass matching the sections in the file,
+        regardless of the class this is called on.
+        """
+        text = lines if isinstance(lines, str) else "\n".join(line.rstrip("\n") for line in lines)
+
+        sections = read_sections(text)
+
+        vertex_lines = (line.strip() for line in sections.get("*vertices", ("", []))[1])
+
+        nodes = [Node(int(id_), name.strip("\""))
+                 for id_, _, name in map(methodcaller("partition", " "), vertex_lines)
+                 if id_ and not id_.startswith("#")]
+
+        states = None
+
+        if "*states" in sections:
+            states = np.loadtxt(sections["*states"][1], dtype=np.int64, usecols=(0, 1), ndmin=2, quotechar="\"")
+            states = [StateNode(state_id, node_id) for state_id, node_id in states.tolist()]
+
+        if "*multilayer" in sections:
+            return MultilayerNetwork(nodes, LinkArray.from_lines(sections["*multilayer"][1], is_multilayer=True))
+
+        if "*bipartite" in sections:
+            heading, link_lines = sections["*bipartite"]
+            bipartite_start_id = int(heading.split()[1])
+            links = LinkArray.from_lines(link_lines)
+
+            if states is not None:
+                feature_ids = {node_id for state_id, node_id in states if state_id >= bipartite_start_id}
+            else:
+                feature_ids = {node.id for node in nodes if node.id >= bipartite_start_id}
+
+            features = [node for node in nodes if node.id in feature_ids]
+            nodes = [node for node in nodes if node.id not in feature_ids]
+
+            if states is not None:
+                return BipartiteStateNetwork(nodes, links, states, features)
+
+            return BipartiteNetwork(nodes, links, features)
+
+        link_lines = next((sections[name][1] for name in LINK_SECTIONS if name in sections), [])
+        links = LinkArray.from_lines(link_lines)
+
+        if states is not None:
             return StateNetwork(nodes, links, states)
 
-        return cls(nodes, links)
+        return Network(nodes, links)
 
     @classmethod
     def from_file(cls, filename: str):
-        with open(filename) as fp:
-            return cls.from_iter(fp.readlines())
+        with open_file(filename) as fp:
+            return cls.from_iter(fp.read())
 
 
 @dataclass
@@ -77,7 +290,8 @@ class StateNetwork(Network):
     def apply(self, infomap):
         infomap.set_names(self.nodes)
         infomap.add_state_nodes(self.states)
-        infomap.add_links(self.links)
+        for links in link_chunks(self.links):
+            infomap.add_links(links)
 
     def write(self, fp: TextIO):
         self._write_nodes(fp)
@@ -86,8 +300,8 @@ class StateNetwork(Network):
 
     def _write_states(self, fp: TextIO):
         fp.write("*States\n")
-        fp.writelines(f"{state.state_id} {state.node_id}\n"
-                      for state in sorted(self.states))
+        write_lines(fp, (f"{state.state_id} {state.node_id}\n"
+                         for state in sorted(self.states)))
 
 
 @dataclass
@@ -105,13 +319,12 @@ class BipartiteNetwork(Network):
 
     def _write_nodes(self, fp: TextIO):
         super()._write_nodes(fp)
-        fp.writelines(f"{node.id} \"{node.name}\"\n"
-                      for node in sorted(self.features))
+        write_lines(fp, (f"{node.id} \"{node.name}\"\n"
+                         for node in sorted(self.features)))
 
     def _write_links(self, fp: TextIO):
         fp.write(f"*Bipartite {self.bipartite_start_id}\n")
-        fp.writelines(f"{source} {target} {w}\n"
-                      for source, target, w in self.links)
+        write_links(fp, self.links)
 
 
 @dataclass
@@ -126,19 +339,37 @@ class BipartiteStateNetwork(BipartiteNetwork, StateNetwork):
         infomap.set_names(self.nodes)
         infomap.set_names(self.features)
         infomap.add_state_nodes(self.states)
-        infomap.add_links(self.links)
+        for links in link_chunks(self.links):
+            infomap.add_links(links)
         infomap.bipartite_start_id = self.bipartite_start_id
 
 
 @dataclass
 class MultilayerNetwork(Network):
-    links: List[MultiLayerLink]
+    links: Union[List[MultiLayerLink], LinkArray]
 
     def apply(self, infomap):
         infomap.set_names(self.nodes)
-        infomap.add_multilayer_links(self.links)
+        for links in link_chunks(self.links):
+            infomap.add_multilayer_links(links)
 
     def _write_links(self, fp: TextIO):
         fp.write("*Multilayer\n")
-        fp.writelines(f"{e1} {u} {e2} {v} {w}\n"
-                      for (e1, u), (e2, v), w in self.links)
+        write_links(fp, self.links)
+
+
+@dataclass
+class NetworkFile:
+    """
+    A network written to a file, for networks too large to keep in memory.
+
+    Infomap reads the file directly instead of the links being added from Python.
+    """
+    filename: str
+
+    def apply(self, infomap):
+        infomap.read_file(self.filename)
+
+    def write(self, fp: TextIO):
+        with open_file(self.filename) as network:
+            shutil.copyfileobj(network, fp, BUFFER_SIZE)
@@ -1,17 +1,17 @@
-import math
 import os
 import re
-from collections import defaultdict
-from dataclasses import dataclass
+from collections import defaultdict, namedtuple
+from dataclasses import dataclass, field, fields
 from enum import Enum
 from itertools import filterfalse, takewhile, dropwhile
 from operator import attrgetter
-from typing import Tuple, Optional, Iterable, List, Callable, Dict, Sequence, TextIO, Mapping
+from typing import Tuple, Optional, Iterable, List, Callable, Dict, Sequence, TextIO, Mapping, Union
 
+import numpy as np
 from infomap import Infomap
-from scipy.stats import entropy
 
 from hypergraph.network import StateNetwork
+from hypergraph.network.compression import open_file, strip_compression, write_lines
 
 Path = Tuple[int, ...]
 
@@ -31,13 +31,16 @@ class TreeNode:
     layer_id: Optional[int] = None
 
     def write(self, fp: TextIO):
-        fp.write("{} {} \"{}\"".format(":".join(map(str, self.path)), self.flow, self.name))
+        fp.write(self.to_str())
+
+    def to_str(self) -> str:
+        line = "{} {} \"{}\"".format(":".join(map(str, self.path)), self.flow, self.name)
         if self.state_id is not None:
-            fp.write(f" {self.state_id}")
-        fp.write(f" {self.id}")
+            line += f" {self.state_id}"
+        line += f" {self.id}"
         if self.layer_id is not None:
-            fp.write(f" {self.layer_id}")
-        fp.write("\n")
+            line += f" {self.layer_id}"
+        return line + "\n"
 
     @property
     def top_module(self) -> int:
@@ -84,12 +87,227 @@ class TreeNode:
         return TreeNode(path, flow, name if name else str(node_id), node_id, state_id, layer_id)
 
 
+# a Level, or the length of the path prefix that makes up the module
+ModuleLevel = Union[Level, int]
+
+Overlap = namedtuple("Overlap", "names, assignments, effective_assignments")
+
+
+@dataclass(eq=False)
+class TreeColumns:
+    """
+    Columnar tree nodes.
+
+    The path of node i is path_modules[path_offsets[i]:path_offsets[i + 1]],
+    missing state and layer ids are None for the whole tree.
+    """
+    path_offsets: np.ndarray
+    path_modules: np.ndarray
+    flow: np.ndarray
+    node_id: np.ndarray
+    state_id: Optional[np.ndarray]
+    layer_id: Optional[np.ndarray]
+    name_table: List[str]
+    name_index: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.flow)
+
+    @property
+    def depth(self) -> np.ndarray:
+        return np.diff(self.path_offsets)
+
+    @property
+    def names(self) -> List[str]:
+        return [self.name_table[i] for i in self.name_index.tolist()]
+
+    def padded_paths(self) -> np.ndarray:
+        """Paths as rows of a num nodes x max depth matrix, padded with zeros."""
+        depth = self.depth
+        paths = np.zeros((len(self), depth.max(initial=0)), dtype=self.path_modules.dtype)
+        rows = np.repeat(np.arange(len(self)), depth)
+        cols = np.arange(len(self.path_modules)) - np.repeat(self.path_offsets[:-1], depth)
+        paths[rows, cols] = self.path_modules
+        return paths
+
+    def module_ids(self, level: ModuleLevel = Level.LEAF_MODULE) -> np.ndarray:
+        """
+        Integer module label of each node at the top or leaf level,
+        or of the path prefix path[0:level] if level is an int.
+        """
+        if isinstance(level, int):
+            paths = self.padded_paths()[:, :level]
+            return np.unique(paths, axis=0, return_inverse=True)[1].ravel()
+        elif level.value == Level.TOP_MODULE.value:
+            return self.path_modules[self.path_offsets[:-1]]
+        elif level.value == Level.LEAF_MODULE.value:
+            paths = self.padded_paths()
+            paths[np.arange(len(self)), self.depth - 1] = 0
+            return np.unique(paths, axis=0, return_inverse=True)[1].ravel()
+        else:
+            raise NotImplementedError(f"Must be either top or leaf module, not {level=}.")
+
+    def overlap(self, level: ModuleLevel = Level.LEAF_MODULE) -> Overlap:
+        """
+        Number of modules and effective number of modules each name is assigned to.
+
+        The effective number is 2 to the power of the entropy of the
+        number of nodes with the name in each module.
+        """
+        modules = self.module_ids(level)
+
+        # number of nodes with each name in each module
+        keys, counts = np.unique(self.name_index * (modules.max(initial=0) + 1) + modules, return_counts=True)
+        names = keys // (modules.max(initial=0) + 1)
+
+        num_names = len(self.name_table)
+        assignments = np.bincount(names, minlength=num_names)
+
+        p = counts / np.bincount(names, weights=counts, minlength=num_names)[names]
+        entropy = np.bincount(names, weights=-p * np.log(p), minlength=num_names) / np.log(2)
+
+        return Overlap(self.name_table, assignments, 2 ** entropy)
+
+    def physical_flow(self, level: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Flow of each physical node in each module at level.
+
+        Returns the first node of each module and node id pair, in order of
+        appearance, and the summed flow of the pair.
+        """
+        modules = self.module_ids(level)
+        _, node_ids = np.unique(self.node_id, return_inverse=True)
+
+        _, first, inverse = np.unique(modules * (node_ids.max(initial=0) + 1) + node_ids,
+                                      return_index=True,
+                                      return_inverse=True)
+
+        flow = np.bincount(inverse.ravel(), weights=self.flow, minlength=len(first))
+
+        order = np.argsort(first)
+        return first[order], flow[order]
+
+    def path_strings(self) -> List[str]:
+        tokens = self.path_modules.astype(str).tolist()
+        joined = ":".join(tokens)
+
+        ends = np.cumsum(np.fromiter(map(len, tokens), dtype=np.int64, count=len(tokens)) + 1)
+        starts = np.concatenate(([0], ends))[self.path_offsets[:-1]]
+        ends = np.concatenate(([0], ends))[self.path_offsets[1:]] - 1
+
+        return [joined[start:end] for start, end in zip(starts.tolist(), ends.tolist())]
+
+    def write(self, fp: TextIO):
+        """Write the nodes in the same format as TreeNode.write."""
+        names = self.names
+        ids = self.node_id.astype(str).tolist()
+
+        if self.state_id is not None:
+            ids = [f"{state_id} {node_id}" for state_id, node_id in zip(self.state_id.tolist(), ids)]
+
+        if self.layer_id is not None:
+            ids = [f"{ids_} {layer_id}" for ids_, layer_id in zip(ids, self.layer_id.tolist())]
+
+        write_lines(fp, (f"{path} {flow} \"{name}\" {ids_}\n"
+                         for path, flow, name, ids_ in zip(self.path_strings(), self.flow.tolist(), names, ids)))
+
+    def materialize(self) -> List[TreeNode]:
+        paths = np.split(self.path_modules, self.path_offsets[1:-1])
+        state_ids = self.state_id.tolist() if self.state_id is not None else [None] * len(self)
+        layer_ids = self.layer_id.tolist() if self.layer_id is not None else [None] * len(self)
+
+        return [TreeNode(tuple(path.tolist()), flow, name, node_id, state_id, layer_id)
+                for path, flow, name, node_id, state_id, layer_id
+                in zip(paths, self.flow.tolist(), self.names, self.node_id.tolist(), state_ids, layer_ids)]
+
+    @classmethod
+    def from_nodes(cls, nodes: Sequence[TreeNode]):  # -> TreeColumns
+        name_table, name_index = _name_table(node.name for node in nodes)
+
+        return cls(np.cumsum([0] + [len(node.path) for node in nodes], dtype=np.int64),
+                   np.fromiter((module for node in nodes for module in node.path), dtype=np.int64),
+                   np.fromiter((node.flow for node in nodes), dtype=float, count=len(nodes)),
+                   np.fromiter((node.id for node in nodes), dtype=np.int64, count=len(nodes)),
+                   _optional_ids(node.state_id for node in nodes),
+                   _optional_ids(node.layer_id for node in nodes),
+                   name_table,
+                   name_index)
+
+    @classmethod
+    def from_lines(cls, lines: Sequence[str]):  # -> TreeColumns
+        """
+        Parse tree lines "path flow \"name\" [state_id] node_id [layer_id]".
+
+        Only the names are sliced out line by line, the numeric columns are
+        joined and converted in bulk.
+        """
+        lines = [line.strip() for line in lines]
+
+        name_begin = [line.index("\"") for line in lines]
+        name_end = [line.rindex("\"") for line in lines]
+
+        heads = [line[:begin] for line, begin in zip(lines, name_begin)]
+        tails = [line[end + 1:].strip() for line, end in zip(lines, name_end)]
+
+        paths, flows = zip(*(head.split() for head in heads)) if len(lines) else ((), ())
+
+        depth = np.fromiter((path.count(":") + 1 for path in paths), dtype=np.int64, count=len(lines))
+        path_modules = np.array(" ".join(paths).replace(":", " ").split(), dtype=np.int64)
+
+        num_ids = {len(tail.split()) for tail in tails}
+
+        if len(num_ids) > 1:
+            # trees with added nodes may mix state ids with and without layer ids
+            return cls.from_nodes(list(map(TreeNode.from_str, lines)))
+
+        num_ids = num_ids.pop() if num_ids else 1
+        ids = np.array(" ".join(tails).split(), dtype=np.int64).reshape(-1, num_ids)
+
+        state_id, layer_id = None, None
+
+        if num_ids == 1:
+            node_id = ids[:, 0]
+        elif num_ids == 2:
+            state_id, node_id = ids[:, 0], ids[:, 1]
+        else:
+            state_id, node_id, layer_id = ids[:, 0], ids[:, 1], ids[:, 2]
+
+        names = (line[begin + 1:end] or str(id_)
+                 for line, begin, end, id_ in zip(lines, name_begin, name_end, node_id.tolist()))
+
+        name_table, name_index = _name_table(names)
+
+        return cls(np.concatenate(([0], np.cumsum(depth))),
+                   path_modules,
+                   np.array(flows, dtype=float),
+                   node_id,
+                   state_id,
+                   layer_id,
+                   name_table,
+                   name_index)
+
+
+def _name_table(names: Iterable[str]) -> Tuple[List[str], np.ndarray]:
+    table = {}
+    index = [table.setdefault(name, len(table)) for name in names]
+    return list(table), np.array(index, dtype=np.int64)
+
+
+def _optional_ids(ids: Iterable[Optional[int]]) -> Optional[np.ndarray]:
+    ids = list(ids)
+
+    if len(ids) == 0 or any(id_ is None for id_ in ids):
+        return None
+
+    return np.array(ids, dtype=np.int64)
+
+
 def is_feature_node(line: str) -> bool:
     return "hyperedge" in line.lower()
 
 
 def pretty_filename(filename: str) -> str:
-    basename = os.path.basename(filename)
+    basename = os.path.basename(strip_compression(filename))
     name, _ = os.path.splitext(basename)
     name = re.sub(r"_seed_\d+$", "", name)
 
@@ -102,10 +320,14 @@ def pretty_filename(filename: str) -> str:
     return f"{representation} ({kind})" if kind else representation
 
 
-@dataclass
+@dataclass(init=False)
 class Tree:
+    """
+    Parsed trees keep their nodes as TreeColumns and create the
+    TreeNode objects on the first access to nodes.
+    """
     header: Optional[str]
-    nodes: List[TreeNode]
+    _nodes: Optional[List[TreeNode]] = field(default=None, repr=False, compare=False)
     is_bipartite: bool = False
     is_multilayer: bool = False
     filename: Optional[str] = None
@@ -115,6 +337,91 @@ class Tree:
     codelength: Optional[float] = None
     codelengths: Optional[Tuple[float]] = None
     completed_in: Optional[float] = None
+    _columns: Optional[TreeColumns] = field(default=None, repr=False, compare=False)
+    _cache: Dict = field(default_factory=dict, repr=False, compare=False)
+
+    def __init__(self,
+                 header: Optional[str],
+                 nodes: Optional[List[TreeNode]] = None,
+                 is_bipartite: bool = False,
+                 is_multilayer: bool = False,
+                 filename: Optional[str] = None,
+                 levels: Optional[int] = None,
+                 num_top_modules: Optional[int] = None,
+                 num_leaf_modules: Optional[int] = None,
+                 codelength: Optional[float] = None,
+                 codelengths: Optional[Tuple[float]] = None,
+                 completed_in: Optional[float] = None):
+        # nodes is stored as _nodes, behind the lazily materializing property
+        self.header = header
+        self._nodes = nodes
+        self.is_bipartite = is_bipartite
+        self.is_multilayer = is_multilayer
+        self.filename = filename
+        self.levels = levels
+        self.num_top_modules = num_top_modules
+        self.num_leaf_modules = num_leaf_modules
+        self.codelength = codelength
+        self.codelengths = codelengths
+        self.completed_in = completed_in
+        self._columns = None
+        self._cache = {}
+
+    @property
+    def nodes(self) -> List[TreeNode]:
+        if self._nodes is None:
+            self._nodes = self._columns.materialize() if self._columns is not None else []
+            # the nodes may be mutated from now on
+            self._columns = None
+
+        return self._nodes
+
+    @nodes.setter
+    def nodes(self, nodes: List[TreeNode]):
+        self._nodes = nodes
+        self._columns = None
+        self.invalidate()
+
+    @property
+    def columns(self) -> TreeColumns:
+        if self._columns is not None:
+            return self._columns
+
+        if "columns" not in self._cache:
+            self._cache["columns"] = TreeColumns.from_nodes(self.nodes)
+
+        return self._cache["columns"]
+
+    def invalidate(self):
+        """
+        Drop the cached columns and overlap statistics.
+
+        Setting nodes or columns does this automatically,
+        call it after mutating the nodes in place.
+        """
+        self._cache.clear()
+
+    def __eq__(self, other):
+        if not isinstance(other, Tree):
+            return NotImplemented
+
+        return all(getattr(self, f.name) == getattr(other, f.name) for f in fields(self) if f.compare) \
+               and self.nodes == other.nodes
+
+    @property
+    def num_nodes(self) -> int:
+        return len(self._columns) if self._columns is not None else len(self.nodes)
+
+    def set_columns(self, columns: TreeColumns):
+        self._nodes = None
+        self._columns = columns
+        self.invalidate()
+
+    @classmethod
+    def from_columns(cls, header: Optional[str], columns: TreeColumns, **kwargs):  # -> Tree
+        tree = cls(header, **kwargs)
+        tree.set_columns(columns)
+        return tree
 
     @property
     def pretty_filename(self) -> str:
@@ -127,13 +434,15 @@ class Tree:
         did_open = fp is None
 
         if did_open:
-            fp = open(self.filename, "w")
+            fp = open_file(self.filename, "w")
 
         if self.header is not None:
             fp.write(self.header)
 
-        for node in self.nodes:
-            node.write(fp)
+        if self._columns is not None:
+            self._columns.write(fp)
+        else:
+            write_lines(fp, map(TreeNode.to_str, self.nodes))
 
         if did_open:
             fp.close()
@@ -177,7 +486,7 @@ class Tree:
 
     @classmethod
     def from_file(cls, filename: str, **kwargs):  # -> Tree
-        with open(filename) as fp:
+        with open_file(filename) as fp:
             lines = fp.readlines()
 
             codelength, codelenghts, completed_in, levels, num_top_modules, num_leaf_modules, header = \
@@ -211,39 +520,65 @@ class Tree:
         if node_filter:
             nodes = filterfalse(node_filter, nodes)
 
-        return cls(header, list(map(TreeNode.from_str, nodes)), **kwargs)
+        return cls.from_columns(header, TreeColumns.from_lines(list(nodes)), **kwargs)
 
     @classmethod
-    def from_infomap(cls, im: Infomap, states=True, **kwargs):  # -> Tree:
-        tmp_filename = "/tmp/1nf0m4p.tree"
+    def from_infomap(cls,
+                     im: Infomap,
+                     states=True,
+                     node_filter: Optional[Callable[[str], bool]] = is_feature_node,
+                     **kwargs):  # -> Tree:
+        """
+        Build the tree from the leaf nodes of a finished Infomap run without any file I/O.
+        """
+        names = im.names
+        layer_ids = states and im.network.isMultilayerNetwork()
+
+        nodes = []
+
+        for node in im.get_tree(states=states):
+            if not node.is_leaf:
+                continue
 
-        im.write_tree(tmp_filename, states)
+            name = names.get(node.node_id) or str(node.node_id)
 
-        self = cls.from_file(tmp_filename, **kwargs)
+            if node_filter and node_filter(name):
+                continue
 
-        os.remove(tmp_filename)
+            nodes.append(TreeNode(tuple(node.path),
+                                  node.flow,
+                                  name,
+                                  node.node_id,
+                                  node.state_id if states else None,
+                                  node.layer_id if layer_ids else None))
 
-        return self
+        metadata = dict(levels=im.max_depth,
+                        num_top_modules=im.num_top_modules,
+                        num_leaf_modules=im.num_leaf_modules,
+                        codelength=im.codelength,
+                        codelengths=tuple(im.codelengths))
 
-    @property
-    def assignments(self) -> Mapping[str, int]:
-        assignments_ = defaultdict(set)
+        metadata.update(kwargs)
 
-        for node in self.nodes:
-            assignments_[node.name].add(node.leaf_module)
+        return cls(None, nodes, **metadata)
 
-        return {name: len(assignments)
-                for name, assignments in assignments_.items()}
+    def overlap(self, level: ModuleLevel = Level.LEAF_MODULE) -> Overlap:
+        key = "overlap", level.name if isinstance(level, Level) else level
 
-    @property
-    def effective_assignments(self) -> Mapping[str, float]:
-        assignments_ = defaultdict(lambda: defaultdict(int))
+        if key not in self._cache:
+            self._cache[key] = self.columns.overlap(level)
 
-        for node in self.nodes:
-            assignments_[node.name][node.leaf_module] += 1
+        return self._cache[key]
 
-        return {name: 2 ** entropy(list(node_assignments.values()), base=2)
-                for name, node_assignments in assignments_.items()}
+    @property
+    def assignments(self) -> Mapping[str, int]:
+        names, assignments, _ = self.overlap()
+        return dict(zip(names, assignments.tolist()))
+
+    @property
+    def effective_assignments(self) -> Mapping[str, float]:
+        names, _, effective_assignments = self.overlap()
+        return dict(zip(names, effective_assignments.tolist()))
 
     def initial_partition(self, network: StateNetwork) -> Dict[int, int]:
         tree_nodes = {node.id: node for node in self.nodes}
@@ -267,19 +602,31 @@ class Tree:
                         for state_id, node_id in network.states
                         if node_id in tree_nodes)
 
-        return Tree(sorted(mapped_nodes, key=attrgetter("path")))
+        return Tree(None, sorted(mapped_nodes, key=attrgetter("path")))
 
     def physical_nodes(self, level=1):
-        phys_nodes: Dict[str, Dict[int, TreeNode]] = defaultdict(dict)
+        key = "physical_flow", level
 
-        for node in self.nodes:
-            module = ":".join(map(str, node.path[0:level]))
-            if node.id not in phys_nodes[module]:
-                phys_nodes[module][node.id] = TreeNode(node.path[0:level], node.flow, node.name, node.id)
+        if key not in self._cache:
+            self._cache[key] = self.columns.physical_flow(level)
 
-            else:
-                phys_node = phys_nodes[module][node.id]
-                phys_node.flow += node.flow
+        first, flow = self._cache[key]
+
+        columns = self.columns
+        names = columns.name_table
+        starts = columns.path_offsets[first]
+        ends = np.minimum(starts + level, columns.path_offsets[first + 1])
+        path_modules = columns.path_modules.tolist()
+
+        phys_nodes: Dict[str, Dict[int, TreeNode]] = defaultdict(dict)
+
+        for start, end, name, node_id, flow_ in zip(starts.tolist(),
+                                                    ends.tolist(),
+                                                    columns.name_index[first].tolist(),
+                                                    columns.node_id[first].tolist(),
+                                                    flow.tolist()):
+            path = tuple(path_modules[start:end])
+            phys_nodes[":".join(map(str, path))][node_id] = TreeNode(path, flow_, names[name], node_id)
 
         return dict(phys_nodes)
 
@@ -294,63 +641,145 @@ class Tree:
                 self._match_network_ids(network)
 
     def _match_multilayer_ids(self, network) -> None:
-        state_ids = {(node.id, node.layer_id): node.state_id for node in self.nodes}
+        states, columns = self.columns, network.columns
 
-        for node in network.nodes:
-            node.state_id = state_ids[node.id, node.layer_id]
+        if states.state_id is None or states.layer_id is None or columns.layer_id is None:
+            raise RuntimeError("Matching multilayer ids needs state and layer ids")
 
-        network_state_ids = {node.state_id for node in network.nodes}
+        state_ids = states.state_id[_join_ids((states.node_id, states.layer_id),
+                                              (columns.node_id, columns.layer_id))]
 
-        missing_nodes = (node for node in self.nodes
-                         if node.state_id not in network_state_ids)
+        missing = np.flatnonzero(~np.isin(states.state_id, state_ids))
 
-        first_free_module_id = max(map(attrgetter("top_module"), network.nodes)) + 1
+        first_free_module_id = columns.path_modules[columns.path_offsets[:-1]].max() + 1
 
-        network.nodes.extend(TreeNode((first_free_module_id + i, 1),
-                                      0,
-                                      missing_node.name,
-                                      missing_node.id,
-                                      missing_node.state_id)
-                             for i, missing_node in enumerate(missing_nodes))
+        matched = TreeColumns(columns.path_offsets,
+                              columns.path_modules,
+                              columns.flow,
+                              columns.node_id,
+                              state_ids,
+                              columns.layer_id,
+                              columns.name_table,
+                              columns.name_index)
+
+        if len(missing) == 0:
+            network.set_columns(matched)
+            return
+
+        # the added nodes have no layer ids, so they are kept as TreeNode objects
+        names = states.names
+
+        network.nodes = matched.materialize() + [TreeNode((first_free_module_id + i, 1),
+                                                          0,
+                                                          names[missing_node],
+                                                          node_id,
+                                                          state_id)
+                                                 for i, (missing_node, node_id, state_id)
+                                                 in enumerate(zip(missing.tolist(),
+                                                                  states.node_id[missing].tolist(),
+                                                                  states.state_id[missing].tolist()))]
 
     def _match_network_ids(self, network) -> None:
-        self_state_nodes = defaultdict(list)
+        states, columns = self.columns, network.columns
 
-        for node in self.nodes:
-            self_state_nodes[node.id].append(node)
+        if states.state_id is None:
+            raise RuntimeError("Matching network ids needs state ids")
 
-        self_state_nodes = dict(self_state_nodes)
+        # state nodes grouped by node id, in tree order within each group
+        order = np.argsort(states.node_id, kind="stable")
+        group_ids, group_starts, group_sizes = np.unique(states.node_id[order],
+                                                         return_index=True,
+                                                         return_counts=True)
 
-        missing_nodes = []
+        group = _join_ids((group_ids,), (columns.node_id,))
+        num_states = group_sizes[group]
+        first = order[group_starts[group]]
 
-        # 0. we need to set the leaf node index correctly
-        path = make_indexed_path(network.nodes)
+        # divide the flow between the state nodes unless it is already split
+        state_flow = np.add.reduceat(states.flow[order], group_starts)[group] if len(order) else np.zeros(0)
+        divide_flow = np.abs(columns.flow - state_flow) > 0.01 * np.maximum(np.abs(columns.flow),
+                                                                            np.abs(state_flow))
 
-        for node in network.nodes:
-            # 1. set the state id of the already existing node
-            # 2. add nodes for each remaining state node
-            # 3. divide the flow between them
-            state_nodes = self_state_nodes[node.id]
+        flow = np.where(divide_flow, columns.flow / num_states, states.flow[first])
 
-            first, *remaining = state_nodes
-            node.state_id = first.state_id
+        # one new node for each remaining state node
+        source = np.repeat(np.arange(len(columns)), num_states - 1)
+        remaining = order[np.repeat(group_starts[group] + 1, num_states - 1)
+                          + _ranks(np.repeat(np.arange(len(columns)), num_states - 1))]
 
-            divide_flow = not math.isclose(node.flow, sum(node.flow for node in state_nodes), rel_tol=0.01)
+        new_flow = np.where(divide_flow[source], flow[source], states.flow[remaining])
 
-            if divide_flow:
-                node.flow /= len(state_nodes)
-            else:
-                node.flow = first.flow
+        # new leaf indices continue after the last node in each module
+        module_ids = columns.module_ids(Level.LEAF_MODULE)
+        module_sizes = np.bincount(module_ids, minlength=module_ids.max(initial=-1) + 1)
+        leaf_index = module_sizes[module_ids[source]] + _ranks(module_ids[source]) + 1
+
+        depth = columns.depth
+        new_depth = depth[source]
+
+        paths = columns.padded_paths()
+        new_paths = paths[source]
+        new_paths[np.arange(len(source)), new_depth - 1] = leaf_index
+
+        paths = np.vstack((paths, new_paths))
+        depth = np.concatenate((depth, new_depth))
+
+        # zero padding sorts shorter paths first, like tuples
+        sort = np.lexsort(paths.T[::-1])
+        paths, depth = paths[sort], depth[sort]
+
+        network.set_columns(TreeColumns(np.concatenate(([0], np.cumsum(depth))),
+                                        paths[np.arange(paths.shape[1]) < depth[:, np.newaxis]],
+                                        np.concatenate((flow, new_flow))[sort],
+                                        np.concatenate((columns.node_id, columns.node_id[source]))[sort],
+                                        np.concatenate((states.state_id[first], states.state_id[remaining]))[sort],
+                                        None,
+                                        columns.name_table,
+                                        np.concatenate((columns.name_index, columns.name_index[source]))[sort]))
+
+
+def _ranks(labels: np.ndarray) -> np.ndarray:
+    """Position of each element among the elements with the same label, in order."""
+    order = np.argsort(labels, kind="stable")
+    sorted_labels = labels[order]
+
+    starts = np.flatnonzero(np.r_[True, sorted_labels[1:] != sorted_labels[:-1]])
+
+    ranks = np.empty(len(labels), dtype=np.int64)
+    ranks[order] = np.arange(len(labels)) - np.repeat(starts, np.diff(np.r_[starts, len(labels)]))
+    return ranks
+
+
+def _join_ids(keys: Tuple[np.ndarray, ...], lookup: Tuple[np.ndarray, ...]) -> np.ndarray:
+    """
+    Index of the row in keys matching each row in lookup.
+
+    Like a dict from keys to index, the last duplicate key wins.
+    Raises KeyError for lookup rows without a match.
+    """
+    num_keys = len(keys[0])
+
+    # combine the key columns into one integer code per row
+    codes = np.zeros(num_keys + len(lookup[0]), dtype=np.int64)
+
+    for key, other in zip(keys, lookup):
+        values, inverse = np.unique(np.concatenate((key, other)), return_inverse=True)
+        codes = codes * len(values) + inverse
+
+    key_codes, lookup_codes = codes[:num_keys], codes[num_keys:]
+
+    order = np.argsort(key_codes, kind="stable")
+    sorted_codes = key_codes[order]
+
+    position = np.searchsorted(sorted_codes, lookup_codes, side="right") - 1
+    found = position >= 0
+    found[found] = sorted_codes[position[found]] == lookup_codes[found]
 
-            missing_nodes.extend(TreeNode(path(node),
-                                          node.flow if divide_flow else state_node.flow,
-                                          node.name,
-                                          node.id,
-                                          state_node.state_id)
-                                 for state_node in remaining)
+    if not np.all(found):
+        missing = np.flatnonzero(~found)[0]
+        raise KeyError(tuple(other[missing].item() for other in lookup))
 
-        network.nodes.extend(missing_nodes)
-        network.nodes.sort(key=attrgetter("path"))
+    return order[position]
 
 
 def make_indexed_path(nodes: Optional[Iterable[TreeNode]] = None) -> Callable[[TreeNode], Path]:
@@ -1,35 +1,40 @@
-from itertools import product
-from multiprocessing import Pool
+from typing import Tuple
 
-import numpy as np
-
-from hypergraph import representation
-from hypergraph.main import run_infomap
 from hypergraph.network import HyperGraph, Node, HyperEdge, Gamma
+from hypergraph.sweep import Parameter, SAMPLINGS, grid_points, random_points, sweep, results_by_point
 
+REPRESENTATIONS = ("bipartite", "bipartite_non_backtracking",
+                   "unipartite_directed", "unipartite_directed_self_links",
+                   "multilayer", "multilayer_self_links",
+                   "multilayer_similarity", "multilayer_similarity_self_links")
 
-def run_task(hypergraph,
-             kind,
-             self_links: bool = False,
-             similarity_walk: bool = False,
-             non_backtracking: bool = False):
-    if kind == "unipartite":
-        network = representation.unipartite(hypergraph, directed=True, self_links=self_links)
-    elif kind == "bipartite":
-        network = representation.bipartite(hypergraph, non_backtracking=non_backtracking)
-    elif kind == "multilayer":
-        network = representation.multilayer(hypergraph, similarity_walk=similarity_walk, self_links=self_links)
-    else:
-        raise RuntimeError(f"No such {kind = }")
-
-    args = "--bipartite-teleportation" if kind == "bipartite" else None
-
-    im = run_infomap(network, args=args, self_links=self_links, two_level=True)
 
-    return im.codelength, im.num_top_modules
+def gamma_parameter(value: str) -> Tuple[int, int]:
+    edge, node = value.split(":")
+    return int(edge), int(node)
 
 
 def main():
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(prog="optimize_weights",
+                            description="Sweep the hyperedge and vertex weights of the example hypergraph. "
+                                        "Running again with the same log resumes the sweep.")
+
+    parser.add_argument("--log", default="optimize_weights.jsonl", help="file to append the results to")
+    parser.add_argument("-j", "--num-workers", type=int, help="number of processes, all cores by default")
+    parser.add_argument("--sampling", choices=SAMPLINGS, default="grid")
+    parser.add_argument("--num-steps", type=int, default=3, help="values per parameter with grid sampling")
+    parser.add_argument("--num-samples", type=int, default=100, help="number of points with random sampling")
+    parser.add_argument("-s", "--seed", type=int, default=0, help="random seed for random sampling")
+    parser.add_argument("--edges", type=int, nargs="*", default=[1, 2, 4], help="hyperedges to vary omega of")
+    parser.add_argument("--gammas", type=gamma_parameter, nargs="*", default=[], metavar="EDGE:NODE",
+                        help="vertex weights to vary")
+    parser.add_argument("--low", type=float, default=1.0, help="lowest weight")
+    parser.add_argument("--high", type=float, default=3.0, help="highest weight")
+
+    args = parser.parse_args()
+
     nodes = [
         Node(1, "a"),
         Node(2, "b"),
@@ -79,22 +84,25 @@ def main():
         5: [7, 8, 9, 10]
     }
 
-    # edges to optimize
-    edge_ids = [1, 2, 4]
+    # known fix-points, the other hyperedges are swept
+    omega = {1: 1.0, 2: 1.0, 3: 2.0, 4: 1.0, 5: 3.0}
 
-    nodes_by_edge = {edge: frozenset(nodes[i - 1] for i in node_ids)
-                     for edge, node_ids in hyperedges.items()}
+    edges = [HyperEdge(edge, frozenset(nodes[i - 1] for i in node_ids), omega[edge])
+             for edge, node_ids in hyperedges.items()]
 
-    hypergraph = HyperGraph(nodes, [], weights)
+    hypergraph = HyperGraph(nodes, edges, weights)
 
-    num_trials = 0
+    parameters = [Parameter(edge, low=args.low, high=args.high) for edge in args.edges]
+    parameters.extend(Parameter(edge, node, args.low, args.high) for edge, node in args.gammas)
+
+    if args.sampling == "grid":
+        points = grid_points(parameters, args.num_steps)
+    else:
+        points = random_points(parameters, args.num_samples, args.seed)
 
-    index = {name: i for i, name in enumerate([
-        "bipartite", "bipartite non bt",
-        "unipartite", "unipartite self links",
-        "multilayer", "multilayer self links",
-        "multilayer similarity", "multilayer similarity self links"
-    ])}
+    results = sweep(hypergraph, parameters, points, REPRESENTATIONS, args.log, args.num_workers)
+
+    num_trials = 0
 
     solutions = []
 
@@ -103,63 +111,41 @@ def main():
     num_multilayer_better = 0
     num_multilayer_self_links_better = 0
 
-    with Pool(processes=8) as pool:
-        for omegas in product(np.linspace(1, 3, 3), repeat=len(edge_ids)):
-            omega = dict(zip(edge_ids, omegas))
-
-            # known fix-points
-            omega[3] = 2.0
-            omega[5] = 3.0
-
-            hypergraph.edges = [HyperEdge(edge, nodes_by_edge[edge], omega[edge])
-                                for edge in hyperedges]
-
-            tasks = (
-                (hypergraph, "bipartite", None, None, False),
-                (hypergraph, "bipartite", None, None, True),
-                (hypergraph, "unipartite", False),
-                (hypergraph, "unipartite", True),
-                (hypergraph, "multilayer", False),
-                (hypergraph, "multilayer", True),
-                (hypergraph, "multilayer", False, True),
-                (hypergraph, "multilayer", True, True),
-            )
-
-            results = pool.starmap(run_task, tasks)
-
-            num_trials += 1
+    for point, point_results in results_by_point(results).items():
+        codelengths = {name: result.codelength for name, result in point_results.items()}
+        num_top_modules = {name: result.num_top_modules for name, result in point_results.items()}
 
-            codelengths, num_top_modules = zip(*results)
+        num_trials += 1
 
-            all_non_trivial_solutions = all(map(lambda x: x > 1, num_top_modules))
+        all_non_trivial_solutions = all(map(lambda x: x > 1, num_top_modules.values()))
 
-            if not all_non_trivial_solutions:
-                continue
+        if not all_non_trivial_solutions:
+            continue
 
-            num_non_trivial_solutions += 1
+        num_non_trivial_solutions += 1
 
-            multilayer_similarity_ok = num_top_modules[index["multilayer similarity"]] > 3 and \
-                                       num_top_modules[index["multilayer similarity self links"]] > 3
+        multilayer_similarity_ok = num_top_modules["multilayer_similarity"] > 3 and \
+                                   num_top_modules["multilayer_similarity_self_links"] > 3
 
-            if not multilayer_similarity_ok:
-                continue
+        if not multilayer_similarity_ok:
+            continue
 
-            multilayer_similarity_oks += 1
+        multilayer_similarity_oks += 1
 
-            codelength_better = abs(codelengths[index["multilayer"]] - codelengths[index["unipartite"]]) > 1e-7
-            self_links_codelength_better = abs(codelengths[index["multilayer self links"]] - codelengths[index["unipartite self links"]]) > 1e-7
+        codelength_better = abs(codelengths["multilayer"] - codelengths["unipartite_directed"]) > 1e-7
+        self_links_codelength_better = abs(codelengths["multilayer_self_links"] - codelengths["unipartite_directed_self_links"]) > 1e-7
 
-            same_num_top_modules = num_top_modules[index["multilayer"]] == num_top_modules[index["unipartite"]]
-            same_num_top_modules_self_links = num_top_modules[index["multilayer self links"]] == num_top_modules[index["unipartite self links"]]
+        same_num_top_modules = num_top_modules["multilayer"] == num_top_modules["unipartite_directed"]
+        same_num_top_modules_self_links = num_top_modules["multilayer_self_links"] == num_top_modules["unipartite_directed_self_links"]
 
-            multilayer_better = codelength_better and same_num_top_modules
-            multilayer_self_links_better = self_links_codelength_better and same_num_top_modules_self_links
+        multilayer_better = codelength_better and same_num_top_modules
+        multilayer_self_links_better = self_links_codelength_better and same_num_top_modules_self_links
 
-            num_multilayer_better += 1 if multilayer_better else 0
-            num_multilayer_self_links_better += 1 if multilayer_self_links_better else 0
+        num_multilayer_better += 1 if multilayer_better else 0
+        num_multilayer_self_links_better += 1 if multilayer_self_links_better else 0
 
-            if multilayer_better or multilayer_self_links_better:
-                solutions.append(omega)
+        if multilayer_better or multilayer_self_links_better:
+            solutions.append({parameter.name: value for parameter, value in zip(parameters, points[point])})
 
     for solution in solutions:
         print(solution)
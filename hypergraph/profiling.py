@@ -0,0 +1,210 @@
+import cProfile
+import json
+import os
+import resource
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from dataclasses import dataclass, field, asdict
+from typing import Dict, List, Optional, Iterator
+
+DUMPS = ("cprofile", "pyinstrument")
+
+# ru_maxrss is in kilobytes on Linux and in bytes on macOS
+_RSS_UNIT = 1 if sys.platform == "darwin" else 1 << 10
+
+
+def max_rss() -> int:
+    """Peak resident set size of the process so far, in bytes."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * _RSS_UNIT
+
+
+@dataclass
+class StageStats:
+    """
+    Time, memory and item counts of one stage of a run.
+
+    max_rss is the peak resident set size of the process at the end of the stage,
+    and rss_growth how much the stage raised it. peak_traced is the peak of the
+    memory allocated by Python during the stage, if tracemalloc was enabled.
+    cpu_time is the CPU time of this process, not of its worker processes.
+    The label tells apart stages with the same name, e.g. the output basename.
+    """
+    name: str
+    label: Optional[str] = None
+    wall_time: float = 0.0
+    cpu_time: float = 0.0
+    max_rss: int = 0
+    rss_growth: int = 0
+    peak_traced: Optional[int] = None
+    counts: Dict[str, int] = field(default_factory=dict)
+
+    def count(self, **counts):
+        self.counts.update((name, int(value)) for name, value in counts.items())
+
+
+class Profiler:
+    """
+    Records the stages of a run, see stage.
+
+    With trace_memory, tracemalloc records the peak Python allocations of each stage,
+    which slows down the run. With dump set to "cprofile" or "pyinstrument", every stage
+    is profiled and the profile is written to dump_dir/<stage>.prof or .html.
+    """
+
+    def __init__(self, trace_memory: bool = False, dump: Optional[str] = None, dump_dir: Optional[str] = None):
+        if dump is not None and dump not in DUMPS:
+            raise ValueError(f"Unknown profile dump {dump}, must be one of {', '.join(DUMPS)}")
+
+        self.trace_memory = trace_memory
+        self.dump = dump
+        self.dump_dir = dump_dir
+        self.stages: List[StageStats] = []
+        self._start = time.perf_counter()
+
+        # peak traced memory of the enclosing stages, nested stages reset the peak
+        self._traced_peaks: List[int] = []
+        self._dumping = False
+
+    @property
+    def options(self) -> Dict:
+        """Arguments to create a profiler with the same settings, e.g. in a worker process."""
+        return dict(trace_memory=self.trace_memory, dump=self.dump, dump_dir=self.dump_dir)
+
+    @contextmanager
+    def stage(self, name: str, label: Optional[str] = None, **counts) -> Iterator[StageStats]:
+        stats = StageStats(name, label)
+        stats.count(**counts)
+        self.stages.append(stats)
+
+        # tracing slows down everything after it, stop it with the stage that started it
+        started_tracing = self.trace_memory and not tracemalloc.is_tracing()
+
+        if self.trace_memory:
+            if started_tracing:
+                tracemalloc.start()
+
+            if self._traced_peaks:
+                self._traced_peaks[-1] = max(self._traced_peaks[-1], tracemalloc.get_traced_memory()[1])
+
+            tracemalloc.reset_peak()
+            self._traced_peaks.append(0)
+
+        rss_before = max_rss()
+        start_cpu = time.process_time()
+        start = time.perf_counter()
+
+        try:
+            with self._dumped(name, label):
+                yield stats
+        finally:
+            stats.wall_time = time.perf_counter() - start
+            stats.cpu_time = time.process_time() - start_cpu
+            stats.max_rss = max_rss()
+            stats.rss_growth = stats.max_rss - rss_before
+
+            if self.trace_memory:
+                stats.peak_traced = max(self._traced_peaks.pop(), tracemalloc.get_traced_memory()[1])
+
+                if self._traced_peaks:
+                    self._traced_peaks[-1] = max(self._traced_peaks[-1], stats.peak_traced)
+
+                if started_tracing:
+                    tracemalloc.stop()
+                else:
+                    tracemalloc.reset_peak()
+
+    @contextmanager
+    def _dumped(self, name: str, label: Optional[str] = None):
+        # profilers can not be nested, only the outermost stage is dumped
+        if self.dump is None or self._dumping:
+            yield
+            return
+
+        os.makedirs(self.dump_dir or ".", exist_ok=True)
+        filename = os.path.join(self.dump_dir or ".", f"{label}_{name}" if label else name)
+
+        self._dumping = True
+
+        try:
+            if self.dump == "cprofile":
+                profile = cProfile.Profile()
+                profile.enable()
+                try:
+                    yield
+                finally:
+                    profile.disable()
+                    profile.dump_stats(filename + ".prof")
+            else:
+                profile = _pyinstrument().Profiler()
+                profile.start()
+                try:
+                    yield
+                finally:
+                    profile.stop()
+                    with open(filename + ".html", "w") as fp:
+                        fp.write(profile.output_html())
+        finally:
+            self._dumping = False
+
+    def report(self) -> Dict:
+        return dict(argv=sys.argv,
+                    wall_time=time.perf_counter() - self._start,
+                    max_rss=max_rss(),
+                    stages=[asdict(stats) for stats in self.stages])
+
+    def write(self, filename: str):
+        with open(filename, "w") as fp:
+            json.dump(self.report(), fp, indent=2)
+
+        print(f"[profile] wrote {filename}")
+
+
+def _pyinstrument():
+    try:
+        import pyinstrument
+    except ImportError:
+        raise ImportError("Profile dumps with pyinstrument need the pyinstrument package") from None
+
+    return pyinstrument
+
+
+_profiler: Optional[Profiler] = None
+
+
+def active_profiler() -> Optional[Profiler]:
+    return _profiler
+
+
+@contextmanager
+def profiling(profiler: Optional[Profiler]) -> Iterator[Optional[Profiler]]:
+    """Record the stages of the run in profiler while in the context, does nothing if profiler is None."""
+    global _profiler
+    previous, _profiler = _profiler, profiler
+
+    try:
+        yield profiler
+    finally:
+        _profiler = previous
+
+
+@contextmanager
+def stage(name: str, label: Optional[str] = None, **counts) -> Iterator[StageStats]:
+    """
+    Record the stage in the active profiler.
+
+    The stats are yielded so that item counts known at the end of the stage can be added:
+
+        with stage("read") as stats:
+            hypergraph = read_hypergraph(file)
+            stats.count(nodes=len(hypergraph.nodes))
+
+    Without an active profiler, the stats are not recorded and the stage costs nothing.
+    """
+    if _profiler is None:
+        yield StageStats(name, label)
+        return
+
+    with _profiler.stage(name, label, **counts) as stats:
+        yield stats
@@ -1,19 +1,24 @@
 from collections import defaultdict
 from operator import attrgetter
-from typing import Union
+from typing import Union, Optional
 
 from hypergraph.network import HyperGraph, StateNode, Node, BipartiteNetwork, BipartiteStateNetwork
-from hypergraph.transition import gamma, d, pi
+from hypergraph.transition import gamma, d, pi, omega, TransitionModel
 
 
-def create_network(hypergraph: HyperGraph, non_backtracking: bool) -> Union[BipartiteNetwork, BipartiteStateNetwork]:
+def create_network(hypergraph: HyperGraph,
+                   non_backtracking: bool,
+                   model: Optional[TransitionModel] = None) -> Union[BipartiteNetwork, BipartiteStateNetwork]:
     nodes, edges, weights = hypergraph
 
     print("[bipartite] creating bipartite...")
 
-    gamma_ = gamma(weights)
-    d_ = d(edges)
-    pi_ = pi(edges, weights)
+    model = model or TransitionModel.from_hypergraph(hypergraph)
+
+    omega_ = omega(edges, model)
+    gamma_ = gamma(weights, model)
+    d_ = d(edges, model)
+    pi_ = pi(edges, weights, model)
 
     bipartite_start_id = max(map(attrgetter("id"), nodes)) + 1
 
@@ -41,7 +46,7 @@ def create_network(hypergraph: HyperGraph, non_backtracking: bool) -> Union[Bipa
             states.extend(feature_states)
 
             for node in edge.nodes:
-                P_ue = edge.omega / d_(node)
+                P_ue = omega_(edge) / d_(node)
                 P_ev = gamma_(edge, node)
 
                 if P_ue * P_ev < 1e-10:
@@ -64,7 +69,7 @@ def create_network(hypergraph: HyperGraph, non_backtracking: bool) -> Union[Bipa
     else:
         for edge in edges:
             for node in edge.nodes:
-                P_ue = edge.omega / d_(node)
+                P_ue = omega_(edge) / d_(node)
                 P_ev = gamma_(edge, node)
 
                 if P_ue * P_ev < 1e-10:
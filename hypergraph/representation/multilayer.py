@@ -1,49 +1,224 @@
+import os
+import shutil
+import tempfile
 from collections import defaultdict
-from itertools import product
-from typing import Callable
+from typing import Callable, List, Union, Optional, Iterable, Tuple, Iterator, TextIO
 
 import numpy as np
+from scipy.sparse import csr_matrix, diags
 from scipy.stats import entropy
 from sklearn.preprocessing import normalize
 
-from hypergraph.network import HyperGraph, MultilayerNetwork, HyperEdge, Node
-from hypergraph.transition import pi_alpha, gamma, delta, E, d
+from hypergraph.network import HyperGraph, MultilayerNetwork, HyperEdge, Node, MultiLayerLink, LinkArray, \
+    NetworkFile, open_file, write_lines
+from hypergraph.transition import TransitionModel, expand_rows
 
+# (alpha, u, beta, v, weight) index arrays of the links from one vertex
+Block = Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]
 
-def create_random_walk(hypergraph: HyperGraph, self_links: bool) -> MultilayerNetwork:
-    nodes, edges, weights = hypergraph
 
-    gamma_ = gamma(weights)
-    pi_alpha_ = pi_alpha(weights)
-    delta_ = delta(weights)
-    d_ = d(edges)
-    E_ = E(edges)
+def create_random_walk(hypergraph: HyperGraph,
+                       self_links: bool,
+                       columnar: bool = False,
+                       model: Optional[TransitionModel] = None,
+                       filename: Optional[str] = None) -> Union[MultilayerNetwork, NetworkFile]:
+    """
+    Links (alpha, u) -> (beta, v) for every beta \in E(u) and v \in beta.
 
-    links = []
+    For each vertex u, the block of links is the outer product of
+    :math:`\pi_\alpha(u)` over alpha \in E(u) and :math:`P_{u,v}` over (beta, v).
 
-    for alpha, beta in product(edges, edges):
-        for u, v in product(alpha.nodes, beta.nodes):
-            if not self_links and u.id == v.id:
-                continue
+    If filename is given, the links are streamed to the file, see write_network.
+    """
+    nodes, _, _ = hypergraph
 
-            if beta.id not in E_(u, v):
-                continue
+    model = model or TransitionModel.from_hypergraph(hypergraph)
 
-            delta_e = delta_(beta) if self_links else delta_(beta) - gamma_(beta, u)
+    blocks = random_walk_blocks(model, self_links)
 
-            P_uv = beta.omega / d_(u) * gamma_(beta, v) / delta_e
+    if filename is not None:
+        return write_network(filename, nodes, model, blocks)
 
-            if P_uv < 1e-10:
-                continue
+    return MultilayerNetwork(nodes, multilayer_links(model, blocks, columnar))
 
-            weight = pi_alpha_(alpha, u) * P_uv
 
-            links.append((alpha.id, u.id, beta.id, v.id, weight))
+def random_walk_blocks(model: TransitionModel,
+                       self_links: bool,
+                       sources: Optional[Iterable[int]] = None) -> Iterator[Block]:
+    """Blocks of links from the vertex indices in sources, or from every vertex if None."""
+    for u in sources if sources is not None else range(model.num_nodes):
+        E_u = model.edges_of(u)
 
-    links = [((e1, u), (e2, v), w)
-             for e1, u, e2, v, w in sorted(links)]
+        if len(E_u) == 0:
+            continue
 
-    return MultilayerNetwork(nodes, links)
+        gamma_u = model.gamma_at(E_u, np.full_like(E_u, u))
+
+        i, v, gamma_beta_v = model.members(E_u)
+        beta = E_u[i]
+
+        delta_e = model.delta[beta] if self_links else model.delta[beta] - gamma_u[i]
+
+        P_uv = model.omega[beta] / model.d[u] * gamma_beta_v / delta_e
+
+        keep = P_uv >= 1e-10
+
+        if not self_links:
+            keep &= v != u
+
+        beta, v, P_uv = beta[keep], v[keep], P_uv[keep]
+
+        pi_alpha_u = model.omega[E_u] * gamma_u
+
+        yield (np.repeat(E_u, len(P_uv)),
+               np.full(len(E_u) * len(P_uv), u),
+               np.tile(beta, len(E_u)),
+               np.tile(v, len(E_u)),
+               np.outer(pi_alpha_u, P_uv).ravel())
+
+
+def block_links(model: TransitionModel, blocks: Iterable[Block]) -> LinkArray:
+    """Concatenates blocks of (alpha, u, beta, v, weight) index arrays into sorted links."""
+    blocks = list(blocks)
+
+    if blocks:
+        alpha, u, beta, v, weight = map(np.concatenate, zip(*blocks))
+    else:
+        alpha, u, beta, v, weight = (np.empty(0, dtype=int),) * 4 + (np.empty(0),)
+
+    return LinkArray(model.node_ids[u],
+                     model.node_ids[v],
+                     weight,
+                     model.edge_ids[alpha],
+                     model.edge_ids[beta]).sorted()
+
+
+def multilayer_links(model: TransitionModel,
+                     blocks: Iterable[Block],
+                     columnar: bool = False) -> Union[List[MultiLayerLink], LinkArray]:
+    links = block_links(model, blocks)
+
+    if columnar:
+        return links
+
+    return [link for chunk in links.chunks() for link in chunk]
+
+
+# links kept in memory at once when streaming the links to a file
+STREAM_CHUNK_SIZE = 1 << 23
+
+_LINK_RECORD = np.dtype([("alpha", np.int64),
+                         ("u", np.int64),
+                         ("beta", np.int64),
+                         ("v", np.int64),
+                         ("weight", np.float64)])
+
+
+def layer_buckets(model: TransitionModel, chunk_size: int = STREAM_CHUNK_SIZE) -> np.ndarray:
+    """
+    Bucket of each layer index, consecutive layers with about chunk_size links in total per bucket.
+
+    The links from layer alpha are bounded by the sum of |beta| for beta in E(u), over u in alpha.
+    """
+    edge_sizes = np.asarray(model.incidence.sum(axis=1)).ravel()
+    layer_links = model.incidence @ (model.incidence.T @ edge_sizes)
+    first_link = np.cumsum(layer_links) - layer_links
+
+    return np.unique(first_link // chunk_size, return_inverse=True)[1].ravel()
+
+
+def write_sorted_links(fp: TextIO,
+                       model: TransitionModel,
+                       blocks: Iterable[Block],
+                       tmpdir: str,
+                       chunk_size: int = STREAM_CHUNK_SIZE) -> int:
+    """
+    Write the links of the blocks in the order of LinkArray.sorted, keeping about chunk_size links in memory.
+
+    The links are sorted out of core by distribution: batches of blocks are split by the bucket
+    of their source layer and appended to one run file per bucket in tmpdir. Since the links are
+    sorted by source layer first, sorting each bucket in memory and writing the buckets in order
+    sorts all links. Returns the number of links written.
+    """
+    bucket_of_layer = layer_buckets(model, chunk_size)
+    num_buckets = bucket_of_layer.max(initial=-1) + 1
+    bucket_filenames = [os.path.join(tmpdir, f"bucket_{i}.bin") for i in range(num_buckets)]
+
+    def flush(batch: List[Block]):
+        records = np.empty(sum(len(block[0]) for block in batch), dtype=_LINK_RECORD)
+
+        for name, column in zip(_LINK_RECORD.names, zip(*batch)):
+            records[name] = np.concatenate(column)
+
+        buckets = bucket_of_layer[records["alpha"]]
+        order = np.argsort(buckets, kind="stable")
+        records = records[order]
+
+        bounds = np.searchsorted(buckets[order], np.arange(num_buckets + 1))
+
+        for i in np.flatnonzero(np.diff(bounds)):
+            with open(bucket_filenames[i], "ab") as bucket:
+                records[bounds[i]:bounds[i + 1]].tofile(bucket)
+
+    batch, batch_size = [], 0
+
+    for block in blocks:
+        batch.append(block)
+        batch_size += len(block[0])
+
+        if batch_size >= chunk_size:
+            flush(batch)
+            batch, batch_size = [], 0
+
+    if batch:
+        flush(batch)
+
+    num_links = 0
+
+    for filename in bucket_filenames:
+        if not os.path.exists(filename):
+            continue
+
+        records = np.fromfile(filename, dtype=_LINK_RECORD)
+        os.remove(filename)
+
+        links = LinkArray(model.node_ids[records["u"]],
+                          model.node_ids[records["v"]],
+                          records["weight"],
+                          model.edge_ids[records["alpha"]],
+                          model.edge_ids[records["beta"]]).sorted()
+        links.write(fp)
+
+        num_links += len(links)
+
+    return num_links
+
+
+def write_network(filename: str,
+                  nodes: Iterable[Node],
+                  model: TransitionModel,
+                  blocks: Iterable[Block],
+                  chunk_size: int = STREAM_CHUNK_SIZE) -> NetworkFile:
+    """
+    Stream the network to filename, in the format of MultilayerNetwork.write.
+
+    The run files of the sort are written next to filename.
+    """
+    tmpdir = tempfile.mkdtemp(dir=os.path.dirname(os.path.abspath(filename)))
+
+    try:
+        with open_file(filename, "w") as fp:
+            fp.write("*Vertices\n")
+            write_lines(fp, (f"{node.id} \"{node.name}\"\n" for node in sorted(nodes)))
+            fp.write("*Multilayer\n")
+
+            num_links = write_sorted_links(fp, model, blocks, tmpdir, chunk_size)
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+    print(f"[multilayer] wrote {num_links} links to {filename}")
+
+    return NetworkFile(filename)
 
 
 SimilarityMetric = Callable[[HyperEdge, HyperEdge], float]
@@ -90,53 +265,167 @@ def make_js_similarity(gamma: Callable[[HyperEdge, Node], float]) -> SimilarityM
     return js_similarity
 
 
-def create_similarity_walk(hypergraph: HyperGraph, self_links: bool) -> MultilayerNetwork:
-    nodes, edges, weights = hypergraph
+def js_similarity_matrix(model: TransitionModel, edges: Optional[np.ndarray] = None) -> csr_matrix:
+    """
+    Pairwise Jensen-Shannon similarity 1 - JSD(p_e1, p_e2) for all hyperedges sharing a vertex,
+    where p_e is the l1-normalized gamma_e. If edges is given, only for the pairs of hyperedge indices in edges.
+
+    Vertices in only one of the hyperedges contribute their probability mass
+    to the divergence in full, so only shared vertices need to be visited:
+
+    .. math:: S(e_1, e_2) = \sum_{v \in e_1 \cap e_2} \frac{p + q}{2} - \frac{p}{2} \log_2 \frac{2p}{p + q} - \frac{q}{2} \log_2 \frac{2q}{p + q}
+
+    with p = p_{e_1}(v) and q = p_{e_2}(v).
+    """
+    if edges is None:
+        e, v, gamma_e_v = model.incident_gamma()
+    else:
+        edges = np.unique(edges)
+        i, v, gamma_e_v = model.members(edges)
+        e = edges[i]
+
+    p = csr_matrix((gamma_e_v, (e, v)), shape=(model.num_edges, model.num_nodes))
+    with np.errstate(divide="ignore"):
+        # rows of hyperedges outside edges are empty
+        p = diags(1 / np.asarray(abs(p).sum(axis=1)).ravel()) @ p
+    p = p.tocsc()
+
+    # all (e1, e2) pairs sharing a vertex, once per shared vertex
+    columns = np.repeat(np.arange(model.num_nodes), np.diff(p.indptr))
+    i, j = expand_rows(p.indptr, columns)
+
+    e1, e2 = p.indices[i], p.indices[j]
+    p_, q_ = p.data[i], p.data[j]
+
+    mix = p_ + q_
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        kl_p = np.where(p_ > 0, p_ * np.log2(2 * p_ / mix), 0.0)
+        kl_q = np.where(q_ > 0, q_ * np.log2(2 * q_ / mix), 0.0)
+
+    similarity = 0.5 * (mix - kl_p - kl_q)
+
+    return csr_matrix((similarity, (e1, e2)), shape=(model.num_edges,) * 2)
+
+
+def create_similarity_walk(hypergraph: HyperGraph,
+                           self_links: bool,
+                           columnar: bool = False,
+                           model: Optional[TransitionModel] = None,
+                           filename: Optional[str] = None) -> Union[MultilayerNetwork, NetworkFile]:
+    """
+    Links (alpha, u) -> (beta, v) for every beta \in E(u) and v \in beta,
+    choosing beta proportional to its similarity with alpha.
 
-    gamma_ = gamma(weights)
-    pi_alpha_ = pi_alpha(weights)
-    delta_ = delta(weights)
-    E_ = E(edges)
-    edges_ = {edge.id: edge for edge in edges}
+    .. math:: P^\alpha_{u,v} = \frac{ D_{\alpha,\beta} }{ S_\alpha(u) } \frac{ \gamma_\beta(v) }{ \delta(\beta) }
 
-    links = []
+    where :math:`D_{\alpha,\beta} = S(\alpha, \beta) \omega(\beta)` and
+    :math:`S_\alpha(u) = \sum_{\beta \in E(u)} D_{\alpha,\beta}`.
 
-    similarity = make_js_similarity(gamma_)
+    If filename is given, the links are streamed to the file, see write_network.
+    """
+    nodes, _, _ = hypergraph
 
-    for alpha, beta in product(edges, edges):
-        for u, v in product(alpha.nodes, beta.nodes):
-            if not self_links and u.id == v.id:
-                continue
+    model = model or TransitionModel.from_hypergraph(hypergraph)
 
-            if beta.id not in E_(u, v):
-                continue
+    blocks = similarity_walk_blocks(model, self_links)
 
-            E_u = {edges_[edge] for edge in E_(u)}
+    if filename is not None:
+        return write_network(filename, nodes, model, blocks)
 
-            S_alpha = sum(similarity(alpha, beta_) * beta_.omega for beta_ in E_u)
-            D_alpha_beta = similarity(alpha, beta) * beta.omega
+    return MultilayerNetwork(nodes, multilayer_links(model, blocks, columnar))
 
-            delta_e = delta_(beta) if self_links else delta_(beta) - gamma_(beta, u)
 
-            P_uv = D_alpha_beta / S_alpha * gamma_(beta, v) / delta_e
+def similarity_walk_blocks(model: TransitionModel,
+                           self_links: bool,
+                           sources: Optional[Iterable[int]] = None) -> Iterator[Block]:
+    """
+    Blocks of links from the vertex indices in sources, or from every vertex if None.
 
-            if P_uv < 1e-10:
-                continue
+    The similarities are only computed between the hyperedges incident to the sources.
+    """
+    if sources is None:
+        sources = range(model.num_nodes)
+        similarity = js_similarity_matrix(model)
+    else:
+        sources = np.asarray(sources, dtype=int)
+        edges = np.unique(model.incidence_csc[:, sources].indices)
+        similarity = js_similarity_matrix(model, edges)
 
-            weight = pi_alpha_(alpha, u) * P_uv
+    # edge x edge
+    D = similarity @ diags(model.omega)
 
-            links.append((alpha.id, u.id, beta.id, v.id, weight))
+    # edge x node, S_alpha(u) for alpha in E(u)
+    S = (D @ model.incidence).multiply(model.incidence).tocsc()
 
-    links = [((e1, u), (e2, v), w)
-             for e1, u, e2, v, w in sorted(links)]
+    for u in sources:
+        E_u = model.edges_of(u)
 
-    return MultilayerNetwork(nodes, links)
+        if len(E_u) == 0:
+            continue
 
+        gamma_u = model.gamma_at(E_u, np.full_like(E_u, u))
 
-def create_network(hypergraph: HyperGraph, similarity_walk: bool, **kwargs) -> MultilayerNetwork:
+        S_alpha = S[:, u].toarray().ravel()[E_u]
+
+        D_alpha_beta = D[E_u][:, E_u].toarray()
+
+        i, v, gamma_beta_v = model.members(E_u)
+        beta = E_u[i]
+
+        delta_e = model.delta[beta] if self_links else model.delta[beta] - gamma_u[i]
+
+        # alpha x (beta, v)
+        P_uv = D_alpha_beta[:, i] / S_alpha[:, np.newaxis] * (gamma_beta_v / delta_e)
+
+        keep = P_uv >= 1e-10
+
+        if not self_links:
+            keep &= v != u
+
+        alpha_index, beta_v_index = np.nonzero(keep)
+
+        pi_alpha_u = model.omega[E_u] * gamma_u
+
+        yield (E_u[alpha_index],
+               np.full(len(alpha_index), u),
+               beta[beta_v_index],
+               v[beta_v_index],
+               pi_alpha_u[alpha_index] * P_uv[alpha_index, beta_v_index])
+
+
+def create_network(hypergraph: HyperGraph, similarity_walk: bool, **kwargs) -> Union[MultilayerNetwork, NetworkFile]:
     print("[multilayer] creating multilayer...")
 
     if similarity_walk:
         return create_similarity_walk(hypergraph, **kwargs)
 
     return create_random_walk(hypergraph, **kwargs)
+
+
+def update_network(network: MultilayerNetwork,
+                   hypergraph: HyperGraph,
+                   model: TransitionModel,
+                   source_ids: np.ndarray,
+                   similarity_walk: bool,
+                   self_links: bool) -> MultilayerNetwork:
+    """
+    Update the network of the hypergraph before a change to the hypergraph and model after it,
+    recomputing only the links from the vertex ids in source_ids, in every layer.
+    """
+    print(f"[multilayer] updating links from {len(source_ids)} vertices...")
+
+    columnar = isinstance(network.links, LinkArray)
+    links = network.links if columnar else LinkArray.from_links(network.links)
+
+    sources = np.searchsorted(model.node_ids, source_ids[np.isin(source_ids, model.node_ids)])
+
+    blocks = similarity_walk_blocks(model, self_links, sources) if similarity_walk \
+        else random_walk_blocks(model, self_links, sources)
+
+    links = links.replace_sources(source_ids, block_links(model, blocks))
+
+    if not columnar:
+        links = [link for chunk in links.chunks() for link in chunk]
+
+    return MultilayerNetwork(hypergraph.nodes, links)
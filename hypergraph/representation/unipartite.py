@@ -1,39 +1,112 @@
-from itertools import combinations_with_replacement, product
+from typing import Optional
 
-from hypergraph.network import HyperGraph, Network
-from hypergraph.transition import w, P, pi
+import numpy as np
+from scipy.sparse import csr_matrix, diags
 
+from hypergraph.network import HyperGraph, Network, LinkArray
+from hypergraph.transition import TransitionModel
 
-def create_network(hypergraph: HyperGraph, directed: bool, self_links: bool) -> Network:
+
+def create_network(hypergraph: HyperGraph,
+                   directed: bool,
+                   self_links: bool,
+                   columnar: bool = False,
+                   model: Optional[TransitionModel] = None) -> Network:
+    """
+    Projects the hypergraph as a sparse product over hyperedges.
+
+    Directed:
+
+    .. math:: w_{u,v} = \pi(u) \sum_{e \in E(u,v)} \frac{ \omega(e) }{ d(u) } \frac{ \gamma_e(v) }{ \delta_u(e) }
+
+    where :math:`\delta_u(e) = \delta(e) - \gamma_e(u)` unless self links are included.
+
+    Undirected (always including self links):
+
+    .. math:: w_{u,v} = \sum_{e \in E(u,v) } \frac{ \omega(e) \gamma_e(u) \gamma_e(v) }{ \delta(e) }
+
+    If columnar, the links are stored as a LinkArray.
+    """
     nodes, edges, weights = hypergraph
 
     print("[unipartite] creating unipartite...")
 
-    if directed:
-        links = []
+    model = model or TransitionModel.from_hypergraph(hypergraph)
+
+    links = create_links(model, directed, self_links)
 
-        P_ = P(edges, weights)
-        pi_ = pi(edges, weights)
+    if not columnar:
+        links = [link for chunk in links.chunks() for link in chunk]
 
-        for u, v in product(nodes, repeat=2):
-            weight = pi_(u) * P_(u, v, self_links)
+    return Network(nodes, links)
 
-            if weight < 1e-10:
-                continue
 
-            links.append((u.id, v.id, weight))
+def create_links(model: TransitionModel,
+                 directed: bool,
+                 self_links: bool,
+                 sources: Optional[np.ndarray] = None) -> LinkArray:
+    """
+    Sorted links from the vertex indices in sources, or from every vertex if None.
 
+    With sources, only the rows of the hyperedges incident to the sources are built.
+    """
+    shape = model.num_edges, model.num_nodes
+
+    if sources is None:
+        e, v, gamma_e_v = model.incident_gamma()
+        sources = np.arange(model.num_nodes)
     else:
-        w_ = w(edges, weights)
+        edges = np.unique(model.incidence_csc[:, sources].indices)
+        i, v, gamma_e_v = model.members(edges)
+        e = edges[i]
+
+    # edge x node, gamma restricted to incident vertices
+    gamma_ = csr_matrix((gamma_e_v, (e, v)), shape=shape)
+
+    if directed:
+        delta_e = model.delta[e] if self_links else model.delta[e] - gamma_e_v
+
+        # edge x node, probability to choose edge e from u times 1 / delta
+        exit_ = csr_matrix((model.omega[e] / delta_e, (e, v)), shape=shape)
+
+        adj = (diags(model.pi / model.d) @ exit_.T).tocsr()[sources] @ gamma_
+
+    else:
+        adj = gamma_.T.tocsr()[sources] @ diags(model.omega / model.delta) @ gamma_
+
+    adj = adj.tocoo()
+
+    keep = adj.data >= 1e-10
+
+    if not directed:
+        # upper triangle
+        keep &= adj.col >= sources[adj.row]
+
+    return LinkArray(model.node_ids[sources[adj.row[keep]]],
+                     model.node_ids[adj.col[keep]],
+                     adj.data[keep]).sorted()
+
+
+def update_network(network: Network,
+                   hypergraph: HyperGraph,
+                   model: TransitionModel,
+                   source_ids: np.ndarray,
+                   directed: bool,
+                   self_links: bool) -> Network:
+    """
+    Update the network of the hypergraph before a change to the hypergraph and model after it,
+    recomputing only the links from the vertex ids in source_ids.
+    """
+    print(f"[unipartite] updating links from {len(source_ids)} vertices...")
 
-        links = []
+    columnar = isinstance(network.links, LinkArray)
+    links = network.links if columnar else LinkArray.from_links(network.links)
 
-        for u, v in combinations_with_replacement(nodes, 2):
-            weight = w_(u, v, True)
+    sources = np.searchsorted(model.node_ids, source_ids[np.isin(source_ids, model.node_ids)])
 
-            if weight < 1e-10:
-                continue
+    links = links.replace_sources(source_ids, create_links(model, directed, self_links, sources))
 
-            links.append((u.id, v.id, weight))
+    if not columnar:
+        links = [link for chunk in links.chunks() for link in chunk]
 
-    return Network(nodes, sorted(links))
+    return Network(hypergraph.nodes, links)
@@ -0,0 +1,414 @@
+import json
+import os
+from dataclasses import dataclass, asdict, replace
+from itertools import product
+from multiprocessing import Pool
+from typing import List, Optional, Sequence, Tuple, Dict, Iterator, Union
+
+import numpy as np
+from scipy.sparse import diags
+
+from hypergraph.incremental import build_network
+from hypergraph.main import run_infomap, REPRESENTATIONS
+from hypergraph.network import HyperGraph, Network, MultilayerNetwork, BipartiteNetwork, StateNetwork, LinkArray
+from hypergraph.representation.multilayer import js_similarity_matrix
+from hypergraph.transition import TransitionModel, expand_rows
+
+SAMPLINGS = ("grid", "random")
+
+# links with less weight are left out, as in the representations
+MIN_LINK_WEIGHT = 1e-10
+
+
+@dataclass(frozen=True)
+class Parameter:
+    """The weight omega(edge) if node is None, otherwise gamma_edge(node), varied between low and high."""
+    edge: int
+    node: Optional[int] = None
+    low: float = 1.0
+    high: float = 3.0
+
+    @property
+    def name(self) -> str:
+        return f"omega({self.edge})" if self.node is None else f"gamma_{self.edge}({self.node})"
+
+
+@dataclass
+class SweepResult:
+    point: int
+    values: List[float]
+    representation: str
+    codelength: float
+    num_top_modules: int
+
+
+def grid_points(parameters: Sequence[Parameter], num_steps: int) -> List[Tuple[float, ...]]:
+    """Every combination of num_steps evenly spaced values of each parameter."""
+    return list(product(*(np.linspace(parameter.low, parameter.high, num_steps).tolist()
+                          for parameter in parameters)))
+
+
+def random_points(parameters: Sequence[Parameter], num_samples: int, seed: int = 0) -> List[Tuple[float, ...]]:
+    """num_samples points with each parameter drawn uniformly between low and high."""
+    rng = np.random.default_rng(seed)
+    low = np.array([parameter.low for parameter in parameters])
+    high = np.array([parameter.high for parameter in parameters])
+
+    return [tuple(point) for point in rng.uniform(low, high, size=(num_samples, len(parameters))).tolist()]
+
+
+def gamma_values(model: TransitionModel, positions: np.ndarray) -> np.ndarray:
+    """gamma.data at the positions of TransitionModel.gamma_positions, 0 at -1."""
+    return np.append(model.gamma.data, 0.0)[positions]
+
+
+class UnipartiteLinks:
+    """
+    The links of unipartite.create_network at every point.
+
+    Each link (u, v) sums one term for every hyperedge e in E(u, v), the terms are
+    the pairs of positions of u and v in the row of e in the incidence matrix.
+    """
+
+    def __init__(self, nodes, model: TransitionModel, directed: bool, self_links: bool):
+        self.nodes = nodes
+        self.directed = directed
+        self.self_links = self_links
+
+        indptr = model.incidence.indptr
+        self.edge = np.repeat(np.arange(model.num_edges), np.diff(indptr))
+        self.node = model.incidence.indices
+        self.positions = model.gamma_positions(self.edge, self.node)
+
+        self.first, self.second = expand_rows(indptr, self.edge)
+
+        if not directed:
+            upper = self.node[self.second] >= self.node[self.first]
+            self.first, self.second = self.first[upper], self.second[upper]
+
+        keys, self.link = np.unique(self.node[self.first] * model.num_nodes + self.node[self.second],
+                                    return_inverse=True)
+
+        self.source = model.node_ids[keys // model.num_nodes]
+        self.target = model.node_ids[keys % model.num_nodes]
+
+    def network_at(self, model: TransitionModel) -> Network:
+        gamma = gamma_values(model, self.positions)
+
+        e, u = self.edge[self.first], self.node[self.first]
+        gamma_u, gamma_v = gamma[self.first], gamma[self.second]
+
+        if self.directed:
+            delta_e = model.delta[e] if self.self_links else model.delta[e] - gamma_u
+            terms = model.pi[u] / model.d[u] * (model.omega[e] / delta_e) * gamma_v
+        else:
+            terms = gamma_u * (model.omega[e] / model.delta[e]) * gamma_v
+
+        weight = np.bincount(self.link, weights=terms, minlength=len(self.source))
+
+        keep = weight >= MIN_LINK_WEIGHT
+
+        return Network(self.nodes, LinkArray(self.source[keep], self.target[keep], weight[keep]))
+
+
+class MultilayerLinks:
+    """
+    The links of multilayer.create_network at every point.
+
+    Every link (alpha, u) -> (beta, v) of the network with all weights 1 is kept
+    in its sorted order, with the hyperedge and vertex indices of the link.
+    """
+
+    def __init__(self, model: TransitionModel, network: MultilayerNetwork, similarity_walk: bool, self_links: bool):
+        self.nodes = network.nodes
+        self.links = network.links
+        self.similarity_walk = similarity_walk
+        self.self_links = self_links
+
+        self.alpha = np.searchsorted(model.edge_ids, self.links.source_layer)
+        self.u = np.searchsorted(model.node_ids, self.links.source)
+        self.beta = np.searchsorted(model.edge_ids, self.links.target_layer)
+        self.v = np.searchsorted(model.node_ids, self.links.target)
+
+        self.alpha_u = model.gamma_positions(self.alpha, self.u)
+        self.beta_u = model.gamma_positions(self.beta, self.u)
+        self.beta_v = model.gamma_positions(self.beta, self.v)
+
+    def network_at(self, model: TransitionModel) -> MultilayerNetwork:
+        gamma = gamma_values(model, np.concatenate((self.alpha_u, self.beta_u, self.beta_v)))
+        gamma_alpha_u, gamma_beta_u, gamma_beta_v = np.split(gamma, 3)
+
+        delta_e = model.delta[self.beta] if self.self_links else model.delta[self.beta] - gamma_beta_u
+
+        if self.similarity_walk:
+            D = js_similarity_matrix(model) @ diags(model.omega)
+            S = (D @ model.incidence).multiply(model.incidence).tocsr()
+
+            D_alpha_beta = np.asarray(D[self.alpha, self.beta]).ravel()
+            S_alpha = np.asarray(S[self.alpha, self.u]).ravel()
+
+            P_uv = D_alpha_beta / S_alpha * (gamma_beta_v / delta_e)
+        else:
+            P_uv = model.omega[self.beta] / model.d[self.u] * gamma_beta_v / delta_e
+
+        keep = np.flatnonzero(P_uv >= MIN_LINK_WEIGHT)
+
+        links = self.links.take(keep)
+        links.weight = model.omega[self.alpha[keep]] * gamma_alpha_u[keep] * P_uv[keep]
+
+        return MultilayerNetwork(self.nodes, links)
+
+
+class BipartiteLinks:
+    """
+    The links of bipartite.create_network at every point.
+
+    Every link of the network with all weights 1 is either from vertex u to hyperedge e,
+    weighted pi(u) omega(e) / d(u), or from e to u, weighted gamma_e(u). Both are left
+    out if omega(e) / d(u) gamma_e(u) is too small. The nodes, features and states
+    of that network are the same at every point.
+    """
+
+    def __init__(self, hypergraph: HyperGraph, model: TransitionModel, network: BipartiteNetwork):
+        self.network = network
+        self.links = LinkArray.from_links(network.links)
+
+        source, target = self.links.source, self.links.target
+
+        if isinstance(network, StateNetwork) and len(network.states):
+            state_ids, node_ids = np.array(network.states, dtype=int).T
+            node_of_state = np.zeros(state_ids.max() + 1, dtype=int)
+            node_of_state[state_ids] = node_ids
+            source, target = node_of_state[source], node_of_state[target]
+
+        feature_start_id = min((feature.id for feature in network.features), default=0)
+        edge_of_feature = model.edges_to_index(edge.id for edge in hypergraph.edges)
+
+        self.is_out = source < feature_start_id
+        self.edge = edge_of_feature[np.where(self.is_out, target, source) - feature_start_id]
+        self.node = np.searchsorted(model.node_ids, np.where(self.is_out, source, target))
+        self.positions = model.gamma_positions(self.edge, self.node)
+
+    def network_at(self, model: TransitionModel) -> BipartiteNetwork:
+        P_ue = model.omega[self.edge] / model.d[self.node]
+        P_ev = gamma_values(model, self.positions)
+
+        keep = np.flatnonzero(P_ue * P_ev >= MIN_LINK_WEIGHT)
+
+        links = self.links.take(keep)
+        links.weight = np.where(self.is_out, model.pi[self.node] * P_ue, P_ev)[keep]
+
+        return replace(self.network, links=links)
+
+
+RepresentationLinks = Union[UnipartiteLinks, MultilayerLinks, BipartiteLinks]
+
+
+def representation_links(hypergraph: HyperGraph,
+                         model: TransitionModel,
+                         multilayer=False,
+                         multilayer_similarity=False,
+                         bipartite=False,
+                         bipartite_non_backtracking=False,
+                         unipartite_undirected=False,
+                         unipartite_directed=False,
+                         self_links=False) -> RepresentationLinks:
+    """
+    The links of the representation of build_network for every reweighting of the model.
+
+    The multilayer and bipartite links are those of the network of the model with all weights 1,
+    where no link is too light to be left out, so that every point has a subset of them.
+    """
+    uniform = model.reweighted(np.ones(model.num_edges), np.ones(len(model.gamma.data)))
+
+    if multilayer or multilayer_similarity:
+        network = build_network(hypergraph, uniform, multilayer, multilayer_similarity,
+                                self_links=self_links, columnar=True)
+        return MultilayerLinks(model, network, multilayer_similarity, self_links)
+    elif bipartite or bipartite_non_backtracking:
+        network = build_network(hypergraph, uniform, bipartite=bipartite,
+                                bipartite_non_backtracking=bipartite_non_backtracking)
+        return BipartiteLinks(hypergraph, model, network)
+    elif unipartite_undirected or unipartite_directed:
+        return UnipartiteLinks(hypergraph.nodes, model, unipartite_directed, self_links)
+
+    raise ValueError("No representation given")
+
+
+class WeightSpace:
+    """
+    The hypergraph structure shared by every point of a sweep.
+
+    The transition model is built once, a point only sets the omega and
+    gamma values of the parameters, see TransitionModel.reweighted.
+    The links of each representation are indexed once, see representation_links,
+    a point only recomputes their weights.
+    """
+
+    def __init__(self, hypergraph: HyperGraph, parameters: Sequence[Parameter]):
+        self.hypergraph = hypergraph
+        self.parameters = list(parameters)
+        self.model = TransitionModel.from_hypergraph(hypergraph)
+
+        self._omega_index = [(i, self.model.edge_index[parameter.edge])
+                             for i, parameter in enumerate(self.parameters) if parameter.node is None]
+
+        self._gamma_index = [(i, self.model.gamma_position(parameter.edge, parameter.node))
+                             for i, parameter in enumerate(self.parameters) if parameter.node is not None]
+
+        self._links: Dict[str, RepresentationLinks] = {}
+
+    def links(self, representation: str) -> RepresentationLinks:
+        if representation not in self._links:
+            self._links[representation] = representation_links(self.hypergraph, self.model,
+                                                               **REPRESENTATIONS[representation])
+
+        return self._links[representation]
+
+    def model_at(self, values: Sequence[float]) -> TransitionModel:
+        omega = self.model.omega.copy()
+        gamma = self.model.gamma.data.copy()
+
+        for i, index in self._omega_index:
+            omega[index] = values[i]
+
+        for i, index in self._gamma_index:
+            gamma[index] = values[i]
+
+        return self.model.reweighted(omega, gamma)
+
+    def network_at(self, values: Sequence[float], representation: str) -> Network:
+        return self.links(representation).network_at(self.model_at(values))
+
+
+def evaluate(space: WeightSpace, values: Sequence[float], representation: str) -> Tuple[float, int]:
+    """Two-level codelength and number of top modules of the representation at the point."""
+    options = REPRESENTATIONS[representation]
+
+    network = space.network_at(values, representation)
+
+    bipartite = options.get("bipartite", False) or options.get("bipartite_non_backtracking", False)
+
+    im = run_infomap(network,
+                     args="--bipartite-teleportation" if bipartite else None,
+                     self_links=options.get("self_links", False),
+                     two_level=True)
+
+    return im.codelength, im.num_top_modules
+
+
+_sweep_space: Optional[WeightSpace] = None
+
+
+def _init_sweep_worker(space: WeightSpace):
+    global _sweep_space
+    _sweep_space = space
+
+
+def _run_sweep_task(point: int, values: Tuple[float, ...], representation: str) -> SweepResult:
+    codelength, num_top_modules = evaluate(_sweep_space, values, representation)
+    return SweepResult(point, list(values), representation, codelength, num_top_modules)
+
+
+def _run_sweep_task_star(task) -> SweepResult:
+    return _run_sweep_task(*task)
+
+
+def read_log(log_filename: str, header: Dict) -> List[SweepResult]:
+    """
+    Results of a previous sweep with the same header, the first line of the log.
+
+    Raises ValueError if the log was written by a sweep with other parameters or points.
+    """
+    if not os.path.exists(log_filename):
+        return []
+
+    results = []
+
+    with open(log_filename) as fp:
+        lines = fp.readlines()
+
+    if len(lines) == 0:
+        return results
+
+    if json.loads(lines[0]) != header:
+        raise ValueError(f"{log_filename} is the log of another sweep, remove it or choose another log file")
+
+    for line in lines[1:]:
+        try:
+            results.append(SweepResult(**json.loads(line)))
+        except (TypeError, ValueError):
+            # the last line of an interrupted sweep may be cut off
+            continue
+
+    return results
+
+
+def sweep(hypergraph: HyperGraph,
+          parameters: Sequence[Parameter],
+          points: Sequence[Tuple[float, ...]],
+          representations: Sequence[str],
+          log_filename: str,
+          num_workers: Optional[int] = None) -> List[SweepResult]:
+    """
+    Evaluate the representations at every point, in a pool of num_workers processes (all cores if None).
+
+    Every result is appended to log_filename as a line of JSON as soon as it is done.
+    Running the same sweep again with the same log resumes it, skipping the points
+    and representations already in the log.
+    """
+    header = dict(parameters=[asdict(parameter) for parameter in parameters],
+                  points=[list(point) for point in points],
+                  representations=list(representations))
+
+    results = read_log(log_filename, header)
+
+    done = {(result.point, result.representation) for result in results}
+
+    tasks = [(i, tuple(point), representation)
+             for i, point in enumerate(points)
+             for representation in representations
+             if (i, representation) not in done]
+
+    print(f"[sweep] {len(points)} points, {len(tasks)} of {len(points) * len(representations)} runs left")
+
+    if len(tasks) == 0:
+        return results
+
+    space = WeightSpace(hypergraph, parameters)
+
+    # indexed before the workers are started, which get a copy of the space
+    for representation in sorted({representation for _, _, representation in tasks}):
+        space.links(representation)
+
+    with open(log_filename, "a") as fp:
+        if len(results) == 0:
+            fp.seek(0)
+            fp.truncate()
+            fp.write(json.dumps(header) + "\n")
+
+        for result in _run_tasks(space, tasks, num_workers):
+            fp.write(json.dumps(asdict(result)) + "\n")
+            fp.flush()
+
+            results.append(result)
+
+    return results
+
+
+def _run_tasks(space: WeightSpace, tasks, num_workers: Optional[int]) -> Iterator[SweepResult]:
+    if len(tasks) > 1 and num_workers != 1:
+        with Pool(num_workers, initializer=_init_sweep_worker, initargs=(space,)) as pool:
+            yield from pool.imap_unordered(_run_sweep_task_star, tasks)
+    else:
+        _init_sweep_worker(space)
+        yield from map(_run_sweep_task_star, tasks)
+
+
+def results_by_point(results: Sequence[SweepResult]) -> Dict[int, Dict[str, SweepResult]]:
+    by_point = {}
+
+    for result in results:
+        by_point.setdefault(result.point, {})[result.representation] = result
+
+    return dict(sorted(by_point.items()))
@@ -1,10 +1,516 @@
-from collections import defaultdict
-from typing import Iterable, Set, Optional, Callable
+from copy import copy
+from typing import Iterable, Set, Optional, Callable, Dict, Tuple, List, Sequence
 
-from hypergraph.network import Node, HyperEdge, Gamma
+import numpy as np
+from scipy.sparse import csr_matrix, csc_matrix
 
+from hypergraph.network import HyperGraph, Node, HyperEdge, Gamma
 
-def E(edges: Iterable[HyperEdge]) -> Callable[[Node, Optional[Node]], Set[int]]:
+
+class TransitionModel:
+    """
+    Sparse incidence representation of a hypergraph.
+
+    Rows index hyperedges and columns index vertices, both in ascending id order.
+
+    ``incidence``   1 if v \in e (from the hyperedges)
+    ``gamma``       \gamma_e(v) (from the weights)
+    ``omega``       \omega(e)
+    ``d``           d(v) = \sum_{e \in E(v)} \omega(e)
+    ``delta``       \delta(e) = \sum_{v \in e} \gamma_e(v)
+    ``pi``          \pi(v) = \sum_{e \in E(v)} \omega(e) \gamma_e(v)
+
+    Of several weights of the same vertex in a hyperedge, the last one is \gamma_e(v),
+    but every weight is summed into \delta(e). ``repeated`` maps (hyperedge id, vertex id)
+    to the sum of the weights replaced by a later one.
+
+    Batched methods take arrays of vertex/hyperedge indices, use
+    ``node_index``/``edge_index`` to translate ids to indices.
+    """
+
+    def __init__(self, edges: Iterable[HyperEdge] = (), weights: Iterable[Gamma] = ()):
+        edges = list(edges)
+        weights = list(weights)
+
+        self._build(np.array([edge.id for edge in edges], dtype=int),
+                    np.array([edge.omega for edge in edges], dtype=float),
+                    np.array([edge.id for edge in edges for _ in edge.nodes], dtype=int),
+                    np.array([node.id for edge in edges for node in edge.nodes], dtype=int),
+                    np.array([weight.edge for weight in weights], dtype=int),
+                    np.array([weight.node.id for weight in weights], dtype=int),
+                    np.array([weight.gamma for weight in weights], dtype=float))
+
+    def _build(self,
+               omega_edges: np.ndarray,
+               omega: np.ndarray,
+               incidence_edges: np.ndarray,
+               incidence_nodes: np.ndarray,
+               gamma_edges: np.ndarray,
+               gamma_nodes: np.ndarray,
+               gamma: np.ndarray):
+        """Build the model from hyperedge and vertex ids, in any order."""
+        self.node_ids = np.union1d(incidence_nodes, gamma_nodes).astype(int)
+        self.edge_ids = np.union1d(omega_edges, gamma_edges).astype(int)
+        self.node_index: Dict[int, int] = dict(zip(self.node_ids.tolist(), range(len(self.node_ids))))
+        self.edge_index: Dict[int, int] = dict(zip(self.edge_ids.tolist(), range(len(self.edge_ids))))
+
+        shape = len(self.edge_ids), len(self.node_ids)
+
+        self.omega = np.zeros(shape[0])
+        self.omega[np.searchsorted(self.edge_ids, omega_edges)] = omega
+
+        rows = np.searchsorted(self.edge_ids, incidence_edges)
+        cols = np.searchsorted(self.node_ids, incidence_nodes)
+        self.incidence = csr_matrix((np.ones(len(rows)), (rows, cols)), shape=shape)
+        self.incidence.data[:] = 1.0
+
+        rows = np.searchsorted(self.edge_ids, gamma_edges)
+        cols = np.searchsorted(self.node_ids, gamma_nodes)
+
+        # the last of repeated weights, the matrix would sum them
+        order = np.argsort(rows * shape[1] + cols, kind="stable")
+        last = np.ones(len(order), dtype=bool)
+        last[:-1] = (rows[order[1:]] != rows[order[:-1]]) | (cols[order[1:]] != cols[order[:-1]])
+
+        self.repeated: Dict[Tuple[int, int], float] = {}
+
+        for e, v, gamma_ in zip(*(values[order[~last]].tolist() for values in (gamma_edges, gamma_nodes, gamma))):
+            self.repeated[e, v] = self.repeated.get((e, v), 0.0) + gamma_
+
+        kept = order[last]
+        self.gamma = csr_matrix((gamma[kept], (rows[kept], cols[kept])), shape=shape, dtype=float)
+
+        self.d = self.incidence.T @ self.omega
+        self.delta = np.asarray(self.gamma.sum(axis=1)).ravel() + self.repeated_delta()
+        self.pi = self.gamma.multiply(self.incidence).T @ self.omega
+
+        self._incidence_csc: Optional[csc_matrix] = None
+        self._gamma_csc: Optional[csc_matrix] = None
+        self._gamma_lookup: Optional[Dict[Tuple[int, int], float]] = None
+        self._edge_sets: Optional[Dict[int, Set[int]]] = None
+
+    def updated(self,
+                edges: Iterable[HyperEdge] = (),
+                weights: Iterable[Gamma] = (),
+                removed: Iterable[int] = ()):  # -> TransitionModel
+        """
+        Model of the hypergraph with the hyperedges in edges added, or replacing the
+        hyperedges with the same ids, the weights in weights set and the hyperedges
+        in removed removed, without rebuilding it from the hypergraph.
+
+        Weights of replaced hyperedges are kept for the vertices still in them,
+        vertices of added or replaced hyperedges without a weight get gamma = 1.
+        Weights set for vertices not in the hyperedge are ignored. Of several weights
+        set for the same vertex, the last one is used, see repeated.
+
+        Only the rows of the changed hyperedges are built, the other rows are copied,
+        and d and pi are only recomputed for the vertices of the changed hyperedges.
+        """
+        edges = {edge.id: edge for edge in edges}
+        removed = set(removed) - edges.keys()
+
+        # the last of repeated weights is set, the others are repeated
+        set_gammas: Dict[int, Dict[int, float]] = {}
+        set_repeated: Dict[Tuple[int, int], float] = {}
+
+        for weight in weights:
+            edge_gammas = set_gammas.setdefault(weight.edge, {})
+
+            if weight.node.id in edge_gammas:
+                key = weight.edge, weight.node.id
+                set_repeated[key] = set_repeated.get(key, 0.0) + edge_gammas[weight.node.id]
+
+            edge_gammas[weight.node.id] = weight.gamma
+
+        old_node_ids = self.node_ids.tolist()
+
+        def old_row(matrix: csr_matrix, e: int) -> Tuple[List[int], List[float]]:
+            if e not in self.edge_index:
+                return [], []
+
+            row = self.edge_index[e]
+            start, end = matrix.indptr[row], matrix.indptr[row + 1]
+            return [old_node_ids[v] for v in matrix.indices[start:end].tolist()], matrix.data[start:end].tolist()
+
+        # omega, member ids and gamma by vertex id of the changed hyperedges left after the change
+        changed_ids = sorted(edges.keys() | removed | (set_gammas.keys() & self.edge_index.keys()))
+        rows: Dict[int, Tuple[float, List[int], Dict[int, float]]] = {}
+
+        changed_edges = set(changed_ids)
+        repeated = {key: gamma_ for key, gamma_ in self.repeated.items() if key[0] not in changed_edges}
+
+        for e in changed_ids:
+            if e in removed:
+                continue
+
+            gamma_ = dict(zip(*old_row(self.gamma, e)))
+
+            if e in edges:
+                omega_ = edges[e].omega
+                members = sorted({node.id for node in edges[e].nodes})
+                # old weights are kept for the vertices still in the hyperedge
+                gamma_ = {v: gamma_.get(v, 1.0) for v in members}
+            else:
+                omega_ = float(self.omega[self.edge_index[e]])
+                members, _ = old_row(self.incidence, e)
+
+            is_member = set(members)
+            set_gamma = {v: gamma_v for v, gamma_v in set_gammas.get(e, {}).items() if v in is_member}
+            gamma_.update(set_gamma)
+
+            rows[e] = omega_, members, gamma_
+
+            # weights that are set replace every old weight of the vertex
+            repeated.update(((e, v), gamma_v) for (e_, v), gamma_v in self.repeated.items()
+                            if e_ == e and v in gamma_ and v not in set_gamma)
+            repeated.update(((e, v), gamma_v) for (e_, v), gamma_v in set_repeated.items()
+                            if e_ == e and v in set_gamma)
+
+        changed = np.array([self.edge_index[e] for e in changed_ids if e in self.edge_index], dtype=int)
+
+        # vertices only in changed rows are dropped if they are not in the new rows
+        old_changed_nodes = np.union1d(*(matrix.indices[expand_rows(matrix.indptr, changed)[1]]
+                                         for matrix in (self.incidence, self.gamma)))
+        new_nodes = {v for _, members, gamma_ in rows.values() for v in (*members, *gamma_)}
+        new_node_ids = np.fromiter(new_nodes, dtype=int, count=len(new_nodes))
+
+        vanished = [old_node_ids[v] for v in old_changed_nodes.tolist()
+                    if old_node_ids[v] not in new_nodes and not self._in_other_rows(v, changed)]
+
+        model = TransitionModel.__new__(TransitionModel)
+
+        if vanished or not new_nodes <= self.node_index.keys():
+            model.node_ids = np.union1d(np.setdiff1d(self.node_ids, vanished), new_node_ids).astype(int)
+            model.node_index = dict(zip(model.node_ids.tolist(), range(len(model.node_ids))))
+            columns = np.searchsorted(model.node_ids, self.node_ids)
+        else:
+            model.node_ids, model.node_index, columns = self.node_ids, self.node_index, None
+
+        kept_edges = np.setdiff1d(self.edge_ids, np.array(sorted(removed), dtype=int))
+
+        if len(kept_edges) != len(self.edge_ids) or not edges.keys() <= self.edge_index.keys():
+            model.edge_ids = np.union1d(kept_edges, np.fromiter(edges, dtype=int, count=len(edges))).astype(int)
+            model.edge_index = dict(zip(model.edge_ids.tolist(), range(len(model.edge_ids))))
+        else:
+            model.edge_ids, model.edge_index = self.edge_ids, self.edge_index
+
+        new_rows = np.searchsorted(model.edge_ids, np.fromiter(rows, dtype=int, count=len(rows)))
+
+        # the row of this model each row is copied from, or -1 for the rebuilt rows
+        source_rows = np.searchsorted(self.edge_ids, model.edge_ids)
+        source_rows[new_rows] = -1
+
+        num_nodes = len(model.node_ids)
+
+        incidence_rows, gamma_rows = {}, {}
+
+        for row, (_, members, gamma_) in zip(new_rows.tolist(), rows.values()):
+            incidence_rows[row] = np.searchsorted(model.node_ids, members), np.ones(len(members))
+
+            gamma_nodes = sorted(gamma_)
+            gamma_rows[row] = np.searchsorted(model.node_ids, gamma_nodes), [gamma_[v] for v in gamma_nodes]
+
+        model.incidence = splice_rows(self.incidence, source_rows, incidence_rows, num_nodes, columns)
+        model.gamma = splice_rows(self.gamma, source_rows, gamma_rows, num_nodes, columns)
+
+        copied = source_rows >= 0
+
+        model.omega = np.zeros(len(model.edge_ids))
+        model.omega[copied] = self.omega[source_rows[copied]]
+        model.omega[new_rows] = [omega_ for omega_, _, _ in rows.values()]
+
+        model.delta = np.zeros(len(model.edge_ids))
+        model.delta[copied] = self.delta[source_rows[copied]]
+        model.repeated = repeated
+        model.delta[new_rows] = np.asarray(model.gamma[new_rows].sum(axis=1)).ravel() + \
+            model.repeated_delta()[new_rows]
+
+        model._incidence_csc = None
+        model._gamma_csc = None
+        model._gamma_lookup = None
+        model._edge_sets = None
+
+        # d and pi of the vertices in the changed rows, summed in hyperedge order as in _build
+        affected = np.searchsorted(model.node_ids,
+                                   np.union1d(np.setdiff1d(self.node_ids[old_changed_nodes], vanished), new_node_ids))
+
+        model.d = np.zeros(num_nodes)
+        model.pi = np.zeros(num_nodes)
+
+        kept_nodes = np.isin(self.node_ids, model.node_ids) if columns is not None else slice(None)
+        target_nodes = columns[kept_nodes] if columns is not None else slice(None)
+        model.d[target_nodes] = self.d[kept_nodes]
+        model.pi[target_nodes] = self.pi[kept_nodes]
+
+        i, index = expand_rows(model.incidence_csc.indptr, affected)
+        e = model.incidence_csc.indices[index]
+
+        model.d[affected] = np.bincount(i, weights=model.omega[e], minlength=len(affected))
+        model.pi[affected] = np.bincount(i, weights=model.gamma_at(e, affected[i]) * model.omega[e],
+                                         minlength=len(affected))
+
+        return model
+
+    def _in_other_rows(self, v: int, rows: np.ndarray) -> bool:
+        """If vertex index v is in the incidence or gamma of any hyperedge index not in rows."""
+        return any(np.setdiff1d(csc.indices[csc.indptr[v]:csc.indptr[v + 1]], rows).size
+                   for csc in (self.incidence_csc, self.gamma_csc))
+
+    def reweighted(self, omega: np.ndarray, gamma: np.ndarray):  # -> TransitionModel
+        """
+        Model of the same hyperedges and vertices with other weights.
+
+        omega is indexed like edge_ids and gamma like gamma.data. The incidence
+        and the indices are shared with this model, only d, delta and pi are recomputed.
+        """
+        model = copy(self)
+
+        model.omega = np.asarray(omega, dtype=float)
+        model.gamma = csr_matrix((np.asarray(gamma, dtype=float), self.gamma.indices, self.gamma.indptr),
+                                 shape=self.gamma.shape)
+
+        model.d = model.incidence.T @ model.omega
+        model.delta = np.asarray(model.gamma.sum(axis=1)).ravel() + model.repeated_delta()
+        model.pi = model.gamma.multiply(model.incidence).T @ model.omega
+
+        model._gamma_csc = None
+        model._gamma_lookup = None
+
+        return model
+
+    def repeated_delta(self) -> np.ndarray:
+        """Sum of the repeated weights of each hyperedge, added to delta."""
+        delta = np.zeros(len(self.edge_ids))
+
+        for (e, _), gamma_ in self.repeated.items():
+            delta[self.edge_index[e]] += gamma_
+
+        return delta
+
+    def gamma_position(self, e: int, v: int) -> int:
+        """Position of \gamma_e(v) in gamma.data by hyperedge and vertex id."""
+        row = self.edge_index[e]
+        start, end = self.gamma.indptr[row], self.gamma.indptr[row + 1]
+        position = np.flatnonzero(self.gamma.indices[start:end] == self.node_index[v])
+
+        if len(position) == 0:
+            raise KeyError((e, v))
+
+        return start + position[0]
+
+    def gamma_positions(self, e: np.ndarray, v: np.ndarray) -> np.ndarray:
+        """Batched positions of \gamma_e(v) in gamma.data by hyperedge and vertex indices, -1 if not set."""
+        positions = csr_matrix((np.arange(1, len(self.gamma.data) + 1), self.gamma.indices, self.gamma.indptr),
+                               shape=self.gamma.shape)
+
+        return np.asarray(positions[e, v]).ravel().astype(int) - 1
+
+    @classmethod
+    def from_hypergraph(cls, hypergraph: HyperGraph):  # -> TransitionModel
+        _, edges, weights = hypergraph
+        return cls(edges, weights)
+
+    @property
+    def num_nodes(self) -> int:
+        return len(self.node_ids)
+
+    @property
+    def num_edges(self) -> int:
+        return len(self.edge_ids)
+
+    @property
+    def incidence_csc(self) -> csc_matrix:
+        if self._incidence_csc is None:
+            self._incidence_csc = self.incidence.tocsc()
+        return self._incidence_csc
+
+    @property
+    def gamma_csc(self) -> csc_matrix:
+        if self._gamma_csc is None:
+            self._gamma_csc = self.gamma.tocsc()
+        return self._gamma_csc
+
+    def nodes_to_index(self, node_ids: Iterable[int]) -> np.ndarray:
+        return np.fromiter((self.node_index[id_] for id_ in node_ids), dtype=int)
+
+    def edges_to_index(self, edge_ids: Iterable[int]) -> np.ndarray:
+        return np.fromiter((self.edge_index[id_] for id_ in edge_ids), dtype=int)
+
+    def edges_of(self, u: int) -> np.ndarray:
+        """Indices of the hyperedges incident to vertex index u."""
+        csc = self.incidence_csc
+        return csc.indices[csc.indptr[u]:csc.indptr[u + 1]]
+
+    def nodes_of(self, e: int) -> np.ndarray:
+        """Indices of the vertices in hyperedge index e."""
+        return self.incidence.indices[self.incidence.indptr[e]:self.incidence.indptr[e + 1]]
+
+    def E(self, u: int, v: Optional[int] = None) -> Set[int]:
+        """Hyperedge ids incident to the vertex ids u (and v)."""
+        if self._edge_sets is None:
+            csc = self.incidence_csc
+            edge_ids = self.edge_ids.tolist()
+            self._edge_sets = {node_id: {edge_ids[e] for e in csc.indices[csc.indptr[i]:csc.indptr[i + 1]].tolist()}
+                               for i, node_id in enumerate(self.node_ids.tolist())}
+
+        if v is not None:
+            return self._edge_sets[u] & self._edge_sets[v]
+
+        return self._edge_sets[u]
+
+    def d_of(self, v: int) -> float:
+        """Scalar d(v) by vertex id."""
+        return float(self.d[self.node_index[v]])
+
+    def delta_of(self, e: int) -> float:
+        """Scalar \delta(e) by hyperedge id."""
+        return float(self.delta[self.edge_index[e]])
+
+    def pi_of(self, v: int) -> float:
+        """Scalar \pi(v) by vertex id."""
+        return float(self.pi[self.node_index[v]])
+
+    def gamma_of(self, e: int, v: int) -> float:
+        """Scalar \gamma_e(v) by hyperedge and vertex id."""
+        if self._gamma_lookup is None:
+            coo = self.gamma.tocoo()
+            self._gamma_lookup = dict(zip(zip(self.edge_ids[coo.row].tolist(),
+                                              self.node_ids[coo.col].tolist()),
+                                          coo.data.tolist()))
+
+        return self._gamma_lookup[e, v]
+
+    def members(self, e: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Members of the hyperedge indices e.
+
+        Returns (i, v, gamma) where v[k] \in e[i[k]] and gamma[k] = \gamma_{e[i[k]]}(v[k]).
+        """
+        e = np.asarray(e, dtype=int)
+        i, index = expand_rows(self.incidence.indptr, e)
+        v = self.incidence.indices[index]
+        return i, v, self.gamma_at(e[i], v)
+
+    def incident_gamma(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Hyperedge indices, vertex indices and \gamma_e(v) for every v \in e, ordered by hyperedge."""
+        e, v = self.incidence.nonzero()
+        return e, v, self.gamma_at(e, v)
+
+    def gamma_at(self, e: np.ndarray, v: np.ndarray) -> np.ndarray:
+        """Batched \gamma_e(v) by hyperedge and vertex indices."""
+        if len(e) == 0:
+            # indexing with empty arrays gives a sparse matrix, not an array
+            return np.zeros(0)
+
+        return np.asarray(self.gamma[e, v]).ravel()
+
+    def is_member(self, e: np.ndarray, v: np.ndarray) -> np.ndarray:
+        """Batched v \in e by hyperedge and vertex indices."""
+        if len(e) == 0:
+            return np.zeros(0, dtype=bool)
+
+        return np.asarray(self.incidence[e, v]).ravel() != 0
+
+    def pi_alpha(self, e: np.ndarray, u: np.ndarray) -> np.ndarray:
+        """Batched \omega(e) \gamma_e(u), zero if u is not in e."""
+        return np.where(self.is_member(e, u), self.omega[e] * self.gamma_at(e, u), 0.0)
+
+    def shared_edges(self, u: np.ndarray, v: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        For each pair of vertex indices (u[i], v[i]), the hyperedges in E(u, v).
+
+        Returns (pair, e) where e[k] is incident to both u[pair[k]] and v[pair[k]].
+        """
+        u, v = np.asarray(u, dtype=int), np.asarray(v, dtype=int)
+        csc = self.incidence_csc
+
+        pair, index = expand_rows(csc.indptr, u)
+        e = csc.indices[index]
+
+        shared = self.is_member(e, v[pair])
+
+        return pair[shared], e[shared]
+
+    def P(self, u: np.ndarray, v: np.ndarray, self_links: bool = False) -> np.ndarray:
+        """Batched transition probabilities P(u, v) by vertex indices."""
+        u, v = np.asarray(u, dtype=int), np.asarray(v, dtype=int)
+        pair, e = self.shared_edges(u, v)
+        u_, v_ = u[pair], v[pair]
+
+        delta_e = self.delta[e] if self_links else self.delta[e] - self.gamma_at(e, u_)
+
+        P_uv = self.omega[e] / self.d[u_] * self.gamma_at(e, v_) / delta_e
+
+        return np.bincount(pair, weights=P_uv, minlength=len(u))
+
+    def w(self, u: np.ndarray, v: np.ndarray, self_links: bool = False) -> np.ndarray:
+        """Batched unipartite weights w(u, v) by vertex indices."""
+        u, v = np.asarray(u, dtype=int), np.asarray(v, dtype=int)
+        pair, e = self.shared_edges(u, v)
+        u_, v_ = u[pair], v[pair]
+
+        gamma_u = self.gamma_at(e, u_)
+
+        delta_e = self.delta[e] if self_links else self.delta[e] - gamma_u
+
+        w_uv = self.omega[e] * gamma_u * self.gamma_at(e, v_) / delta_e
+
+        return np.bincount(pair, weights=w_uv, minlength=len(u))
+
+
+def expand_rows(indptr: np.ndarray, rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Concatenated slices of a compressed sparse matrix.
+
+    Returns (i, index) where index enumerates indptr[rows[i]]:indptr[rows[i] + 1] for each i.
+    """
+    rows = np.asarray(rows, dtype=int)
+    starts = indptr[rows]
+    counts = indptr[rows + 1] - starts
+    i = np.repeat(np.arange(len(rows)), counts)
+    offsets = np.repeat(starts - (np.cumsum(counts) - counts), counts)
+    return i, offsets + np.arange(counts.sum())
+
+
+def splice_rows(matrix: csr_matrix,
+                source_rows: np.ndarray,
+                new_rows: Dict[int, Tuple[np.ndarray, Sequence[float]]],
+                num_columns: int,
+                columns: Optional[np.ndarray] = None) -> csr_matrix:
+    """
+    Compressed sparse matrix with row i copied from row source_rows[i] of matrix,
+    or given as new_rows[i] = (column indices, data) where source_rows[i] is -1.
+
+    The column indices of the copied rows are mapped through columns if given.
+    """
+    source_rows = np.asarray(source_rows, dtype=int)
+    copied = source_rows >= 0
+
+    counts = np.zeros(len(source_rows), dtype=int)
+    counts[copied] = np.diff(matrix.indptr)[source_rows[copied]]
+
+    for row, (indices, _) in new_rows.items():
+        counts[row] = len(indices)
+
+    indptr = np.concatenate(([0], np.cumsum(counts)))
+    indices = np.empty(indptr[-1], dtype=matrix.indices.dtype)
+    data = np.empty(indptr[-1], dtype=matrix.data.dtype)
+
+    _, source = expand_rows(matrix.indptr, source_rows[copied])
+    _, target = expand_rows(indptr, np.flatnonzero(copied))
+
+    indices[target] = matrix.indices[source] if columns is None else columns[matrix.indices[source]]
+    data[target] = matrix.data[source]
+
+    for row, (indices_, data_) in new_rows.items():
+        indices[indptr[row]:indptr[row + 1]] = indices_
+        data[indptr[row]:indptr[row + 1]] = data_
+
+    return csr_matrix((data, indices, indptr), shape=(len(source_rows), num_columns))
+
+
+def E(edges: Iterable[HyperEdge],
+      model: Optional[TransitionModel] = None) -> Callable[[Node, Optional[Node]], Set[int]]:
     """
     Set of hyperedges incident to vertex v.
 
@@ -14,118 +520,112 @@ def E(edges: Iterable[HyperEdge]) -> Callable[[Node, Optional[Node]], Set[int]]:
 
     .. math:: E(u, v) = { e \in E : u \in e, v \in e }
     """
-    edges_ = defaultdict(set)
+    model = model or TransitionModel(edges)
 
-    for edge, nodes, _ in edges:
-        for node in nodes:
-            edges_[node.id].add(edge)
+    def inner(u: Node, v: Optional[Node] = None) -> Set[int]:
+        return model.E(u.id, v.id if v else None)
 
-    edges_ = dict(edges_)
+    return inner
 
-    def inner(u: Node, v: Optional[Node] = None) -> Set[int]:
-        if v:
-            return edges_[u.id] & edges_[v.id]
 
-        return edges_[u.id]
+def omega(edges: Iterable[HyperEdge], model: Optional[TransitionModel] = None) -> Callable[[HyperEdge], float]:
+    """
+    Weight of hyperedge e, from the model.
+
+    .. math:: \omega(e)
+    """
+    model = model or TransitionModel(edges)
+
+    def inner(e: HyperEdge) -> float:
+        return float(model.omega[model.edge_index[e.id]])
 
     return inner
 
 
-def d(edges: Iterable[HyperEdge]) -> Callable[[Node], float]:
+def d(edges: Iterable[HyperEdge], model: Optional[TransitionModel] = None) -> Callable[[Node], float]:
     """
     Degree of vertex v.
 
     .. math:: d(v) = \sum_{e \in E(v)} \omega(e)
     """
-    E_ = E(edges)
+    model = model or TransitionModel(edges)
 
     def inner(v: Node) -> float:
-        return sum(omega for edge, _, omega in edges
-                   if edge in E_(v))
+        return model.d_of(v.id)
 
     return inner
 
 
-def delta(weights: Iterable[Gamma]) -> Callable[[HyperEdge], float]:
+def delta(weights: Iterable[Gamma], model: Optional[TransitionModel] = None) -> Callable[[HyperEdge], float]:
     """
     Degree of hyperedge e.
 
     .. math:: \delta(e) \sum_{v \in e} \gamma_e(v)
     """
-    delta_ = defaultdict(float)
-
-    for edge, _, gamma in weights:
-        delta_[edge] += gamma
-
-    delta_ = dict(delta_)
+    model = model or TransitionModel(weights=weights)
 
     def inner(e: HyperEdge) -> float:
-        return delta_[e.id]
+        return model.delta_of(e.id)
 
     return inner
 
 
-def gamma(weights: Iterable[Gamma]) -> Callable[[HyperEdge, Node], float]:
+def gamma(weights: Iterable[Gamma], model: Optional[TransitionModel] = None) -> Callable[[HyperEdge, Node], float]:
     """
     Edge-(in)dependent vertex weight.
 
     .. math:: \gamma_e(v)
     """
-    gamma_ = {(edge, node.id): gamma_
-              for edge, node, gamma_ in weights}
+    model = model or TransitionModel(weights=weights)
 
     def inner(e: HyperEdge, v: Node) -> float:
-        return gamma_[e.id, v.id]
+        return model.gamma_of(e.id, v.id)
 
     return inner
 
 
-def pi(edges: Iterable[HyperEdge], weights: Iterable[Gamma]):
-    E_ = E(edges)
-    gamma_ = gamma(weights)
-    edges_ = {edge.id: edge for edge in edges}
+def pi(edges: Iterable[HyperEdge], weights: Iterable[Gamma], model: Optional[TransitionModel] = None):
+    model = model or TransitionModel(edges, weights)
 
     def inner(u: Node) -> float:
-        E_u = {edges_[edge_id] for edge_id in E_(u)}
-
-        return sum(e.omega * gamma_(e, u)
-                   for e in E_u)
+        return model.pi_of(u.id)
 
     return inner
 
 
-def pi_alpha(weights: Iterable[Gamma]) -> Callable[[HyperEdge, Node], float]:
-    gamma_ = gamma(weights)
+def pi_alpha(weights: Iterable[Gamma], model: Optional[TransitionModel] = None) -> Callable[[HyperEdge, Node], float]:
+    model = model or TransitionModel(weights=weights)
 
     def inner(e: HyperEdge, u: Node) -> float:
         if u not in e.nodes:
             return 0.0
 
-        return e.omega * gamma_(e, u)
+        return e.omega * model.gamma_of(e.id, u.id)
 
     return inner
 
 
-def P(edges: Iterable[HyperEdge], weights: Iterable[Gamma]) -> Callable[[Node, Node, bool], float]:
+def P(edges: Iterable[HyperEdge],
+      weights: Iterable[Gamma],
+      model: Optional[TransitionModel] = None) -> Callable[[Node, Node, bool], float]:
     print("[transition] pre-calculating probabilities...")
-    gamma_ = gamma(weights)
-    delta_ = delta(weights)
-    d_ = d(edges)
-    E_ = E(edges)
-    edges_ = {edge.id: edge for edge in edges}
+    model = model or TransitionModel(edges, weights)
 
     def inner(u: Node, v: Node, self_links: bool = False) -> float:
-        E_u_v = (edges_[edge_id] for edge_id in E_(u, v))
+        P_uv = 0.0
 
-        delta_e = lambda e: delta_(e) if self_links else delta_(e) - gamma_(e, u)
+        for e in model.E(u.id, v.id):
+            delta_e = model.delta_of(e) if self_links else model.delta_of(e) - model.gamma_of(e, u.id)
+            P_uv += model.omega[model.edge_index[e]] / model.d_of(u.id) * model.gamma_of(e, v.id) / delta_e
 
-        return sum(e.omega / d_(u) * gamma_(e, v) / delta_e(e)
-                   for e in E_u_v)
+        return float(P_uv)
 
     return inner
 
 
-def w(edges: Iterable[HyperEdge], weights: Iterable[Gamma]) -> Callable[[Node, Node, bool], float]:
+def w(edges: Iterable[HyperEdge],
+      weights: Iterable[Gamma],
+      model: Optional[TransitionModel] = None) -> Callable[[Node, Node, bool], float]:
     """
     Weight for going between vertex u to v in a unipartite representation
     of a hypergraph with edge-independent vertex weights.
@@ -137,17 +637,15 @@ def w(edges: Iterable[HyperEdge], weights: Iterable[Gamma]) -> Callable[[Node, N
         w_{u,v} = \sum_{e \in E(u,v) } \frac{ \omega(e) \gamma(u) \gamma(v) }{ \delta(e) }
     """
     print("[transition] pre-calculating probabilities...")
-    gamma_ = gamma(weights)
-    delta_ = delta(weights)
-    E_ = E(edges)
-    edges_ = {edge.id: edge for edge in edges}
+    model = model or TransitionModel(edges, weights)
 
     def inner(u: Node, v: Node, self_links: bool = False) -> float:
-        E_u_v = (edges_[edge_id] for edge_id in E_(u, v))
+        w_uv = 0.0
 
-        delta_e = lambda e: delta_(e) if self_links else delta_(e) - gamma_(e, u)
+        for e in model.E(u.id, v.id):
+            delta_e = model.delta_of(e) if self_links else model.delta_of(e) - model.gamma_of(e, u.id)
+            w_uv += model.omega[model.edge_index[e]] * model.gamma_of(e, u.id) * model.gamma_of(e, v.id) / delta_e
 
-        return sum(e.omega * gamma_(e, u) * gamma_(e, v) / delta_e(e)
-                   for e in E_u_v)
+        return float(w_uv)
 
     return inner